@@ -1,35 +1,105 @@
 import os
 from flask import Flask, request, render_template, flash, redirect, url_for, session, jsonify
 from google.cloud import storage
+from google.api_core import exceptions
 from werkzeug.utils import secure_filename
 from dotenv import load_dotenv
-from google.api_core import exceptions
 import uuid
 from datetime import datetime, timedelta
 import base64
+import gzip
+import hashlib
 import json
+import threading
 from user_auth import UserAuth
+from password_hashing import PasswordHasher
+import complaint_store
+from signed_url_cache import SignedUrlCache
+from map_snapshot import MapSnapshot
+import geo_grid
+import time
+from similarity_index import SimilarityIndex
+from submission_queue import SubmissionQueue
+import session_store
 from functools import wraps
 
 # Load environment variables
 load_dotenv()
 
 app = Flask(__name__)
-# Generate a secure random secret key
-app.secret_key = os.environ.get('SECRET_KEY', os.urandom(24))
+# Local state (sessions, similarity index, submission queue) lives next to
+# the app, not in whatever directory it was started from
+DATA_DIR = os.getenv('APP_DATA_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data'))
+# Signs the session cookie, so it must be the same in every worker: taken
+# from SECRET_KEY, or else generated once and kept in SECRET_KEY_FILE
+app.config['SECRET_KEY_FILE'] = os.getenv('SECRET_KEY_FILE', os.path.join(DATA_DIR, 'secret_key'))
+app.secret_key = os.environ.get('SECRET_KEY') or session_store.load_secret_key(app.config['SECRET_KEY_FILE'])
 
-# Session configuration
-app.config['SESSION_TYPE'] = 'filesystem'
+# Session configuration: session data (including the cached user profile) is
+# kept server side in SESSION_TYPE 'filesystem' or 'memory'; the cookie only
+# holds a signed session id
+app.config['SESSION_TYPE'] = os.getenv('SESSION_TYPE', 'filesystem')
+app.config['SESSION_FILE_DIR'] = os.getenv('SESSION_FILE_DIR', os.path.join(DATA_DIR, 'sessions'))
+app.config['SESSION_MEMORY_SIZE'] = int(os.getenv('SESSION_MEMORY_SIZE', 10000))
 app.config['SESSION_PERMANENT'] = False
 app.config['SESSION_USE_SIGNER'] = True
 app.config['PERMANENT_SESSION_LIFETIME'] = timedelta(hours=1)
+app.session_interface = session_store.create_session_interface(app.config)
+
+# Complaints rendered per dashboard page (and default page size of /complaints)
+app.config['DASHBOARD_PAGE_SIZE'] = int(os.getenv('DASHBOARD_PAGE_SIZE', 20))
+app.config['MAX_PAGE_SIZE'] = 100
+
+# Number of complaints loaded from storage in parallel per request
+app.config['COMPLAINT_LOADER_WORKERS'] = int(os.getenv('COMPLAINT_LOADER_WORKERS', complaint_store.DEFAULT_LOADER_WORKERS))
+
+# Maximum number of signed photo URLs kept in memory
+app.config['PHOTO_URL_CACHE_SIZE'] = int(os.getenv('PHOTO_URL_CACHE_SIZE', 4096))
+
+# On-disk text similarity index, and how often workers pick up complaints
+# filed elsewhere (e.g. by other workers) and persist their own additions
+app.config['SIMILARITY_INDEX_PATH'] = os.getenv('SIMILARITY_INDEX_PATH', os.path.join(DATA_DIR, 'similarity_index'))
+app.config['SIMILARITY_SYNC_SECONDS'] = int(os.getenv('SIMILARITY_SYNC_SECONDS', 60))
+app.config['SIMILAR_COMPLAINTS_LIMIT'] = 5
+
+# Local write-ahead queue for submissions and the number of background
+# threads uploading them to storage
+app.config['SUBMISSION_QUEUE_DIR'] = os.getenv('SUBMISSION_QUEUE_DIR', os.path.join(DATA_DIR, 'submission_queue'))
+app.config['SUBMISSION_UPLOAD_WORKERS'] = int(os.getenv('SUBMISSION_UPLOAD_WORKERS', 4))
+
+# Account records cached in memory: seconds a cached record is used before
+# its generation is rechecked, and how many records are kept
+app.config['USER_CACHE_MAX_STALENESS'] = float(os.getenv('USER_CACHE_MAX_STALENESS', 30))
+app.config['USER_CACHE_SIZE'] = int(os.getenv('USER_CACHE_SIZE', 10000))
+
+# Password hashing: KDF scheme (pbkdf2_sha256 or scrypt), its cost (0 for the
+# scheme's default) and the pool that runs it off the request threads
+app.config['PASSWORD_HASH_SCHEME'] = os.getenv('PASSWORD_HASH_SCHEME', 'pbkdf2_sha256')
+app.config['PASSWORD_HASH_COST'] = int(os.getenv('PASSWORD_HASH_COST', 0))
+app.config['PASSWORD_HASH_WORKERS'] = int(os.getenv('PASSWORD_HASH_WORKERS', os.cpu_count() or 4))
+app.config['PASSWORD_HASH_PROCESSES'] = os.getenv('PASSWORD_HASH_PROCESSES', '').lower() in ('1', 'true', 'yes')
 
 # Configure Google Cloud Storage
 try:
     storage_client = storage.Client.from_service_account_json('optical-net-452113-n9-064952459436.json')
     bucket_name = os.getenv('BUCKET_NAME', 'mastertest_1')
     bucket = storage_client.bucket(bucket_name)
-    user_auth = UserAuth(storage_client, bucket_name)
+    user_auth = UserAuth(
+        storage_client, bucket_name,
+        cache_max_staleness=app.config['USER_CACHE_MAX_STALENESS'],
+        cache_size=app.config['USER_CACHE_SIZE'],
+        password_hasher=PasswordHasher(
+            app.config['PASSWORD_HASH_SCHEME'],
+            app.config['PASSWORD_HASH_COST'] or None,
+            workers=app.config['PASSWORD_HASH_WORKERS'],
+            use_processes=app.config['PASSWORD_HASH_PROCESSES']
+        )
+    )
+    if user_auth.legacy_pending:
+        # Split users.json into per-user accounts while serving; until it is done
+        # accounts not copied yet are still found in users.json
+        threading.Thread(target=user_auth.migrate_legacy_users, daemon=True).start()
+    photo_urls = SignedUrlCache(bucket, max_size=app.config['PHOTO_URL_CACHE_SIZE'])
 except Exception as e:
     print(f"Error initializing Google Cloud Storage: {str(e)}")
     raise
@@ -41,107 +111,194 @@ ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
 if not os.path.exists(UPLOAD_FOLDER):
     os.makedirs(UPLOAD_FOLDER)
 
+# Photos are streamed to storage from the multipart upload; anything larger
+# is rejected, and whole requests beyond the limit are refused by Flask
+MAX_PHOTO_BYTES = int(os.getenv('MAX_PHOTO_BYTES', 5 * 1024 * 1024))
+app.config['MAX_CONTENT_LENGTH'] = MAX_PHOTO_BYTES + 1024 * 1024
+
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+@app.errorhandler(413)
+def request_too_large(e):
+    flash(f'Upload too large. Photos must be at most {MAX_PHOTO_BYTES // (1024 * 1024)}MB')
+    return redirect(url_for('submit_complaint'))
+
 def generate_unique_folder_name():
     timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
     unique_id = str(uuid.uuid4())[:8]
     return f"complaint_{timestamp}_{unique_id}"
 
-def get_user_complaints(username):
-    complaints = []
-    blobs = bucket.list_blobs(prefix='complaint_')
+def get_user_complaint_entries(username):
+    """Return the user's index entries, newest first, using the per-user index."""
+    entries = complaint_store.load_user_index(bucket, username)
+    if entries is None and complaint_store.user_index_backfilled(bucket):
+        entries = []
+    elif entries is None:
+        # No index yet (user predates the index): build it once from a full
+        # scan, unless a concurrent submission created it in the meantime
+        print(f"No complaint index for {username}, rebuilding from bucket scan")
+        entries = complaint_store.scan_user_indexes(bucket, username).get(username, [])
+        try:
+            complaint_store.save_user_index(bucket, username, entries, if_generation_match=0)
+        except exceptions.PreconditionFailed:
+            entries = complaint_store.load_user_index(bucket, username) or []
+    # Submissions still waiting in the upload queue are not in the index yet
+    indexed = {entry['id'] for entry in entries}
+    for queued in submission_queue.pending(username):
+        if queued['folder'] not in indexed:
+            metadata = queued['record']['metadata']
+            entries.append({'id': queued['folder'], 'timestamp': metadata.get('timestamp'),
+                            'status': metadata.get('status', 'pending')})
+    entries.sort(key=complaint_sort_key, reverse=True)
+    return entries
+
+def complaint_sort_key(complaint):
+    return (complaint.get('timestamp') or '', complaint['id'])
+
+def encode_cursor(entry):
+    """Opaque pagination cursor pointing just after ``entry``."""
+    return base64.urlsafe_b64encode(json.dumps(complaint_sort_key(entry)).encode('utf-8')).decode('ascii')
+
+def decode_cursor(cursor):
+    try:
+        timestamp, complaint_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        return (timestamp, complaint_id)
+    except Exception:
+        raise ValueError('Invalid cursor')
+
+def load_complaint(folder_name, username, detail=True):
+    """Load a single complaint folder for the dashboard.
+
+    The summary (``detail=False``) has what a complaint card shows; the
+    detail view adds department, status history and similar complaints.
+    """
+    # One GET for the consolidated record (legacy folders fall back to separate blobs);
+    # submissions still in the upload queue are read from their local copy
+    queued_record = submission_queue.get_record(folder_name)
+    record = queued_record or complaint_store.load_complaint_record(bucket, folder_name)
+    metadata = record['metadata']
+    if not metadata or metadata.get('user') != username:
+        return None
     
-    for blob in blobs:
-        if blob.name.endswith('metadata.json'):
-            try:
-                metadata = json.loads(blob.download_as_string())
-                if metadata.get('user') == username:
-                    # Get the folder name from the blob path
-                    folder_name = blob.name.rsplit('/', 1)[0]
-                    
-                    # Get complaint text if available
-                    text_content = None
-                    text_blob = bucket.blob(f'{folder_name}/complaint.txt')
-                    if text_blob.exists():
-                        text_content = text_blob.download_as_string().decode('utf-8')
-                    
-                    # Get photo URL if available
-                    photo_url = None
-                    photo_blob = bucket.blob(f'{folder_name}/photo.jpg')
-                    if photo_blob.exists():
-                        photo_url = photo_blob.generate_signed_url(
-                            version="v4",
-                            expiration=datetime.now() + timedelta(hours=1),
-                            method="GET"
-                        )
-                    
-                    # Get location if available
-                    location = None
-                    location_blob = bucket.blob(f'{folder_name}/location.json')
-                    if location_blob.exists():
-                        location = json.loads(location_blob.download_as_string())
-                    
-                    # Get department information if available
-                    department_info = None
-                    department_blob = bucket.blob(f'{folder_name}/department.json')
-                    if department_blob.exists():
-                        department_info = json.loads(department_blob.download_as_string())
-                    
-                    # Get status history if available
-                    status_history = None
-                    history_blob = bucket.blob(f'{folder_name}/status_history.json')
-                    if history_blob.exists():
-                        status_history = json.loads(history_blob.download_as_string())
-                    
-                    # Get similar complaints
-                    similar_complaints = []
-                    if text_content:
-                        # This is a simplified version - in a real system, you'd use NLP or ML to find similar complaints
-                        similar_complaints = find_similar_complaints(text_content, username)
-                    
-                    complaints.append({
-                        'id': folder_name,
-                        'text': text_content,
-                        'photo_url': photo_url,
-                        'location': location,
-                        'timestamp': metadata.get('timestamp'),
-                        'status': metadata.get('status', 'pending'),
-                        'department': department_info.get('name') if department_info else None,
-                        'department_contact': department_info.get('contact') if department_info else None,
-                        'expected_resolution': department_info.get('resolution_time') if department_info else None,
-                        'status_history': status_history,
-                        'similar_complaints': similar_complaints
-                    })
-            except Exception as e:
-                print(f"Error processing complaint {blob.name}: {str(e)}")
-                continue
+    text_content = record['text']
+    location = record['location']
+    department_info = record['department']
+    status_history = record['status_history']
     
-    # Sort complaints by timestamp in descending order
-    complaints.sort(key=lambda x: x['timestamp'], reverse=True)
+    # Get photo URL if available; submit_complaint records has_photo, so there is
+    # no need to probe the blob, and signed URLs are reused across page views
+    photo_url = None
+    if metadata.get('has_photo') and not queued_record:
+        photo_url = photo_urls.get(f'{folder_name}/photo.jpg')
+    
+    complaint = {
+        'id': folder_name,
+        'text': text_content,
+        'photo_url': photo_url,
+        'location': location,
+        'timestamp': metadata.get('timestamp'),
+        'status': metadata.get('status', 'pending')
+    }
+    if not detail:
+        return complaint
+    
+    # Get similar complaints
+    similar_complaints = []
+    if text_content:
+        similar_complaints = find_similar_complaints(text_content, username, folder_name)
+    
+    complaint.update({
+        'department': department_info.get('name') if department_info else None,
+        'department_contact': department_info.get('contact') if department_info else None,
+        'expected_resolution': department_info.get('resolution_time') if department_info else None,
+        'status_history': status_history,
+        'similar_complaints': similar_complaints
+    })
+    return complaint
+
+def sort_complaints(complaints):
+    """Sort complaints newest first, breaking timestamp ties by id so the order is stable."""
+    complaints.sort(key=complaint_sort_key, reverse=True)
     return complaints
 
-def find_similar_complaints(text, username):
+def get_user_complaints(username, cursor=None, limit=None, detail=False, entries=None):
+    """Return one page of a user's complaints (newest first) and the cursor of the next page.
+
+    Only the complaints on the requested page are loaded from storage.
+    ``entries`` may pass in index entries the caller has already loaded.
+    """
+    if entries is None:
+        entries = get_user_complaint_entries(username)
+    if cursor:
+        after = decode_cursor(cursor)
+        entries = [entry for entry in entries if complaint_sort_key(entry) < after]
+    page = entries[:limit] if limit else entries
+    next_cursor = encode_cursor(page[-1]) if limit and len(entries) > limit else None
+    
+    # Load the page's complaints in parallel; a failing complaint is skipped
+    complaints = complaint_store.load_concurrently(
+        [entry['id'] for entry in page],
+        lambda folder_name: load_complaint(folder_name, username, detail),
+        app.config['COMPLAINT_LOADER_WORKERS']
+    )
+    
+    # Sort complaints by timestamp in descending order
+    return sort_complaints(complaints), next_cursor
+
+def get_user_complaint_stats(entries):
+    """Complaint counts for the dashboard header, taken from the index alone."""
+    return {
+        'total': len(entries),
+        'resolved': sum(1 for entry in entries if entry.get('status') == 'resolved')
+    }
+
+similarity_index = SimilarityIndex.load(app.config['SIMILARITY_INDEX_PATH'])
+similarity_sync = {'last': 0, 'running': False}
+similarity_sync_lock = threading.Lock()
+
+def load_similarity_text(folder_name):
+    record = complaint_store.load_complaint_record(bucket, folder_name, ('metadata', 'text'))
+    if not record['text']:
+        return None
+    return record['text'], (record['metadata'] or {}).get('user')
+
+def sync_similarity_index():
+    try:
+        added = similarity_index.sync(bucket, load_similarity_text)
+        if added:
+            print(f"Added {added} complaints to the similarity index")
+        if similarity_index.dirty:
+            similarity_index.save(app.config['SIMILARITY_INDEX_PATH'])
+    except Exception as e:
+        print(f"Error syncing similarity index: {str(e)}")
+    finally:
+        with similarity_sync_lock:
+            similarity_sync['running'] = False
+            similarity_sync['last'] = time.monotonic()
+
+def schedule_similarity_sync():
+    """Start a background sync of the similarity index if the last one is old enough."""
+    with similarity_sync_lock:
+        if similarity_sync['running'] or time.monotonic() - similarity_sync['last'] < app.config['SIMILARITY_SYNC_SECONDS']:
+            return
+        similarity_sync['running'] = True
+    threading.Thread(target=sync_similarity_index, daemon=True).start()
+
+def find_similar_complaints(text, username, complaint_id=None):
     """Find similar complaints based on text similarity"""
-    # This is a placeholder function - in a real system, you'd use NLP or ML
-    # to find similar complaints based on text content
+    schedule_similarity_sync()
+    # Other users' complaint text is not shown, only that a similar complaint exists
+    matches = similarity_index.query(text, k=app.config['SIMILAR_COMPLAINTS_LIMIT'], exclude_id=complaint_id,
+                                     viewer=username)
     return [
         {
-            'id': 'C001',
-            'similarity': 85,
-            'text': 'Similar complaint about infrastructure'
-        },
-        {
-            'id': 'C002',
-            'similarity': 72,
-            'text': 'Related issue in same area'
-        },
-        {
-            'id': 'C003',
-            'similarity': 65,
-            'text': 'Similar type of complaint'
+            'id': match_id,
+            'similarity': int(round(score * 100)),
+            'text': snippet,
+            'own': snippet is not None
         }
+        for match_id, score, snippet in matches
     ]
 
 def login_required(f):
@@ -172,7 +329,13 @@ def login():
         try:
             success, message = user_auth.login_user(username, password)
             if success:
+                # Start from a fresh session id, so one planted before login is
+                # not carried over, and cache the profile for the session's
+                # lifetime so page views don't go back to the user store
+                session.clear()
+                session.regenerate()
                 session['username'] = username
+                session['user_info'] = user_auth.get_user_info(username)
                 flash(message)
                 return redirect(url_for('dashboard'))
             else:
@@ -193,12 +356,20 @@ def register():
         success, message = user_auth.register_user(username, password, email)
         flash(message)
         if success:
+            # Start the user off with an empty index so their first dashboard
+            # load and submission never fall back to a bucket scan
+            try:
+                complaint_store.create_user_index(bucket, username)
+            except Exception as e:
+                print(f"Error creating complaint index for {username}: {str(e)}")
             return redirect(url_for('login'))
     return render_template('register.html')
 
 @app.route('/logout')
 def logout():
-    session.pop('username', None)
+    # Drop everything, and move to a new id so the stored session is deleted
+    session.clear()
+    session.regenerate()
     flash('Logged out successfully')
     return redirect(url_for('login'))
 
@@ -213,27 +384,65 @@ def dashboard():
         username = session['username']
         print(f"Loading dashboard for user: {username}")
         
-        user_info = user_auth.get_user_info(username)
+        user_info = session.get('user_info')
         if not user_info:
-            flash('User information not found. Please login again.')
-            session.pop('username', None)
-            return redirect(url_for('login'))
+            user_info = user_auth.get_user_info(username)
+            if not user_info:
+                flash('User information not found. Please login again.')
+                session.pop('username', None)
+                return redirect(url_for('login'))
+            session['user_info'] = user_info
         
-        complaints = get_user_complaints(username)
-        print(f"Found {len(complaints)} complaints for user: {username}")
+        cursor = request.args.get('cursor')
+        entries = get_user_complaint_entries(username)
+        try:
+            complaints, next_cursor = get_user_complaints(
+                username, cursor, app.config['DASHBOARD_PAGE_SIZE'], entries=entries
+            )
+        except ValueError:
+            return redirect(url_for('dashboard'))
+        stats = get_user_complaint_stats(entries)
+        print(f"Found {stats['total']} complaints for user: {username}, showing {len(complaints)}")
         
-        return render_template('dashboard.html', user_info=user_info, complaints=complaints)
+        return render_template('dashboard.html', user_info=user_info, complaints=complaints,
+                               stats=stats, cursor=cursor, next_cursor=next_cursor)
     except Exception as e:
         flash(f'Error loading dashboard: {str(e)}')
         print(f"Dashboard error: {str(e)}")
         return redirect(url_for('login'))
 
+@app.route('/complaints')
+@login_required
+def list_complaints():
+    """Paginated JSON listing of the current user's complaints."""
+    try:
+        limit = min(int(request.args.get('limit', app.config['DASHBOARD_PAGE_SIZE'])), app.config['MAX_PAGE_SIZE'])
+        if limit < 1:
+            raise ValueError('limit must be positive')
+        complaints, next_cursor = get_user_complaints(session['username'], request.args.get('cursor'), limit)
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    return jsonify({'complaints': complaints, 'next_cursor': next_cursor})
+
+@app.route('/complaints/<complaint_id>')
+@login_required
+def complaint_detail(complaint_id):
+    """Full details of one complaint, loaded when the user opens it."""
+    try:
+        complaint = load_complaint(complaint_id, session['username'], detail=True)
+    except Exception as e:
+        print(f"Error loading complaint {complaint_id}: {str(e)}")
+        return jsonify({'success': False, 'message': f'Error loading complaint: {str(e)}'}), 500
+    if complaint is None:
+        return jsonify({'success': False, 'message': 'Complaint not found'}), 404
+    return jsonify(complaint)
+
 @app.route('/submit_complaint', methods=['GET', 'POST'])
 @login_required
 def submit_complaint():
     if request.method == 'POST':
         try:
-            if 'text' not in request.form and 'photo' not in request.form:
+            if 'text' not in request.form and 'photo' not in request.files:
                 flash('Please provide complaint details')
                 return redirect(request.url)
             
@@ -247,66 +456,66 @@ def submit_complaint():
                 'status': 'pending'
             }
             
-            # Handle text upload
+            # Handle text
+            text_content = None
             if 'text' in request.form:
                 text_content = request.form['text']
                 if text_content:
-                    try:
-                        text_blob = bucket.blob(f'{folder_name}/complaint.txt')
-                        text_blob.upload_from_string(text_content)
-                        complaint_data['has_text'] = True
-                    except exceptions.Forbidden as e:
-                        flash(f'Error uploading complaint text: {str(e)}')
-                        return redirect(request.url)
+                    complaint_data['has_text'] = True
             
-            # Handle photo upload
-            if 'photo' in request.form and request.form['photo']:
-                try:
-                    photo_data = request.form['photo'].split(',')[1]
-                    photo_bytes = base64.b64decode(photo_data)
-                    photo_blob = bucket.blob(f'{folder_name}/photo.jpg')
-                    photo_blob.upload_from_string(photo_bytes, content_type='image/jpeg')
-                    complaint_data['has_photo'] = True
-                except exceptions.Forbidden as e:
-                    flash(f'Error uploading photo: {str(e)}')
+            # Handle photo, streamed from the multipart file without decoding it in memory
+            photo_file = request.files.get('photo')
+            photo_stream = None
+            if photo_file and photo_file.filename:
+                if not allowed_file(photo_file.filename):
+                    flash('Photo must be a PNG, JPEG or GIF image')
+                    return redirect(request.url)
+                photo_size = complaint_store.stream_size(photo_file.stream)
+                if photo_size > MAX_PHOTO_BYTES:
+                    flash(f'Photo is too large. Maximum file size is {MAX_PHOTO_BYTES // (1024 * 1024)}MB')
                     return redirect(request.url)
+                if photo_size:
+                    photo_stream = photo_file.stream
+                    complaint_data['has_photo'] = True
             
-            # Handle location upload
+            # Handle location data
+            location = None
             if 'location' in request.form and request.form['location']:
                 try:
                     location_data = json.loads(request.form['location'])
                     if 'latitude' in location_data and 'longitude' in location_data:
-                        location_blob = bucket.blob(f'{folder_name}/location.json')
-                        location_blob.upload_from_string(
-                            json.dumps({
-                                'latitude': float(location_data['latitude']),
-                                'longitude': float(location_data['longitude'])
-                            }),
-                            content_type='application/json'
-                        )
+                        location = {
+                            'latitude': float(location_data['latitude']),
+                            'longitude': float(location_data['longitude'])
+                        }
                         complaint_data['has_location'] = True
-                except (json.JSONDecodeError, ValueError, exceptions.Forbidden) as e:
-                    flash(f'Error uploading location data: {str(e)}')
+                except (json.JSONDecodeError, ValueError) as e:
+                    flash(f'Error reading location data: {str(e)}')
                     return redirect(request.url)
             
-            # Save complaint metadata
-            metadata_blob = bucket.blob(f'{folder_name}/metadata.json')
-            metadata_blob.upload_from_string(
-                json.dumps(complaint_data),
-                content_type='application/json'
-            )
-            
-            # Save meta.json file for compatibility with the Cloud Function
+            # Build the consolidated complaint record (metadata, meta, text and
+            # location) and hand it to the write-ahead queue. The request returns
+            # as soon as it is on local disk; the uploader threads write the
+            # record, complaint.txt and photo.jpg to storage and update the index.
             meta = {
                 'timestamp': datetime.now().isoformat()
             }
-            meta_blob = bucket.blob(f'{folder_name}/meta.json')
-            meta_blob.upload_from_string(
-                json.dumps(meta),
-                content_type='application/json'
+            record = complaint_store.build_complaint_record(
+                complaint_data,
+                meta=meta,
+                text=text_content if complaint_data.get('has_text') else None,
+                location=location
             )
+            submission_queue.submit(
+                folder_name, session['username'], record,
+                photo_stream, (photo_file.mimetype or 'image/jpeg') if photo_stream else None
+            )
+            if text_content:
+                similarity_index.add(folder_name, text_content, session['username'])
             
-            flash('Complaint submitted successfully')
+            if request.accept_mimetypes.best == 'application/json':
+                return jsonify({'success': True, 'complaint_id': folder_name}), 202
+            flash(f'Complaint {folder_name} submitted successfully')
             return redirect(url_for('dashboard'))
             
         except Exception as e:
@@ -319,13 +528,16 @@ def submit_complaint():
 @login_required
 def withdraw_complaint(complaint_id):
     try:
-        # Get the metadata blob
-        metadata_blob = bucket.blob(f'{complaint_id}/metadata.json')
-        if not metadata_blob.exists():
+        # Load the complaint record (bundle, or legacy blobs for older complaints)
+        if submission_queue.get_record(complaint_id):
+            return jsonify({
+                'success': False,
+                'message': 'Complaint is still being submitted, please try again shortly'
+            }), 409
+        record = complaint_store.load_complaint_record(bucket, complaint_id)
+        metadata = record['metadata']
+        if not metadata:
             return jsonify({'success': False, 'message': 'Complaint not found'}), 404
-
-        # Download and update metadata
-        metadata = json.loads(metadata_blob.download_as_string())
         
         # Check if the complaint belongs to the current user
         if metadata.get('user') != session['username']:
@@ -336,18 +548,8 @@ def withdraw_complaint(complaint_id):
         metadata['withdrawn_at'] = datetime.now().isoformat()
         metadata['withdrawn_by'] = session['username']
 
-        # Save updated metadata
-        metadata_blob.upload_from_string(
-            json.dumps(metadata),
-            content_type='application/json'
-        )
-
         # Create or update status history
-        history_blob = bucket.blob(f'{complaint_id}/status_history.json')
-        status_history = []
-        if history_blob.exists():
-            status_history = json.loads(history_blob.download_as_string())
-        
+        status_history = record['status_history'] or []
         status_history.append({
             'status': 'withdrawn',
             'timestamp': datetime.now().isoformat(),
@@ -355,11 +557,17 @@ def withdraw_complaint(complaint_id):
             'by': session['username'],
             'notes': 'Complaint withdrawn by user for review'
         })
+        record['status_history'] = status_history
 
-        history_blob.upload_from_string(
-            json.dumps(status_history),
-            content_type='application/json'
-        )
+        # Save the updated record; legacy complaints are converted to a bundle here
+        complaint_store.save_complaint_record(bucket, complaint_id, record)
+        # Logged after the save so the warehouse sync never applies a status
+        # that was not stored; a failed log write fails the request and the
+        # user's retry logs it again
+        complaint_store.record_status_change(bucket, complaint_id, 'withdrawn', session['username'])
+
+        complaint_store.update_user_index(bucket, session['username'], complaint_id, metadata)
+        map_snapshot.mark_stale()
 
         return jsonify({
             'success': True,
@@ -373,46 +581,154 @@ def withdraw_complaint(complaint_id):
             'message': f'Error withdrawing complaint: {str(e)}'
         }), 500
 
+# Map points from the last snapshot scan, keyed by folder, together with the
+# generations of the files they were read from so unchanged folders are reused
+map_point_cache = {}
+
+# Files a map point is read from; the newest of their generations is its version
+MAP_POINT_FILES = (complaint_store.BUNDLE_FILE, 'metadata.json', 'location.json')
+
+def load_map_point(folder_name, inventory):
+    """Load the map point of one complaint folder, or None if it has no location."""
+    record = complaint_store.load_complaint_record(
+        bucket, folder_name, ('metadata', 'location'), inventory
+    )
+    metadata = record['metadata']
+    if not metadata:
+        return None
+    
+    # Get location data
+    location_data = record['location']
+    if not location_data or 'latitude' not in location_data or 'longitude' not in location_data:
+        return None
+    timestamp = metadata.get('timestamp') or ''
+    point = {
+        'id': folder_name,
+        'location': {
+            'latitude': float(location_data['latitude']),
+            'longitude': float(location_data['longitude'])
+        },
+        'status': metadata.get('status', 'pending'),
+        'timestamp': metadata.get('timestamp'),
+        'changed_at': max(timestamp, metadata.get('withdrawn_at') or ''),
+        'version': max(inventory.get(file_name) or 0 for file_name in MAP_POINT_FILES)
+    }
+    if metadata.get('priority'):
+        point['priority'] = metadata['priority']
+    return point
+
+def scan_map_points():
+    """Build the map points for every complaint, re-reading only folders that changed."""
+    folders = complaint_store.list_complaint_folders(bucket)
+    
+    def load(folder_name):
+        inventory = folders[folder_name]
+        versions = tuple(inventory.get(file_name) for file_name in MAP_POINT_FILES)
+        cached = map_point_cache.get(folder_name)
+        if cached is not None and cached[0] == versions:
+            return folder_name, cached
+        return folder_name, (versions, load_map_point(folder_name, inventory))
+    
+    loaded = complaint_store.load_concurrently(sorted(folders), load, app.config['COMPLAINT_LOADER_WORKERS'])
+    map_point_cache.clear()
+    map_point_cache.update(loaded)
+    points = [point for _, point in map_point_cache.values() if point is not None]
+    return sort_complaints(points)
+
+app.config['MAP_SNAPSHOT_REFRESH_SECONDS'] = int(os.getenv('MAP_SNAPSHOT_REFRESH_SECONDS', 60))
+map_snapshot = MapSnapshot(scan_map_points, app.config['MAP_SNAPSHOT_REFRESH_SECONDS'])
+
+def cached_json_response(body, etag, gzip_body=None):
+    """Build a JSON response that honours If-None-Match and Accept-Encoding: gzip."""
+    response = app.response_class(body, mimetype='application/json')
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    response.vary.add('Accept-Encoding')
+    response.make_conditional(request)
+    if response.status_code == 304:
+        return response
+    if request.accept_encodings['gzip']:
+        response.set_data(gzip_body if gzip_body is not None else gzip.compress(body))
+        response.headers['Content-Encoding'] = 'gzip'
+    return response
+
 @app.route('/get_all_complaints')
 def get_all_complaints():
     try:
-        # Get all complaints from the bucket
-        complaints = []
-        blobs = bucket.list_blobs(prefix='complaint_')
-        
-        for blob in blobs:
-            if blob.name.endswith('metadata.json'):
-                try:
-                    # Get the folder name from the blob path
-                    folder_name = blob.name.rsplit('/', 1)[0]
-                    
-                    # Get metadata
-                    metadata = json.loads(blob.download_as_text())
-                    if metadata.get('status') == 'withdrawn':
-                        continue
-                    
-                    # Get location data
-                    location_blob = bucket.blob(f'{folder_name}/location.json')
-                    if location_blob.exists():
-                        location_data = json.loads(location_blob.download_as_text())
-                        if 'latitude' in location_data and 'longitude' in location_data:
-                            complaints.append({
-                                'id': folder_name,
-                                'location': {
-                                    'latitude': float(location_data['latitude']),
-                                    'longitude': float(location_data['longitude'])
-                                },
-                                'status': metadata.get('status', 'pending'),
-                                'timestamp': metadata.get('timestamp')
-                            })
-                except Exception as e:
-                    print(f"Error processing complaint {blob.name}: {str(e)}")
-                    continue
+        # Served from the shared snapshot; it is rebuilt in the background when stale
+        snapshot = map_snapshot.current()
+        if snapshot.body is None:
+            return jsonify([])
         
-        return jsonify(complaints)
+        since = request.args.get('since')
+        if since:
+            # Only the points changed after the client's cursor, withdrawn and removed ones included
+            body = snapshot.delta(since)
+            response = cached_json_response(body, hashlib.sha1(body).hexdigest())
+        else:
+            response = cached_json_response(snapshot.body, snapshot.etag, snapshot.gzip_body)
+        response.headers['X-Snapshot-Cursor'] = snapshot.cursor
+        return response
     except Exception as e:
         print(f"Error fetching complaints: {str(e)}")
         return jsonify([])
 
+# Spatial grid over the current map snapshot, rebuilt when the snapshot changes
+geo_index = {'etag': None, 'grid': None}
+geo_index_lock = threading.Lock()
+
+def get_geo_grid(snapshot):
+    etag, points = snapshot.points()
+    with geo_index_lock:
+        if geo_index['etag'] != etag:
+            geo_index['grid'] = geo_grid.GeoGrid(points)
+            geo_index['etag'] = etag
+        return geo_index['grid']
+
+@app.route('/complaints/geo')
+def complaints_geo():
+    """Aggregated complaint counts per screen cell for the visible map viewport."""
+    try:
+        bbox = geo_grid.parse_bbox(request.args['bbox'])
+        zoom = int(request.args.get('zoom', 12))
+    except (KeyError, ValueError) as e:
+        return jsonify({'success': False, 'message': f'Invalid bbox or zoom: {str(e)}'}), 400
+    weight = request.args.get('weight', 'status')
+    if weight not in ('status', 'priority'):
+        return jsonify({'success': False, 'message': 'weight must be status or priority'}), 400
+    
+    try:
+        snapshot = map_snapshot.current()
+        if snapshot.body is None:
+            return jsonify({'zoom': zoom, 'cells': []})
+        
+        result = get_geo_grid(snapshot).query(bbox, zoom, weight)
+        body = json.dumps(result).encode('utf-8')
+        etag = hashlib.sha1(snapshot.etag.encode('utf-8') + request.query_string).hexdigest()
+        return cached_json_response(body, etag)
+    except Exception as e:
+        print(f"Error fetching complaint grid: {str(e)}")
+        return jsonify({'zoom': zoom, 'cells': []})
+
+# One lock per user so uploader threads finishing several submissions of the
+# same user update that user's index one at a time instead of racing on it
+user_index_locks = {}
+user_index_locks_lock = threading.Lock()
+
+def index_uploaded_submission(entry):
+    """Called by the upload queue once a submission's blobs are all in storage."""
+    with user_index_locks_lock:
+        lock = user_index_locks.setdefault(entry['user'], threading.Lock())
+    with lock:
+        complaint_store.update_user_index(bucket, entry['user'], entry['folder'], entry['record']['metadata'])
+    map_snapshot.mark_stale()
+
+submission_queue = SubmissionQueue(
+    bucket,
+    app.config['SUBMISSION_QUEUE_DIR'],
+    workers=app.config['SUBMISSION_UPLOAD_WORKERS'],
+    on_uploaded=index_uploaded_submission
+).start()
+
 if __name__ == '__main__':
     app.run(debug=True, port=5001) 
\ No newline at end of file
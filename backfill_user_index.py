@@ -0,0 +1,46 @@
+import os
+import argparse
+from google.cloud import storage
+import logging
+import complaint_store
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Set up Google Cloud clients
+storage_client = storage.Client.from_service_account_json('optical-net-452113-n9-064952459436.json')
+
+# Constants
+BUCKET_NAME = os.getenv('BUCKET_NAME', 'dataingestion_master')
+
+def backfill_user_index(username=None):
+    """Rebuild per-user complaint indexes from a full scan of the bucket."""
+    bucket = storage_client.bucket(BUCKET_NAME)
+    indexes = complaint_store.scan_user_indexes(bucket, username)
+    if username is not None:
+        # Make sure the user gets an (empty) index even if they have no complaints
+        indexes.setdefault(username, [])
+    logging.info(f"Found complaints for {len(indexes)} users")
+
+    written = 0
+    for user, entries in indexes.items():
+        try:
+            complaint_store.save_user_index(bucket, user, entries)
+            logging.info(f"Wrote index for {user} with {len(entries)} complaints")
+            written += 1
+        except Exception as e:
+            logging.error(f"Error writing index for {user}: {str(e)}")
+
+    logging.info(f"Rebuilt {written} user indexes")
+    if username is None and written == len(indexes):
+        # Every user with complaints now has an index, so the app can stop
+        # scanning the bucket for users without one
+        complaint_store.mark_user_index_backfilled(bucket)
+        logging.info("Marked the user index backfill complete")
+    return written
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild per-user complaint indexes")
+    parser.add_argument('--user', help="Only rebuild the index for this username")
+    args = parser.parse_args()
+    backfill_user_index(args.user)
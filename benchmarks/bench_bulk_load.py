@@ -0,0 +1,98 @@
+"""Streaming inserts versus file-staged bulk loads in process_complaints.py.
+
+Part one times BulkLoadSink on its own: rows shaped like the ETL's are
+written to gzipped newline-delimited JSON files and handed to a local
+loader, to show how long staging a large backfill takes. Part two runs
+process_complaints.main over an in-memory bucket in both modes against a
+fake BigQuery client and compares run time and BigQuery API calls.
+
+    python benchmarks/bench_bulk_load.py --rows 1000000 --folders 5000
+"""
+import argparse
+import contextlib
+import io
+import logging
+import os
+import tempfile
+import time
+from bench_incremental_etl import add_folders
+from datetime import datetime
+from fake_bigquery import FakeBigQueryClient, install_fake_bigquery
+from fake_gcs import FakeBucket, add_repo_to_path, install_fake_storage
+
+add_repo_to_path()
+
+ROW = {
+    'user_id': 'citizen', 'description': 'Pothole near the main road, about a metre wide',
+    'image_url': 'https://storage.googleapis.com/dataingestion_master/complaint_x/photo.jpg',
+    'latitude': 12.8, 'longitude': 80.0, 'location_text': 'Main Road', 'status': 'pending',
+    'submitted_at': '2025-01-01T00:00:00', 'issue_type': 'pothole', 'department': 'Road Maintenance Department',
+    'priority': 'High', 'dates_mentioned': '', 'image_detections': '[{"class": "pothole", "confidence": 0.91}]',
+    'text_analysis': '{"Issue Type": ["pothole"]}', 'processed_at': '2025-01-01T00:00:00', 'label': 'pothole'
+}
+
+
+def bench_sink(rows, file_mb):
+    from table.bulk_load import BulkLoadSink, LocalDirectoryLoader
+    with tempfile.TemporaryDirectory() as directory:
+        loaded = os.path.join(directory, 'loaded')
+        sink = BulkLoadSink(LocalDirectoryLoader(loaded), os.path.join(directory, 'staging'),
+                            max_file_bytes=file_mb * 1024 * 1024)
+        started = time.perf_counter()
+        for i in range(rows):
+            sink.add(i, dict(ROW, complaint_id=f'complaint_{i:08x}'))
+        failed = sink.close()
+        elapsed = time.perf_counter() - started
+        assert not failed
+        files = os.listdir(loaded)
+        size = sum(os.path.getsize(os.path.join(loaded, name)) for name in files)
+    print(f"BulkLoadSink: {rows} rows in {elapsed:.1f}s ({rows / elapsed:,.0f} rows/s), "
+          f"{len(files)} files, {size / 2 ** 20:.1f}MB compressed")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=1000000, help="Rows written in the sink-only test")
+    parser.add_argument('--file-mb', type=int, default=64, help="Uncompressed MB per staged file")
+    parser.add_argument('--folders', type=int, default=5000)
+    parser.add_argument('--latency', type=float, default=0.002, help="Seconds added to every storage call")
+    parser.add_argument('--bigquery-latency', type=float, default=0.5,
+                        help="Seconds added to every BigQuery call (streaming insert or load job)")
+    parser.add_argument('--workers', type=int, default=16)
+    args = parser.parse_args()
+
+    bench_sink(args.rows, args.file_mb)
+
+    bucket = FakeBucket()
+    bigquery_client = FakeBigQueryClient()
+    install_fake_storage(bucket)
+    install_fake_bigquery(bigquery_client)
+    import process_complaints
+
+    print(f"folders={args.folders} storage latency={args.latency * 1000:.0f}ms "
+          f"BigQuery latency={args.bigquery_latency * 1000:.0f}ms")
+    print(f"{'mode':>10} {'time_s':>8} {'bigquery_calls':>15}")
+    with tempfile.TemporaryDirectory() as directory:
+        process_complaints.BULK_LOAD_DIR = directory
+        for bulk in (False, True):
+            bucket.latency = bigquery_client.latency = 0
+            bucket._objects.clear()
+            add_folders(bucket, datetime(2024, 1, 1), args.folders, processed=False)
+            bucket.reset_stats()
+            bigquery_client.reset_stats()
+            bucket.latency = args.latency
+            bigquery_client.latency = args.bigquery_latency
+            logging.disable(logging.CRITICAL)
+            started = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                processed, failed = process_complaints.main(args.workers, full=True, bulk=bulk,
+                                                            max_file_bytes=args.file_mb * 1024 * 1024)
+            elapsed = time.perf_counter() - started
+            logging.disable(logging.NOTSET)
+            assert processed == len(bigquery_client.rows) == args.folders and not failed, (processed, failed)
+            mode = 'bulk' if bulk else 'streaming'
+            print(f"{mode:>10} {elapsed:>8.2f} {sum(bigquery_client.calls.values()):>15}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+"""Dashboard latency versus complaint count, serial versus parallel loading.
+
+Runs app.get_user_complaints (every complaint, and the first dashboard
+page) and the /get_all_complaints snapshot scan against an in-memory
+bucket that adds a fixed latency to every storage call.
+
+    python benchmarks/bench_dashboard_loader.py --latency 0.02 --counts 10 50 200
+"""
+import argparse
+import json
+import time
+from datetime import datetime, timedelta
+from fake_gcs import FakeBucket, add_repo_to_path, install_fake_storage, use_temp_app_dirs
+
+add_repo_to_path()
+use_temp_app_dirs()
+
+USERNAME = 'bench_user'
+
+
+def populate(bucket, count, legacy=False):
+    import complaint_store
+    bucket._objects.clear()
+    start = datetime(2025, 1, 1)
+    entries = []
+    for i in range(count):
+        timestamp = start + timedelta(minutes=i)
+        folder_name = f"complaint_{timestamp.strftime('%Y%m%d_%H%M%S')}_{i:08x}"
+        metadata = {'user': USERNAME, 'timestamp': timestamp.isoformat(), 'status': 'pending',
+                    'has_text': True, 'has_location': True, 'has_photo': i % 2 == 0}
+        if metadata['has_photo']:
+            bucket.blob(f'{folder_name}/photo.jpg').upload_from_string(b'\xff\xd8 fake jpeg')
+        location = {'latitude': 12.8 + i * 1e-4, 'longitude': 80.0 + i * 1e-4}
+        text = f"Pothole number {i} near the main road"
+        if legacy:
+            bucket.blob(f'{folder_name}/metadata.json').upload_from_string(json.dumps(metadata))
+            bucket.blob(f'{folder_name}/location.json').upload_from_string(json.dumps(location))
+            bucket.blob(f'{folder_name}/complaint.txt').upload_from_string(text)
+        else:
+            record = complaint_store.build_complaint_record(metadata, meta={'timestamp': metadata['timestamp']},
+                                                            text=text, location=location)
+            complaint_store.save_complaint_record(bucket, folder_name, record)
+        entries.append({'id': folder_name, 'timestamp': metadata['timestamp'], 'status': 'pending'})
+    complaint_store.save_user_index(bucket, USERNAME, entries)
+
+
+def timed(func):
+    start = time.perf_counter()
+    result = func()
+    return time.perf_counter() - start, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--latency', type=float, default=0.02, help="Seconds added to every storage call")
+    parser.add_argument('--counts', type=int, nargs='+', default=[10, 50, 200])
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 8, 32])
+    parser.add_argument('--legacy', action='store_true', help="Use the one-blob-per-field folder layout")
+    args = parser.parse_args()
+
+    bucket = FakeBucket(latency=0)
+    install_fake_storage(bucket)
+    import app as app_module
+    client = app_module.app.test_client()
+
+    print(f"latency={args.latency * 1000:.0f}ms per storage call, layout={'legacy' if args.legacy else 'bundle'}")
+    print(f"{'complaints':>10} {'workers':>8} {'all_s':>12} {'page_s':>8} {'map_s':>8} {'calls':>7}")
+    for count in args.counts:
+        bucket.latency = 0
+        populate(bucket, count, args.legacy)
+        bucket.latency = args.latency
+        expected = None
+        for workers in args.workers:
+            app_module.app.config['COMPLAINT_LOADER_WORKERS'] = workers
+            bucket.reset_stats()
+            app_module.photo_urls.clear()
+            dashboard_s, (complaints, _) = timed(lambda: app_module.get_user_complaints(USERNAME))
+            page_s, _ = timed(lambda: app_module.get_user_complaints(USERNAME, limit=app_module.app.config['DASHBOARD_PAGE_SIZE']))
+            # Cold snapshot scan (what a refresh of /get_all_complaints costs)
+            app_module.map_point_cache.clear()
+            map_s, points = timed(app_module.scan_map_points)
+            ids = [complaint['id'] for complaint in complaints]
+            if expected is None:
+                expected = ids
+            assert ids == expected, "parallel loading changed the result order"
+            assert len(points) == count
+            print(f"{count:>10} {workers:>8} {dashboard_s:>12.3f} {page_s:>8.3f} {map_s:>8.3f} {sum(bucket.calls.values()):>7}")
+
+        # Requests served from a built snapshot make no storage calls at all
+        app_module.map_snapshot.mark_stale()
+        app_module.map_snapshot._build()
+        bucket.reset_stats()
+        served_s, response = timed(lambda: client.get('/get_all_complaints'))
+        assert len(response.get_json()) == count and not bucket.calls
+        print(f"{count:>10} {'snapshot':>8} {'':>12} {'':>8} {served_s:>8.3f} {0:>7}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+"""Cost of broken complaint folders across repeated process_complaints.py runs.
+
+Fills an in-memory bucket with healthy complaint folders, a few broken
+ones (record missing its location, or corrupt JSON) and a few whose
+downloads fail with 503s a couple of times. Each run then adds a batch of
+new healthy complaints and lists the whole bucket (--full), so the broken
+folders are seen every time. Shows the storage downloads spent per run and
+how the broken folders (all older than the late-upload window) are
+quarantined on the first run and skipped after that.
+
+    python benchmarks/bench_dead_letter.py --broken 50 --runs 7
+"""
+import argparse
+import contextlib
+import io
+import json
+import logging
+import time
+from bench_incremental_etl import add_folders
+from datetime import datetime, timedelta
+from fake_bigquery import FakeBigQueryClient, install_fake_bigquery
+from fake_gcs import FakeBucket, add_repo_to_path, install_fake_storage
+
+add_repo_to_path()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--new', type=int, default=100, help="New healthy complaints per run")
+    parser.add_argument('--broken', type=int, default=50)
+    parser.add_argument('--flaky', type=int, default=20, help="Folders whose record download fails twice")
+    parser.add_argument('--runs', type=int, default=7)
+    parser.add_argument('--latency', type=float, default=0.002)
+    parser.add_argument('--workers', type=int, default=8)
+    args = parser.parse_args()
+
+    bucket = FakeBucket()
+    bigquery_client = FakeBigQueryClient()
+    install_fake_storage(bucket)
+    install_fake_bigquery(bigquery_client)
+    import etl_dead_letter
+    import process_complaints
+    process_complaints.RETRY_BASE_DELAY = 0.01
+
+    start = datetime(2024, 1, 1)
+    broken = add_folders(bucket, start, args.broken, processed=False)
+    for i, folder_name in enumerate(broken):
+        name = f'{folder_name}/complaint.json'
+        if i % 2:
+            record = json.loads(bucket._objects[name][0])
+            record['location'] = None
+            bucket._objects[name] = (json.dumps(record).encode(), bucket._objects[name][1])
+        else:
+            bucket._objects[name] = (b'{"metadata": ', bucket._objects[name][1])
+    flaky = add_folders(bucket, start + timedelta(days=1), args.flaky, processed=False)
+    bucket.transient_faults.update({f'{folder_name}/complaint.json': 2 for folder_name in flaky})
+
+    print(f"broken={args.broken} flaky={args.flaky} new per run={args.new} "
+          f"max attempts={process_complaints.DEAD_LETTER_MAX_ATTEMPTS}")
+    print(f"{'run':>4} {'processed':>10} {'failed':>7} {'downloads':>10} {'time_s':>7} "
+          f"{'dead_letter':>12} {'quarantined':>12}")
+    for run in range(1, args.runs + 1):
+        bucket.latency = 0
+        add_folders(bucket, start + timedelta(days=1 + run), args.new, processed=False)
+        bucket.reset_stats()
+        bucket.latency = args.latency
+        logging.disable(logging.CRITICAL)
+        started = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            processed, failed = process_complaints.main(args.workers, full=True)
+        elapsed = time.perf_counter() - started
+        logging.disable(logging.NOTSET)
+        bucket.latency = 0
+        downloads = bucket.calls['download']
+        retrying = len(etl_dead_letter.load_dead_letters(bucket))
+        quarantined = len(etl_dead_letter.load_dead_letters(bucket, quarantined=True))
+        print(f"{run:>4} {processed:>10} {len(failed):>7} {downloads:>10} {elapsed:>7.2f} "
+              f"{retrying:>12} {quarantined:>12}")
+
+
+if __name__ == '__main__':
+    main()
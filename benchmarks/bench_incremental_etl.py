@@ -0,0 +1,84 @@
+"""Incremental (watermark) versus full-listing runs of process_complaints.py.
+
+Fills an in-memory bucket with an already processed history of complaint
+folders and a checkpoint at its newest folder, adds a batch of new
+complaints, and times one run that lists from the watermark and one that
+lists the whole bucket (--full). Storage calls carry a fixed latency.
+
+    python benchmarks/bench_incremental_etl.py --history 1000 10000 100000 --new 50
+"""
+import argparse
+import contextlib
+import io
+import json
+import logging
+import time
+from datetime import datetime, timedelta
+from fake_bigquery import FakeBigQueryClient, install_fake_bigquery
+from fake_gcs import FakeBucket, add_repo_to_path, install_fake_storage
+
+add_repo_to_path()
+
+EXTRACT = json.dumps({'Issue Type': ['pothole'], 'Urgency': [], 'Location': ['Main Road'], 'Date': []}).encode()
+
+
+def add_folders(bucket, start, count, processed):
+    import complaint_store
+    names = []
+    for i in range(count):
+        timestamp = start + timedelta(seconds=30 * i)
+        folder_name = f"complaint_{timestamp.strftime('%Y%m%d_%H%M%S')}_{i:08x}"
+        record = complaint_store.build_complaint_record(
+            {'user': 'citizen', 'timestamp': timestamp.isoformat(), 'status': 'pending'},
+            text=f"Pothole number {i}", location={'latitude': 12.8, 'longitude': 80.0}
+        )
+        files = {'complaint.json': json.dumps(record).encode(), 'complaint_extract.json': EXTRACT}
+        if processed:
+            files['processed_for_bigquery.txt'] = b'done'
+        for file_name, data in files.items():
+            bucket._generation += 1
+            bucket._objects[f'{folder_name}/{file_name}'] = (data, bucket._generation)
+        names.append(folder_name)
+    return names
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--history', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--new', type=int, default=50)
+    parser.add_argument('--latency', type=float, default=0.005, help="Seconds added to every storage call")
+    parser.add_argument('--workers', type=int, default=8)
+    args = parser.parse_args()
+
+    bucket = FakeBucket()
+    bigquery_client = FakeBigQueryClient()
+    install_fake_storage(bucket)
+    install_fake_bigquery(bigquery_client)
+    import process_complaints
+
+    print(f"new={args.new} latency={args.latency * 1000:.0f}ms per storage call")
+    print(f"{'history':>8} {'mode':>12} {'time_s':>8} {'list_pages':>11} {'processed':>10}")
+    for history in args.history:
+        for full in (False, True):
+            bucket.latency = 0
+            bucket._objects.clear()
+            start = datetime(2024, 1, 1)
+            old = add_folders(bucket, start, history, processed=True)
+            bucket.blob(process_complaints.STATE_BLOB).upload_from_string(json.dumps({'watermark': old[-1]}))
+            add_folders(bucket, start + timedelta(seconds=30 * history + 3600 * 24), args.new, processed=False)
+            bucket.reset_stats()
+            bigquery_client.reset_stats()
+            bucket.latency = args.latency
+            logging.disable(logging.CRITICAL)
+            started = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                processed, failed = process_complaints.main(args.workers, full=full)
+            elapsed = time.perf_counter() - started
+            logging.disable(logging.NOTSET)
+            assert processed == args.new and not failed, (processed, failed)
+            mode = 'full' if full else 'incremental'
+            print(f"{history:>8} {mode:>12} {elapsed:>8.2f} {bucket.calls['list']:>11} {processed:>10}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+"""Transform and load throughput of process_complaints.py with the local sinks.
+
+Runs process_complaints.build_row over synthetic downloaded complaint data
+and writes the rows through each local sink (SQLite and NDJSON, the same
+schema filtering as the BigQuery sink), with no cloud clients or fakes.
+Use it to catch throughput regressions in the transform and load path.
+
+    python benchmarks/bench_local_sink.py --rows 100000 --batch-size 500
+"""
+import argparse
+import logging
+import os
+import sqlite3
+import tempfile
+import time
+from fake_gcs import add_repo_to_path
+
+add_repo_to_path()
+
+LABEL = {'predictions': {'predictions': [{'class': 'pothole', 'confidence': 0.91}, {'class': 'crack', 'confidence': 0.4}]}}
+EXTRACT = {'Issue Type': ['pothole'], 'Urgency': ['urgent'], 'Location': ['Main Road', 'Ward 4'], 'Date': ['Monday']}
+
+
+def fetched(i):
+    metadata = {'user': f'citizen{i % 50}', 'timestamp': '2025-01-01T00:00:00', 'status': 'pending'}
+    record = {'metadata': metadata, 'meta': {'timestamp': metadata['timestamp']},
+              'text': f"Pothole number {i} near the main road ", 'location': {'latitude': 12.8, 'longitude': 80.0}}
+    return {'record': record, 'extract': EXTRACT, 'label_data': LABEL}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--batch-size', type=int, default=500)
+    args = parser.parse_args()
+
+    import process_complaints
+    from table import sinks
+    assert process_complaints.storage_client is None and process_complaints.bigquery_client is None
+
+    inputs = [(f'complaint_{i:08x}', fetched(i)) for i in range(args.rows)]
+    logging.disable(logging.CRITICAL)
+    started = time.perf_counter()
+    rows = [(folder_name, process_complaints.build_row(folder_name, data)) for folder_name, data in inputs]
+    transform = time.perf_counter() - started
+    print(f"rows={args.rows} batch={args.batch_size}")
+    print(f"{'stage':>12} {'time_s':>8} {'rows_per_s':>12}")
+    print(f"{'transform':>12} {transform:>8.2f} {args.rows / transform:>12,.0f}")
+
+    with tempfile.TemporaryDirectory() as directory:
+        for sink_type in ('sqlite', 'ndjson'):
+            stored = []
+            path = os.path.join(directory, f'extract.{sink_type}')
+            sink = sinks.create_sink({'SINK_TYPE': sink_type, 'SINK_PATH': path, 'TABLE_ID': 'Grievance.extract'},
+                                     None, max_rows=args.batch_size, on_success=stored.append)
+            started = time.perf_counter()
+            for folder_name, row in rows:
+                sink.add(folder_name, row)
+            failed = sink.close()
+            elapsed = time.perf_counter() - started
+            assert not failed and len(stored) == args.rows
+            if sink_type == 'sqlite':
+                with sqlite3.connect(path) as connection:
+                    assert connection.execute('SELECT COUNT(*) FROM extract').fetchone()[0] == args.rows
+            print(f"{sink_type:>12} {elapsed:>8.2f} {args.rows / elapsed:>12,.0f}")
+    logging.disable(logging.NOTSET)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+"""Login latency versus number of registered users: users.json versus per-user accounts.
+
+The users.json row replays the old login path (download and parse the
+whole file, then look the user up); the accounts row runs
+UserAuth.login_user against one account object per user, first with the
+account cache disabled and then with warm cache entries. All rows use an
+in-memory bucket with a fixed latency per storage call. Accounts carry
+PBKDF2 hashes at a low --iterations cost, so the rows compare storage
+access rather than the KDF (bench_password_hashing.py measures that).
+
+    python benchmarks/bench_login.py --counts 1000 100000 1000000 --latency 0.02
+"""
+import argparse
+import contextlib
+import io
+import json
+import random
+import time
+from fake_gcs import FakeBucket, FakeClient, add_repo_to_path
+
+add_repo_to_path()
+
+from password_hashing import PasswordHasher
+from user_auth import USERS_FILE, UserAuth, account_path
+
+
+def populate(bucket, count, hasher):
+    bucket._objects.clear()
+    # One hash for every account: verifying it costs the same as distinct ones
+    password = hasher.hash('secret')
+    users = {}
+    for i in range(count):
+        username = f'citizen{i}'
+        users[username] = {'password': password, 'email': f'{username}@example.com',
+                           'created_at': '2025-01-01T00:00:00'}
+        bucket._objects[account_path(username)] = (json.dumps(users[username]).encode('utf-8'), i + 1)
+    bucket._objects[USERS_FILE] = (json.dumps(users).encode('utf-8'), count + 1)
+    bucket._objects['users/accounts_migrated.json'] = (b'{}', count + 2)
+    bucket._generation = count + 2
+
+
+def legacy_login(bucket, hasher, username, password):
+    users = json.loads(bucket.blob(USERS_FILE).download_as_string())
+    return hasher.verify(password, users[username]['password'])[0]
+
+
+def measure(func, usernames):
+    latencies = []
+    for username in usernames:
+        start = time.perf_counter()
+        assert func(username)
+        latencies.append((time.perf_counter() - start) * 1000)
+    latencies.sort()
+    return latencies[len(latencies) // 2], latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--counts', type=int, nargs='+', default=[1000, 100000, 1000000])
+    parser.add_argument('--latency', type=float, default=0.0, help="Seconds added to every storage call")
+    parser.add_argument('--logins', type=int, default=20)
+    parser.add_argument('--iterations', type=int, default=1000, help="PBKDF2 iterations of the seeded hashes")
+    args = parser.parse_args()
+
+    bucket = FakeBucket(latency=0)
+    hasher = PasswordHasher('pbkdf2_sha256', args.iterations)
+    user_auth = UserAuth(FakeClient(bucket), bucket.name, password_hasher=hasher)
+    rng = random.Random(42)
+
+    print(f"latency={args.latency * 1000:.0f}ms per storage call")
+    print(f"{'users':>9} {'layout':>11} {'p50_ms':>9} {'p99_ms':>9} {'bytes/login':>12} {'calls/login':>12}")
+    for count in args.counts:
+        populate(bucket, count, hasher)
+        user_auth.legacy_pending = False
+        bucket.latency = args.latency
+        usernames = [f'citizen{rng.randrange(count)}' for _ in range(args.logins)]
+        user_auth._cache.clear()
+        for layout, staleness, login in (
+            ('users.json', 0, lambda username: legacy_login(bucket, hasher, username, 'secret')),
+            ('accounts', 0, lambda username: user_auth.login_user(username, 'secret')[0]),
+            ('cached', 30, lambda username: user_auth.login_user(username, 'secret')[0])
+        ):
+            user_auth.cache_max_staleness = staleness
+            bucket.reset_stats()
+            with contextlib.redirect_stdout(io.StringIO()):
+                p50, p99 = measure(login, usernames)
+            print(f"{count:>9} {layout:>11} {p50:>9.2f} {p99:>9.2f} {bucket.bytes_downloaded // len(usernames):>12} "
+                  f"{sum(bucket.calls.values()) / len(usernames):>12.2f}")
+        bucket.latency = 0
+    hasher.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+"""Login throughput and latency at several password hashing costs.
+
+Runs UserAuth.login_user from many concurrent request threads against
+an in-memory bucket (account cache warm, so only the KDF is measured)
+and reports logins per second and p50/p99 latency for each scheme/cost.
+
+    python benchmarks/bench_password_hashing.py --threads 32 --logins 200 --workers 4
+"""
+import argparse
+import contextlib
+import io
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from fake_gcs import FakeBucket, FakeClient, add_repo_to_path
+
+add_repo_to_path()
+
+from password_hashing import PasswordHasher
+from user_auth import UserAuth
+
+SETTINGS = [
+    ('pbkdf2_sha256', 100000),
+    ('pbkdf2_sha256', 300000),
+    ('pbkdf2_sha256', 600000),
+    ('scrypt', 14),
+    ('scrypt', 15)
+]
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--threads', type=int, default=32, help="Concurrent request threads")
+    parser.add_argument('--logins', type=int, default=200)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 4, help="Hashing pool size")
+    parser.add_argument('--processes', action='store_true', help="Hash in worker processes instead of threads")
+    args = parser.parse_args()
+
+    print(f"threads={args.threads} pool={args.workers} {'processes' if args.processes else 'threads'}")
+    print(f"{'scheme':>14} {'cost':>7} {'logins/s':>9} {'p50_ms':>8} {'p99_ms':>8}")
+    for scheme, cost in SETTINGS:
+        hasher = PasswordHasher(scheme, cost, workers=args.workers, use_processes=args.processes)
+        bucket = FakeBucket()
+        user_auth = UserAuth(FakeClient(bucket), bucket.name, password_hasher=hasher)
+
+        def login(_):
+            start = time.perf_counter()
+            success, _ = user_auth.login_user('citizen', 'secret')
+            assert success
+            return (time.perf_counter() - start) * 1000
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            user_auth.register_user('citizen', 'secret', 'citizen@example.com')
+            login(None)
+            with ThreadPoolExecutor(args.threads) as executor:
+                start = time.perf_counter()
+                latencies = list(executor.map(login, range(args.logins)))
+                elapsed = time.perf_counter() - start
+        hasher.shutdown()
+        print(f"{scheme:>14} {cost:>7} {args.logins / elapsed:>9.1f} "
+              f"{percentile(latencies, 50):>8.1f} {percentile(latencies, 99):>8.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+"""Peak request memory of a photo submission: multipart stream versus base64 form field.
+
+Submits complaints through the Flask test client against an in-memory
+bucket that discards large uploads, and reports the peak Python heap
+allocated while handling each request (tracemalloc). The base64 row
+replays the old handler's decode-then-upload path for comparison.
+
+    python benchmarks/bench_photo_upload.py --sizes 1 4
+"""
+import argparse
+import base64
+import io
+import os
+import tracemalloc
+from fake_gcs import FakeBucket, add_repo_to_path, install_fake_storage, use_temp_app_dirs
+
+add_repo_to_path()
+use_temp_app_dirs()
+
+
+def peak_during(func):
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=float, nargs='+', default=[1, 4], help="Photo sizes in MB")
+    args = parser.parse_args()
+
+    bucket = FakeBucket(latency=0, store_limit=64 * 1024)
+    install_fake_storage(bucket)
+    import app as app_module
+    from flask import request
+    app_module.app.config['TESTING'] = True
+    client = app_module.app.test_client()
+    with client.session_transaction() as session:
+        session['username'] = 'bench_user'
+
+    print(f"{'photo_mb':>8} {'multipart_mb':>13} {'base64_mb':>10} {'base64_body_mb':>15}")
+    for size_mb in args.sizes:
+        photo = os.urandom(int(size_mb * 1024 * 1024))
+        data_url = 'data:image/jpeg;base64,' + base64.b64encode(photo).decode('ascii')
+
+        def submit_multipart():
+            response = client.post('/submit_complaint', content_type='multipart/form-data', data={
+                'text': 'Pothole near the main road',
+                'photo': (io.BytesIO(photo), 'photo.jpg', 'image/jpeg')
+            })
+            assert response.status_code == 302, response.status_code
+
+        def submit_base64():
+            with app_module.app.test_request_context('/submit_complaint', method='POST',
+                                                     data={'photo': data_url}):
+                image_data = base64.b64decode(request.form['photo'].split(',')[1])
+                bucket.blob('bench/photo.jpg').upload_from_string(image_data, content_type='image/jpeg')
+
+        # The request bodies are built by the test client, so only the
+        # server-side handling is measured in both cases
+        multipart_peak = peak_during(submit_multipart)
+        base64_peak = peak_during(submit_base64)
+        print(f"{size_mb:>8.1f} {multipart_peak / 2 ** 20:>13.2f} {base64_peak / 2 ** 20:>10.2f} "
+              f"{len(data_url) / 2 ** 20:>15.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,138 @@
+"""Run time and API calls of process_complaints.py versus worker count.
+
+Populates an in-memory bucket with complaint folders (consolidated record,
+text analysis and image label; a share of them already processed) and
+runs process_complaints.main against it and a fake BigQuery client, both
+adding a fixed latency to every call. Finally checks that a run still
+finishes when a pipeline stage raises.
+
+    python benchmarks/bench_process_complaints.py --folders 1000 --processed 0.5 --workers 1 4 16
+"""
+import argparse
+import contextlib
+import io
+import json
+import logging
+import queue
+import threading
+import time
+from datetime import datetime, timedelta
+from fake_bigquery import FakeBigQueryClient, install_fake_bigquery
+from fake_gcs import FakeBucket, add_repo_to_path, install_fake_storage
+
+add_repo_to_path()
+
+LABEL = {'predictions': {'predictions': [{'class': 'pothole', 'confidence': 0.91}]}}
+EXTRACT = {'Issue Type': ['pothole'], 'Urgency': ['urgent'], 'Location': ['Main Road'], 'Date': []}
+
+
+def populate(bucket, folders, processed_share):
+    import complaint_store
+    bucket._objects.clear()
+    start = datetime(2025, 1, 1)
+    processed = int(folders * processed_share)
+    for i in range(folders):
+        timestamp = start + timedelta(minutes=i)
+        folder_name = f"complaint_{timestamp.strftime('%Y%m%d_%H%M%S')}_{i:08x}"
+        metadata = {'user': f'citizen{i % 50}', 'timestamp': timestamp.isoformat(), 'status': 'pending',
+                    'has_text': True, 'has_location': True, 'has_photo': True}
+        record = complaint_store.build_complaint_record(
+            metadata, meta={'timestamp': metadata['timestamp']},
+            text=f"Pothole number {i} near the main road", location={'latitude': 12.8, 'longitude': 80.0}
+        )
+        complaint_store.save_complaint_record(bucket, folder_name, record)
+        bucket.blob(f'{folder_name}/complaint.txt').upload_from_string(record['text'])
+        bucket.blob(f'{folder_name}/photo.jpg').upload_from_string(b'\xff\xd8 fake jpeg')
+        bucket.blob(f'{folder_name}/complaint_extract.json').upload_from_string(json.dumps(EXTRACT))
+        bucket.blob(f'{folder_name}/label.json').upload_from_string(json.dumps(LABEL))
+        if i < processed:
+            bucket.blob(f'{folder_name}/processed_for_bigquery.txt').upload_from_string('done')
+    return folders - processed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--folders', type=int, default=1000)
+    parser.add_argument('--processed', type=float, default=0.5, help="Share of folders already processed")
+    parser.add_argument('--latency', type=float, default=0.01, help="Seconds added to every storage/BigQuery call")
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 4, 16])
+    args = parser.parse_args()
+
+    bucket = FakeBucket()
+    bigquery_client = FakeBigQueryClient()
+    install_fake_storage(bucket)
+    install_fake_bigquery(bigquery_client)
+    import process_complaints
+
+    print(f"folders={args.folders} latency={args.latency * 1000:.0f}ms per call")
+    print(f"{'workers':>8} {'processed':>10} {'time_s':>8} {'speedup':>8} {'storage':>8} {'bigquery':>9}")
+    baseline = None
+    for workers in args.workers:
+        bucket.latency = bigquery_client.latency = 0
+        pending = populate(bucket, args.folders, args.processed)
+        bucket.reset_stats()
+        bigquery_client.reset_stats()
+        bucket.latency = bigquery_client.latency = args.latency
+        logging.disable(logging.CRITICAL)
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            processed, failed = process_complaints.main(workers)
+        elapsed = time.perf_counter() - start
+        logging.disable(logging.NOTSET)
+
+        assert processed == pending and not failed and len(bigquery_client.rows) == pending
+        baseline = baseline or elapsed
+        print(f"{workers:>8} {processed:>10} {elapsed:>8.2f} {baseline / elapsed:>7.1f}x "
+              f"{sum(bucket.calls.values()):>8} {sum(bigquery_client.calls.values()):>9}")
+
+    check_stage_errors(bucket, bigquery_client, process_complaints, args.folders)
+
+
+def check_stage_errors(bucket, bigquery_client, process_complaints, folders):
+    """A stage whose work raises must still pass the end marker on, or main() never returns."""
+    inbox, outbox = queue.Queue(), queue.Queue()
+    logging.disable(logging.CRITICAL)
+
+    def work(item):
+        if item % 2:
+            raise RuntimeError(f"stage failure on {item}")
+        return item
+
+    process_complaints._start_stage("check", work, inbox, outbox, threads=4)
+    for item in range(100):
+        inbox.put(item)
+    inbox.put(process_complaints._END)
+    results = []
+    while True:
+        item = outbox.get(timeout=10)
+        if item is process_complaints._END:
+            break
+        results.append(item)
+    logging.disable(logging.NOTSET)
+    assert sorted(results) == list(range(0, 100, 2))
+
+    # End to end: the transform stage's own error handling fails as well
+    bucket.latency = bigquery_client.latency = 0
+    populate(bucket, min(folders, 50), 0)
+    build_row, classify_error = process_complaints.build_row, process_complaints.etl_dead_letter.classify_error
+
+    def broken(*args):
+        raise RuntimeError("broken")
+
+    process_complaints.build_row = process_complaints.etl_dead_letter.classify_error = broken
+    run = threading.Thread(target=process_complaints.main, daemon=True)
+    logging.disable(logging.CRITICAL)
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            run.start()
+            run.join(10)
+    finally:
+        logging.disable(logging.NOTSET)
+        process_complaints.build_row = build_row
+        process_complaints.etl_dead_letter.classify_error = classify_error
+    assert not run.is_alive(), "process_complaints.main hung after a stage raised"
+    print("stage errors: run finished, failing items dropped")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+"""Registration throughput versus concurrency, and lost-update / duplicate-name checks.
+
+Each registration creates its own account object with if_generation_match=0,
+so concurrent registrations never contend on a shared blob. The benchmark
+registers distinct users from N threads against an in-memory bucket with a
+fixed latency per storage call, checks every account was stored, then
+races N threads registering the same name and checks exactly one wins.
+Passwords are hashed with PBKDF2 at a low --iterations cost, so the
+numbers reflect storage contention rather than the KDF.
+
+    python benchmarks/bench_registration.py --concurrency 1 8 32 --registrations 400 --latency 0.02
+"""
+import argparse
+import contextlib
+import io
+import time
+from concurrent.futures import ThreadPoolExecutor
+from fake_gcs import FakeBucket, FakeClient, add_repo_to_path
+
+add_repo_to_path()
+
+from password_hashing import PasswordHasher
+from user_auth import ACCOUNT_PREFIX, UserAuth
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 8, 32])
+    parser.add_argument('--registrations', type=int, default=400)
+    parser.add_argument('--latency', type=float, default=0.02, help="Seconds added to every storage call")
+    parser.add_argument('--iterations', type=int, default=1000, help="PBKDF2 iterations per password hash")
+    args = parser.parse_args()
+
+    bucket = FakeBucket(latency=0)
+    # One hashing thread per registration thread, so hashing never queues
+    hasher = PasswordHasher('pbkdf2_sha256', args.iterations, workers=max(args.concurrency))
+    user_auth = UserAuth(FakeClient(bucket), bucket.name, password_hasher=hasher)
+    bucket.latency = args.latency
+
+    print(f"latency={args.latency * 1000:.0f}ms per storage call")
+    print(f"{'threads':>8} {'registrations/s':>16} {'stored':>8} {'same-name winners':>18}")
+    for run, threads in enumerate(args.concurrency):
+        usernames = [f'run{run}_citizen{i}' for i in range(args.registrations)]
+        with contextlib.redirect_stdout(io.StringIO()), ThreadPoolExecutor(threads) as executor:
+            start = time.perf_counter()
+            results = list(executor.map(lambda name: user_auth.register_user(name, 'secret', f'{name}@example.com'),
+                                        usernames))
+            elapsed = time.perf_counter() - start
+            race = list(executor.map(lambda i: user_auth.register_user(f'run{run}_popular', f'pw{i}', 'x@example.com'),
+                                     range(threads)))
+        stored = sum(1 for name in bucket._objects if name.startswith(f'{ACCOUNT_PREFIX}run{run}_citizen'))
+        assert all(success for success, _ in results) and stored == len(usernames), "lost registrations"
+        winners = sum(1 for success, _ in race if success)
+        assert winners == 1, "duplicate username registered"
+        print(f"{threads:>8} {len(usernames) / elapsed:>16.1f} {stored:>8} {winners:>18}")
+    hasher.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+"""Build, persistence and top-5 query latency of the similarity index.
+
+    python benchmarks/bench_similarity.py --complaints 100000 --queries 1000
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+from fake_gcs import add_repo_to_path
+
+add_repo_to_path()
+
+from similarity_index import SimilarityIndex
+
+ISSUES = ["pothole", "street light not working", "garbage not collected", "sewage leak", "water leakage",
+          "blocked drain", "tree fallen on road", "electric pole damaged", "power cut", "road damage"]
+PLACES = ["Main Road", "Station Road", "Gandhi Nagar", "Anna Salai", "Market Street", "Lake View",
+          "Temple Street", "Bus Stand", "Hospital Junction", "College Road"]
+FILLER = ("since last week residents complaining dangerous for children vehicles accident night urgent "
+          "smell overflowing traffic rain broken huge several days nobody responded again school shop").split()
+
+
+def make_text(rng):
+    words = rng.sample(FILLER, rng.randint(3, 10))
+    return f"{rng.choice(ISSUES)} near {rng.choice(PLACES)} {' '.join(words)} {rng.randint(1, 500)}"
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--complaints', type=int, default=100000)
+    parser.add_argument('--queries', type=int, default=1000)
+    parser.add_argument('--k', type=int, default=5)
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    texts = [make_text(rng) for _ in range(args.complaints)]
+
+    index = SimilarityIndex()
+    start = time.perf_counter()
+    for i, text in enumerate(texts):
+        index.add(f"complaint_20250101_000000_{i:08x}", text)
+    build_s = time.perf_counter() - start
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'similarity_index')
+        start = time.perf_counter()
+        index.save(path)
+        save_s = time.perf_counter() - start
+        start = time.perf_counter()
+        index = SimilarityIndex.load(path)
+        load_s = time.perf_counter() - start
+
+    latencies = []
+    for _ in range(args.queries):
+        query = make_text(rng)
+        start = time.perf_counter()
+        results = index.query(query, k=args.k)
+        latencies.append((time.perf_counter() - start) * 1000)
+        assert len(results) == args.k
+
+    print(f"complaints={len(index)} vocabulary={len(index.vocabulary)}")
+    print(f"build {build_s:.2f}s ({len(index) / build_s:,.0f} docs/s), save {save_s:.2f}s, load {load_s:.2f}s")
+    print(f"top-{args.k} query ms: p50={percentile(latencies, 50):.2f} "
+          f"p99={percentile(latencies, 99):.2f} max={max(latencies):.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+"""Cost of getting complaint status changes into the warehouse table.
+
+Fills an in-memory bucket with processed complaints (and the table with
+their rows), then withdraws a few of them. Compares two ways of bringing
+the table up to date: sync_status_changes.py, which reads only the change
+log and applies it with one staged MERGE, against the old way of deleting
+every processed marker and running process_complaints.py again.
+
+    python benchmarks/bench_status_sync.py --history 1000 10000 --changes 10 100
+"""
+import argparse
+import contextlib
+import io
+import logging
+import time
+from bench_incremental_etl import add_folders
+from datetime import datetime
+from fake_bigquery import FakeBigQueryClient, install_fake_bigquery
+from fake_gcs import FakeBucket, add_repo_to_path, install_fake_storage
+
+add_repo_to_path()
+
+
+def storage_calls(bucket):
+    return sum(bucket.calls.values())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--history', type=int, nargs='+', default=[1000, 10000])
+    parser.add_argument('--changes', type=int, nargs='+', default=[10, 100])
+    parser.add_argument('--latency', type=float, default=0.002, help="Seconds added to every storage call")
+    parser.add_argument('--workers', type=int, default=8)
+    args = parser.parse_args()
+
+    bucket = FakeBucket()
+    bigquery_client = FakeBigQueryClient()
+    install_fake_storage(bucket)
+    install_fake_bigquery(bigquery_client)
+    import complaint_store
+    import process_complaints
+    import sync_status_changes
+
+    print(f"latency={args.latency}s workers={args.workers}")
+    print(f"{'history':>8} {'changes':>8} {'method':>10} {'storage':>8} {'downloads':>10} "
+          f"{'bq_calls':>9} {'rows_sent':>10} {'updated':>8} {'time_s':>7}")
+    for history in args.history:
+        for changes in args.changes:
+            bucket._objects.clear()
+            bigquery_client.reset_stats()
+            bigquery_client.tables.clear()
+            folders = add_folders(bucket, datetime(2024, 1, 1), history, processed=True)
+            bigquery_client.rows = [{'complaint_id': folder_name, 'status': 'pending'} for folder_name in folders]
+            withdrawn = folders[::max(1, history // changes)][:changes]
+            for folder_name in withdrawn:
+                record = complaint_store.load_complaint_record(bucket, folder_name)
+                record['metadata']['status'] = 'withdrawn'
+                complaint_store.save_complaint_record(bucket, folder_name, record)
+                complaint_store.record_status_change(bucket, folder_name, 'withdrawn', 'citizen')
+
+            # Delta sync from the change log
+            bucket.reset_stats()
+            bigquery_client.calls.clear()
+            bucket.latency = args.latency
+            logging.disable(logging.CRITICAL)
+            started = time.perf_counter()
+            updated = sync_status_changes.main()
+            elapsed = time.perf_counter() - started
+            logging.disable(logging.NOTSET)
+            bucket.latency = 0
+            assert sum(row['status'] == 'withdrawn' for row in bigquery_client.rows) == len(withdrawn)
+            print(f"{history:>8} {changes:>8} {'delta':>10} {storage_calls(bucket):>8} {bucket.calls['download']:>10} "
+                  f"{sum(bigquery_client.calls.values()):>9} {len(withdrawn):>10} {updated:>8} {elapsed:>7.2f}")
+
+            # Baseline: reset every processed marker and reprocess the bucket
+            for folder_name in folders:
+                del bucket._objects[f'{folder_name}/{process_complaints.PROCESSED_MARKER}']
+            bucket.reset_stats()
+            bigquery_client.calls.clear()
+            rows_before = len(bigquery_client.rows)
+            bucket.latency = args.latency
+            logging.disable(logging.CRITICAL)
+            started = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                processed, _ = process_complaints.main(args.workers, full=True)
+            elapsed = time.perf_counter() - started
+            logging.disable(logging.NOTSET)
+            bucket.latency = 0
+            print(f"{history:>8} {changes:>8} {'reprocess':>10} {storage_calls(bucket):>8} "
+                  f"{bucket.calls['download']:>10} {sum(bigquery_client.calls.values()):>9} "
+                  f"{len(bigquery_client.rows) - rows_before:>10} {processed:>8} {elapsed:>7.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+"""Time to first BigQuery insert and memory of process_complaints.py versus bucket size.
+
+Fills an in-memory bucket with unprocessed complaint folders and runs
+process_complaints.main with a fixed latency on every call. Reports when
+the first batch reached BigQuery, the total run time and the peak memory
+allocated during the run, next to how long one full listing takes (what
+the run used to wait for before processing its first folder). Marker
+writes and inserted rows are counted but not kept, so they do not show up
+as memory growth.
+
+    python benchmarks/bench_streaming_etl.py --folders 2000 20000 100000
+"""
+import argparse
+import contextlib
+import io
+import logging
+import time
+import tracemalloc
+from bench_incremental_etl import add_folders
+from datetime import datetime
+from fake_bigquery import FakeBigQueryClient, install_fake_bigquery
+from fake_gcs import FakeBucket, add_repo_to_path, install_fake_storage
+
+add_repo_to_path()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--folders', type=int, nargs='+', default=[2000, 20000, 100000])
+    parser.add_argument('--latency', type=float, default=0.002, help="Seconds added to every storage call")
+    parser.add_argument('--workers', type=int, default=16)
+    args = parser.parse_args()
+
+    bucket = FakeBucket()
+    bigquery_client = FakeBigQueryClient()
+    install_fake_storage(bucket)
+    install_fake_bigquery(bigquery_client)
+    import complaint_store
+    import process_complaints
+
+    inserted = {'rows': 0, 'first': None}
+
+    def insert_rows_json(table_id, rows, **kwargs):
+        inserted['first'] = inserted['first'] or time.perf_counter()
+        inserted['rows'] += len(rows)
+        return []
+
+    def mark_processed(folder_name):
+        bucket._round_trip('upload')
+        return True
+
+    bigquery_client.insert_rows_json = insert_rows_json
+    process_complaints.mark_processed = mark_processed
+
+    print(f"latency={args.latency * 1000:.0f}ms per storage call, workers={args.workers}")
+    print(f"{'folders':>8} {'listing_s':>10} {'first_row_s':>12} {'total_s':>8} {'peak_mb':>8}")
+    for folders in args.folders:
+        bucket.latency = 0
+        bucket._objects.clear()
+        add_folders(bucket, datetime(2024, 1, 1), folders, processed=False)
+        bucket.latency = args.latency
+        inserted.update(rows=0, first=None)
+
+        started = time.perf_counter()
+        complaint_store.list_complaint_folders(bucket)
+        listing = time.perf_counter() - started
+
+        logging.disable(logging.CRITICAL)
+        tracemalloc.start()
+        started = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            processed, failed = process_complaints.main(args.workers, full=True)
+        elapsed = time.perf_counter() - started
+        peak = tracemalloc.get_traced_memory()[1] / 2 ** 20
+        tracemalloc.stop()
+        logging.disable(logging.NOTSET)
+        assert processed == inserted['rows'] == folders and not failed, (processed, failed)
+        print(f"{folders:>8} {listing:>10.2f} {inserted['first'] - started:>12.2f} {elapsed:>8.2f} {peak:>8.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+"""Submission request latency versus storage latency with the write-behind queue.
+
+Posts complaints (text, location and a small photo) through the Flask test
+client, as several users, against an in-memory bucket with a fixed latency per storage call,
+and reports request p50/p99 alongside the time the uploader pool needs to
+drain the queue.
+
+    python benchmarks/bench_submission_latency.py --latencies 0 0.02 0.1 --submissions 200
+"""
+import argparse
+import io
+import os
+import tempfile
+import time
+from fake_gcs import FakeBucket, add_repo_to_path, install_fake_storage, use_temp_app_dirs
+
+add_repo_to_path()
+use_temp_app_dirs()
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--latencies', type=float, nargs='+', default=[0, 0.02, 0.1],
+                        help="Seconds added to every storage call")
+    parser.add_argument('--submissions', type=int, default=200)
+    parser.add_argument('--workers', type=int, default=8, help="Uploader threads")
+    parser.add_argument('--users', type=int, default=20, help="Distinct users submitting")
+    args = parser.parse_args()
+
+    os.environ['SUBMISSION_QUEUE_DIR'] = tempfile.mkdtemp(prefix='submission_queue_')
+    os.environ['SUBMISSION_UPLOAD_WORKERS'] = str(args.workers)
+    bucket = FakeBucket(latency=0)
+    install_fake_storage(bucket)
+    import app as app_module
+    app_module.app.config['TESTING'] = True
+    clients = []
+    for user in range(args.users):
+        client = app_module.app.test_client()
+        with client.session_transaction() as session:
+            session['username'] = f'bench_user_{user}'
+        clients.append(client)
+    photo = os.urandom(200 * 1024)
+
+    print(f"{'latency_ms':>10} {'p50_ms':>8} {'p99_ms':>8} {'drain_s':>8} {'uploads':>8}")
+    for latency in args.latencies:
+        bucket.latency = latency
+        bucket.reset_stats()
+        latencies = []
+        start = time.perf_counter()
+        for i in range(args.submissions):
+            request_start = time.perf_counter()
+            response = clients[i % len(clients)].post('/submit_complaint', content_type='multipart/form-data', data={
+                'text': f'Pothole number {i} near the main road',
+                'location': '{"latitude": 12.8, "longitude": 80.0}',
+                'photo': (io.BytesIO(photo), 'photo.jpg', 'image/jpeg')
+            })
+            latencies.append((time.perf_counter() - request_start) * 1000)
+            assert response.status_code == 302, response.status_code
+        assert app_module.submission_queue.wait_idle(timeout=600)
+        drain_s = time.perf_counter() - start
+        print(f"{latency * 1000:>10.0f} {percentile(latencies, 50):>8.2f} {percentile(latencies, 99):>8.2f} "
+              f"{drain_s:>8.2f} {bucket.calls['upload']:>8}")
+
+
+if __name__ == '__main__':
+    main()
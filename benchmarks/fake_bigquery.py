@@ -0,0 +1,162 @@
+"""In-memory stand-in for the parts of google.cloud.bigquery the ETL scripts use.
+
+Like fake_gcs, every API call sleeps for ``latency`` seconds and is
+counted in ``client.calls``; inserted rows are kept in ``client.rows``.
+Tables loaded with load_table_from_json are kept in ``client.tables``,
+and query() understands the status MERGE of sinks.BigQuerySink.
+"""
+import gzip
+import json
+import re
+import threading
+import time
+from collections import Counter
+from google.api_core import exceptions
+
+DEFAULT_COLUMNS = [
+    'complaint_id', 'user_id', 'description', 'image_url', 'latitude', 'longitude',
+    'location_text', 'status', 'submitted_at', 'issue_type', 'department', 'priority',
+    'dates_mentioned', 'image_detections', 'text_analysis', 'processed_at', 'label'
+]
+
+
+class FakeField:
+    def __init__(self, name):
+        self.name = name
+
+
+class FakeTable:
+    def __init__(self, columns):
+        self.schema = [FakeField(name) for name in columns]
+
+
+class FakeLoadJob:
+    def __init__(self, job_id, output_rows, error=None):
+        self.job_id = job_id
+        self.output_rows = output_rows
+        self.error = error
+
+    def result(self):
+        if self.error:
+            raise exceptions.BadRequest(self.error)
+        return self
+
+
+class FakeQueryJob:
+    def __init__(self, job_id, num_dml_affected_rows=None, rows=()):
+        self.job_id = job_id
+        self.num_dml_affected_rows = num_dml_affected_rows
+        self.rows = list(rows)
+
+    def result(self):
+        return self
+
+    def __iter__(self):
+        return iter(self.rows)
+
+
+MERGE_STATUS = re.compile(r"MERGE `(?P<target>[^`]+)` T USING `(?P<source>[^`]+)` S ON T\.complaint_id = S\.complaint_id")
+SELECT_MISSING = re.compile(r"SELECT S\.complaint_id FROM `(?P<source>[^`]+)` S WHERE NOT EXISTS")
+
+
+class FakeBigQueryClient:
+    def __init__(self, latency=0.0, columns=DEFAULT_COLUMNS):
+        self.latency = latency
+        self.columns = list(columns)
+        self.calls = Counter()
+        self.rows = []
+        self.tables = {}
+        self._lock = threading.Lock()
+
+    def _round_trip(self, kind):
+        with self._lock:
+            self.calls[kind] += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def reset_stats(self):
+        self.calls = Counter()
+        self.rows = []
+
+    def get_table(self, table_id):
+        self._round_trip('get_table')
+        return FakeTable(self.columns)
+
+    def insert_rows_json(self, table_id, rows, **kwargs):
+        self._round_trip('insert_rows_json')
+        errors = []
+        accepted = []
+        for index, row in enumerate(rows):
+            unknown = [key for key in row if key not in self.columns]
+            if unknown:
+                errors.append({'index': index, 'errors': [{'reason': 'invalid', 'location': unknown[0],
+                                                           'message': f'no such field: {unknown[0]}'}]})
+            else:
+                accepted.append(row)
+        if errors:
+            # Like the real API (skipInvalidRows=False): one bad row stops the whole request
+            bad = {error['index'] for error in errors}
+            errors.extend({'index': index, 'errors': [{'reason': 'stopped', 'message': ''}]}
+                          for index in range(len(rows)) if index not in bad)
+            return sorted(errors, key=lambda error: error['index'])
+        with self._lock:
+            self.rows.extend(accepted)
+        return []
+
+    def load_table_from_file(self, file_obj, table_id, job_config=None, **kwargs):
+        self._round_trip('load_table_from_file')
+        data = file_obj.read()
+        if data[:2] == b'\x1f\x8b':
+            data = gzip.decompress(data)
+        rows = [json.loads(line) for line in data.splitlines() if line]
+        ignore_unknown = getattr(job_config, 'ignore_unknown_values', False)
+        for row in rows:
+            unknown = [key for key in row if key not in self.columns]
+            if unknown and not ignore_unknown:
+                # A load job is all or nothing
+                return FakeLoadJob(f'job_{self.calls["load_table_from_file"]}', 0, f'no such field: {unknown[0]}')
+        with self._lock:
+            self.rows.extend({key: value for key, value in row.items() if key in self.columns} for row in rows)
+        return FakeLoadJob(f'job_{self.calls["load_table_from_file"]}', len(rows))
+
+
+    def load_table_from_json(self, rows, table_id, job_config=None, **kwargs):
+        self._round_trip('load_table_from_json')
+        rows = [dict(row) for row in rows]
+        with self._lock:
+            if getattr(job_config, 'write_disposition', None) == 'WRITE_TRUNCATE':
+                self.tables[table_id] = rows
+            else:
+                self.tables.setdefault(table_id, []).extend(rows)
+        return FakeLoadJob(f'job_{self.calls["load_table_from_json"]}', len(rows))
+
+    def query(self, sql, **kwargs):
+        self._round_trip('query')
+        match = SELECT_MISSING.match(sql)
+        if match is not None:
+            with self._lock:
+                loaded = {row.get('complaint_id') for row in self.rows}
+            return FakeQueryJob(f'job_{self.calls["query"]}', rows=[
+                {'complaint_id': row['complaint_id']} for row in self.tables.get(match.group('source'), [])
+                if row['complaint_id'] not in loaded
+            ])
+        match = MERGE_STATUS.match(sql)
+        if match is None:
+            raise exceptions.BadRequest(f'unsupported query: {sql}')
+        statuses = {row['complaint_id']: row['status'] for row in self.tables.get(match.group('source'), [])}
+        updated = 0
+        with self._lock:
+            for row in self.rows:
+                status = statuses.get(row.get('complaint_id'), row.get('status'))
+                if status != row.get('status'):
+                    row['status'] = status
+                    updated += 1
+        return FakeQueryJob(f'job_{self.calls["query"]}', updated)
+
+
+def install_fake_bigquery(client):
+    """Make bigquery.Client(...) and Client.from_service_account_json(...) return ``client``."""
+    from google.cloud import bigquery
+    bigquery.Client.from_service_account_json = staticmethod(lambda *args, **kwargs: client)
+    bigquery.Client.__new__ = lambda cls, *args, **kwargs: client
+    return client
@@ -0,0 +1,218 @@
+"""In-memory stand-in for the parts of google.cloud.storage the app uses.
+
+Every call that would be a network round trip sleeps for ``latency``
+seconds and is counted in ``bucket.calls`` so benchmarks can report both
+wall time and storage call counts.
+"""
+import bisect
+import threading
+import time
+from collections import Counter
+from google.api_core import exceptions
+
+
+class FakeBlob:
+    def __init__(self, bucket, name, generation=None, chunk_size=None):
+        self.bucket = bucket
+        self.name = name
+        self.generation = generation
+        self.chunk_size = chunk_size
+        self.size = None
+
+    def _round_trip(self, kind):
+        self.bucket._round_trip(kind)
+
+    def exists(self):
+        self._round_trip('exists')
+        return self.name in self.bucket._objects
+
+    def reload(self):
+        self._round_trip('reload')
+        try:
+            data, generation = self.bucket._objects[self.name]
+        except KeyError:
+            raise exceptions.NotFound(self.name)
+        self.generation = generation
+        self.size = len(data)
+
+    def download_as_bytes(self, if_generation_match=None, **kwargs):
+        self._round_trip('download')
+        self.bucket._inject_fault(self.name)
+        try:
+            data, generation = self.bucket._objects[self.name]
+        except KeyError:
+            raise exceptions.NotFound(self.name)
+        if if_generation_match is not None and if_generation_match != generation:
+            raise exceptions.PreconditionFailed(self.name)
+        self.bucket.bytes_downloaded += len(data)
+        # The real client picks the generation up from the response headers
+        self.generation = generation
+        return data
+
+    download_as_string = download_as_bytes
+
+    def download_as_text(self, **kwargs):
+        return self.download_as_bytes(**kwargs).decode('utf-8')
+
+    def upload_from_string(self, data, content_type=None, if_generation_match=None, **kwargs):
+        self._round_trip('upload')
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        self._store(data, if_generation_match)
+
+    def _store(self, data, if_generation_match=None):
+        if self.bucket.store_limit is not None and len(data) > self.bucket.store_limit:
+            data = b''
+        with self.bucket._lock:
+            current = self.bucket._objects.get(self.name)
+            current_generation = current[1] if current else 0
+            if if_generation_match is not None and if_generation_match != current_generation:
+                raise exceptions.PreconditionFailed(self.name)
+            self.bucket._generation += 1
+            self.generation = self.bucket._generation
+            if self.name not in self.bucket._objects:
+                self.bucket._sorted_names = None
+            self.bucket._objects[self.name] = (bytes(data), self.generation)
+
+    def upload_from_file(self, file_obj, content_type=None, size=None, if_generation_match=None, **kwargs):
+        # Read in chunks like the real client does for resumable uploads
+        chunk_size = self.chunk_size or 256 * 1024
+        chunks = []
+        stored = 0
+        while True:
+            if self.chunk_size:
+                self._round_trip('upload_chunk')
+            chunk = file_obj.read(chunk_size)
+            if not chunk:
+                break
+            stored += len(chunk)
+            if self.bucket.store_limit is None or stored <= self.bucket.store_limit:
+                chunks.append(chunk)
+        if not self.chunk_size:
+            self._round_trip('upload')
+        data = b''.join(chunks) if self.bucket.store_limit is None or stored <= self.bucket.store_limit else b''
+        self._store(data, if_generation_match)
+
+    def delete(self, **kwargs):
+        self._round_trip('delete')
+        with self.bucket._lock:
+            self.bucket._sorted_names = None
+            if self.bucket._objects.pop(self.name, None) is None:
+                raise exceptions.NotFound(self.name)
+
+    def generate_signed_url(self, **kwargs):
+        # Signing is local CPU work in the real client; count it anyway
+        self.bucket.calls['sign'] += 1
+        return f"https://fake-storage.local/{self.bucket.name}/{self.name}?sig=1"
+
+
+class FakeBucket:
+    def __init__(self, name='fake-bucket', latency=0.0, store_limit=None):
+        self.name = name
+        self.latency = latency
+        # Uploads larger than store_limit bytes are counted but their bytes
+        # dropped, so memory benchmarks measure the app, not the fake bucket
+        self.store_limit = store_limit
+        self.calls = Counter()
+        self.bytes_downloaded = 0
+        self._objects = {}
+        # Sorted object names for listings; rebuilt when names are added or removed
+        self._sorted_names = None
+        self._generation = 0
+        self._lock = threading.Lock()
+        # blob name -> number of downloads that fail with 503 before one succeeds
+        self.transient_faults = {}
+
+    def _round_trip(self, kind):
+        with self._lock:
+            self.calls[kind] += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def _inject_fault(self, name):
+        with self._lock:
+            remaining = self.transient_faults.get(name)
+            if not remaining:
+                return
+            self.transient_faults[name] = remaining - 1
+        raise exceptions.ServiceUnavailable(f"injected fault: {name}")
+
+    def reset_stats(self):
+        self.calls = Counter()
+        self.bytes_downloaded = 0
+
+    def blob(self, name, chunk_size=None):
+        return FakeBlob(self, name, chunk_size=chunk_size)
+
+    def get_blob(self, name):
+        self._round_trip('get_blob')
+        entry = self._objects.get(name)
+        if entry is None:
+            return None
+        blob = FakeBlob(self, name, entry[1])
+        blob.size = len(entry[0])
+        return blob
+
+    def _names(self):
+        with self._lock:
+            if self._sorted_names is None or len(self._sorted_names) != len(self._objects):
+                self._sorted_names = sorted(self._objects)
+            return self._sorted_names
+
+    def list_blobs(self, prefix='', start_offset=None, page_size=1000, **kwargs):
+        names = self._names()
+        position = bisect.bisect_left(names, max(prefix, start_offset or ''))
+        while True:
+            self._round_trip('list')
+            page = []
+            while position < len(names) and len(page) < page_size and names[position].startswith(prefix):
+                page.append(names[position])
+                position += 1
+            for name in page:
+                data, generation = self._objects[name]
+                blob = FakeBlob(self, name, generation)
+                blob.size = len(data)
+                yield blob
+            if len(page) < page_size:
+                return
+
+
+class FakeClient:
+    def __init__(self, bucket):
+        self._bucket = bucket
+
+    def bucket(self, name):
+        return self._bucket
+
+
+def install_fake_storage(bucket):
+    """Make storage.Client(...) and Client.from_service_account_json(...) return a FakeClient.
+
+    Call this before importing app.py or the processing scripts, which
+    create their storage client at import time.
+    """
+    from google.cloud import storage
+    fake_client = FakeClient(bucket)
+    storage.Client.from_service_account_json = staticmethod(lambda *args, **kwargs: fake_client)
+    storage.Client.__new__ = lambda cls, *args, **kwargs: fake_client
+    return fake_client
+
+
+def add_repo_to_path():
+    """Allow benchmarks to import the top-level modules when run as scripts."""
+    import os
+    import sys
+    repo_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    if repo_root not in sys.path:
+        sys.path.insert(0, repo_root)
+    return repo_root
+
+
+def use_temp_app_dirs():
+    """Point the app's local state (sessions, queue, index) at a fresh temp dir."""
+    import os
+    import tempfile
+    data_dir = tempfile.mkdtemp(prefix='app_data_')
+    os.environ.setdefault('APP_DATA_DIR', data_dir)
+    os.environ.setdefault('SESSION_FILE_DIR', os.path.join(data_dir, 'sessions'))
+    return data_dir
@@ -0,0 +1,376 @@
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from urllib.parse import quote
+from google.api_core import exceptions
+
+# Default width of the thread pool used to load complaints concurrently
+DEFAULT_LOADER_WORKERS = 8
+# Loader pools by width, created on first use and shared by every request
+# so the number of loader threads stays bounded however many requests run
+_loader_pools = {}
+_loader_pools_lock = threading.Lock()
+
+# Consolidated complaint record: everything the readers need about a
+# complaint in a single object, replacing the separate metadata.json,
+# meta.json, complaint.txt, location.json, department.json and
+# status_history.json blobs. Folders written before the bundle existed
+# are still read through the legacy layout.
+BUNDLE_FILE = 'complaint.json'
+LEGACY_FILES = {
+    'metadata': 'metadata.json',
+    'meta': 'meta.json',
+    'text': 'complaint.txt',
+    'location': 'location.json',
+    'department': 'department.json',
+    'status_history': 'status_history.json'
+}
+RECORD_FIELDS = tuple(LEGACY_FILES)
+
+def bundle_path(folder_name):
+    """Return the blob name of a complaint's consolidated record."""
+    return f"{folder_name}/{BUNDLE_FILE}"
+
+def build_complaint_record(metadata, meta=None, text=None, location=None, department=None, status_history=None):
+    """Assemble a consolidated complaint record."""
+    return {
+        'metadata': metadata,
+        'meta': meta,
+        'text': text,
+        'location': location,
+        'department': department,
+        'status_history': status_history
+    }
+
+def save_complaint_record(bucket, folder_name, record, if_generation_match=None):
+    """Write a consolidated complaint record in a single upload."""
+    kwargs = {}
+    if if_generation_match is not None:
+        kwargs['if_generation_match'] = if_generation_match
+    bucket.blob(bundle_path(folder_name)).upload_from_string(
+        json.dumps(record),
+        content_type='application/json',
+        **kwargs
+    )
+
+def load_legacy_record(bucket, folder_name, fields=RECORD_FIELDS, inventory=None):
+    """Read a complaint stored as separate blobs into the record format.
+
+    ``inventory`` is the set of file names known to exist in the folder
+    (e.g. from a listing); files missing from it are not requested at all.
+    Missing files come back as None.
+    """
+    record = build_complaint_record(None)
+    for field in fields:
+        file_name = LEGACY_FILES[field]
+        if inventory is not None and file_name not in inventory:
+            continue
+        try:
+            content = bucket.blob(f"{folder_name}/{file_name}").download_as_string()
+        except exceptions.NotFound:
+            continue
+        if field == 'text':
+            record[field] = content.decode('utf-8')
+        else:
+            record[field] = json.loads(content)
+    return record
+
+# Legacy blobs that other systems may still write after the bundle exists
+# (department assignment, status updates); a newer one wins over the bundle
+OVERLAY_FIELDS = ('department', 'status_history')
+
+def folder_inventory(bucket, folder_name):
+    """List one complaint folder, returning {file name: generation}."""
+    prefix = f"{folder_name}/"
+    return {blob.name[len(prefix):]: blob.generation for blob in bucket.list_blobs(prefix=prefix)}
+
+def load_complaint_record(bucket, folder_name, fields=RECORD_FIELDS, inventory=None):
+    """Load a complaint with one GET of its bundle, falling back to the legacy layout.
+
+    ``fields`` limits which legacy blobs are fetched when there is no bundle.
+    Requested department and status history blobs written after the bundle
+    (by generation) replace the bundle's copy; without an ``inventory`` the
+    folder is listed first to find them.
+    """
+    overlay = [field for field in OVERLAY_FIELDS if field in fields]
+    if inventory is None and overlay:
+        inventory = folder_inventory(bucket, folder_name)
+    if inventory is None or BUNDLE_FILE in inventory:
+        try:
+            record = json.loads(bucket.blob(bundle_path(folder_name)).download_as_string())
+        except exceptions.NotFound:
+            pass
+        else:
+            bundle_generation = inventory.get(BUNDLE_FILE) if inventory is not None else None
+            newer = [
+                field for field in overlay
+                if bundle_generation is not None
+                and (inventory.get(LEGACY_FILES[field]) or 0) > bundle_generation
+            ]
+            if newer:
+                legacy = load_legacy_record(bucket, folder_name, newer, inventory)
+                for field in newer:
+                    if legacy[field] is not None:
+                        record[field] = legacy[field]
+            return record
+    return load_legacy_record(bucket, folder_name, fields, inventory)
+
+def folder_time(folder_name):
+    """Parse the timestamp out of complaint_YYYYMMDD_HHMMSS_xxxxxxxx, or None."""
+    try:
+        return datetime.strptime('_'.join(folder_name.split('_')[1:3]), '%Y%m%d_%H%M%S')
+    except ValueError:
+        return None
+
+def folder_offset(timestamp):
+    """Listing start_offset for folders created at or after ``timestamp``.
+
+    Folder names sort by submission time, so a lexicographic start_offset
+    skips everything older.
+    """
+    return f"complaint_{timestamp.strftime('%Y%m%d_%H%M%S')}"
+
+def iter_complaint_folders(bucket, start_offset=None, page_size=1000):
+    """Yield ``(folder_name, {file name: generation})`` for each complaint folder, in name order.
+
+    The listing is read a page at a time and a folder is yielded as soon as
+    its last file has been listed, so memory does not grow with the bucket.
+    """
+    folder_name = None
+    inventory = {}
+    for blob in bucket.list_blobs(prefix='complaint_', start_offset=start_offset, page_size=page_size):
+        if '/' not in blob.name:
+            continue
+        name, file_name = blob.name.split('/', 1)
+        if name != folder_name:
+            if folder_name is not None:
+                yield folder_name, inventory
+            folder_name, inventory = name, {}
+        inventory[file_name] = blob.generation
+    if folder_name is not None:
+        yield folder_name, inventory
+
+def list_complaint_folders(bucket, start_offset=None):
+    """List complaint folders once, returning {folder_name: {file name: generation}}.
+
+    The per-folder mapping doubles as the folder's file inventory, and the
+    generations let callers tell which files changed since a previous listing.
+    ``start_offset`` skips folders that sort before it.
+    """
+    return dict(iter_complaint_folders(bucket, start_offset))
+
+# Complaint folders uploaded long after the time in their name (e.g. by the
+# submission queue after an outage). The ETL lists folders by name from its
+# watermark, so it would never see these; it reads them from here instead.
+LATE_ARRIVAL_PREFIX = 'etl_state/late_arrivals/'
+
+def record_late_arrival(bucket, folder_name):
+    """Flag a folder uploaded too late for the ETL's listing window."""
+    bucket.blob(f"{LATE_ARRIVAL_PREFIX}{folder_name}").upload_from_string(datetime.now().isoformat())
+
+def list_late_arrivals(bucket):
+    """Return the names of the flagged folders (one listing, no downloads)."""
+    return [blob.name[len(LATE_ARRIVAL_PREFIX):] for blob in bucket.list_blobs(prefix=LATE_ARRIVAL_PREFIX)]
+
+def clear_late_arrival(bucket, folder_name):
+    try:
+        bucket.blob(f"{LATE_ARRIVAL_PREFIX}{folder_name}").delete()
+    except exceptions.NotFound:
+        pass
+
+# Photos larger than one chunk are sent with a chunked resumable upload
+# instead of a single request, so a dropped connection only retries one
+# chunk. The threshold must stay below the app's MAX_PHOTO_BYTES (5MB by
+# default), or no accepted photo would ever take this path.
+UPLOAD_CHUNK_SIZE = 1024 * 1024  # must be a multiple of 256 KB
+RESUMABLE_UPLOAD_THRESHOLD = UPLOAD_CHUNK_SIZE
+
+def stream_size(stream):
+    """Return the number of bytes left in a seekable stream without reading it."""
+    position = stream.tell()
+    stream.seek(0, 2)
+    size = stream.tell() - position
+    stream.seek(position)
+    return size
+
+def upload_stream(bucket, blob_name, stream, content_type, size=None):
+    """Stream a file-like object to a blob without loading it into memory."""
+    if size is None:
+        size = stream_size(stream)
+    if size > RESUMABLE_UPLOAD_THRESHOLD:
+        blob = bucket.blob(blob_name, chunk_size=UPLOAD_CHUNK_SIZE)
+    else:
+        blob = bucket.blob(blob_name)
+    blob.upload_from_file(stream, content_type=content_type, size=size)
+    return blob
+
+# Status change log: one small object per status transition, named by the
+# time of the change so a reader can list only what is new since its last
+# run (sync_status_changes.py uses it to update the warehouse copy)
+STATUS_CHANGE_PREFIX = 'status_changes/'
+
+def status_change_offset(timestamp):
+    """Listing start_offset for status changes made at or after ``timestamp``."""
+    return f"{STATUS_CHANGE_PREFIX}{timestamp.strftime('%Y%m%dT%H%M%S%f')}"
+
+def record_status_change(bucket, complaint_id, status, changed_by=None, changed_at=None):
+    """Append a complaint's status transition to the change log."""
+    changed_at = changed_at or datetime.now()
+    bucket.blob(f"{status_change_offset(changed_at)}_{complaint_id}.json").upload_from_string(
+        json.dumps({
+            'complaint_id': complaint_id,
+            'status': status,
+            'changed_at': changed_at.isoformat(),
+            'changed_by': changed_by
+        }),
+        content_type='application/json'
+    )
+
+# Per-user complaint index: one small JSON object per user listing the
+# complaint folders that user has filed, so the dashboard never has to
+# scan every complaint in the bucket.
+USER_INDEX_PREFIX = 'user_index/'
+INDEX_WRITE_RETRIES = 5
+# Written by backfill_user_index.py once every user filing before the index
+# existed has one. From then on a missing index means "no complaints yet"
+# and never triggers a bucket scan.
+USER_INDEX_BACKFILL_MARKER = f'{USER_INDEX_PREFIX}_backfill_complete'
+_backfill_complete = False
+
+def user_index_path(username):
+    """Return the blob name of a user's complaint index."""
+    return f"{USER_INDEX_PREFIX}{quote(username, safe='')}.json"
+
+def _index_entry(complaint_id, metadata):
+    return {
+        'id': complaint_id,
+        'timestamp': metadata.get('timestamp'),
+        'status': metadata.get('status', 'pending')
+    }
+
+def load_user_index(bucket, username):
+    """Return the list of index entries for a user, or None if no index exists yet."""
+    blob = bucket.blob(user_index_path(username))
+    try:
+        return json.loads(blob.download_as_string()).get('complaints', [])
+    except exceptions.NotFound:
+        return None
+
+def save_user_index(bucket, username, entries, if_generation_match=None):
+    """Overwrite a user's complaint index (``if_generation_match=0`` only creates it)."""
+    kwargs = {}
+    if if_generation_match is not None:
+        kwargs['if_generation_match'] = if_generation_match
+    bucket.blob(user_index_path(username)).upload_from_string(
+        json.dumps({'complaints': entries}),
+        content_type='application/json',
+        **kwargs
+    )
+
+def create_user_index(bucket, username):
+    """Give a new user an empty index, leaving an existing one alone."""
+    try:
+        save_user_index(bucket, username, [], if_generation_match=0)
+    except exceptions.PreconditionFailed:
+        pass
+
+def user_index_backfilled(bucket):
+    """Whether the index backfill has run, so a missing index can be taken as empty."""
+    global _backfill_complete
+    if not _backfill_complete:
+        _backfill_complete = bucket.get_blob(USER_INDEX_BACKFILL_MARKER) is not None
+    return _backfill_complete
+
+def mark_user_index_backfilled(bucket):
+    """Record that every user with complaints has an index."""
+    bucket.blob(USER_INDEX_BACKFILL_MARKER).upload_from_string(
+        json.dumps({'completed_at': datetime.now().isoformat()}),
+        content_type='application/json'
+    )
+
+def update_user_index(bucket, username, complaint_id, metadata):
+    """Insert or update one complaint in a user's index.
+
+    The write is guarded by a generation precondition so two requests
+    updating the same user's index cannot silently drop each other's entry.
+    """
+    path = user_index_path(username)
+    for attempt in range(INDEX_WRITE_RETRIES):
+        blob = bucket.get_blob(path)
+        if blob is None:
+            # First write for this user: until the backfill has run, seed the
+            # index with anything filed before the index existed so older
+            # complaints are not lost
+            generation = 0
+            entries = [] if user_index_backfilled(bucket) else scan_user_indexes(bucket, username).get(username, [])
+        else:
+            generation = blob.generation
+            entries = json.loads(blob.download_as_string()).get('complaints', [])
+
+        entries = [entry for entry in entries if entry.get('id') != complaint_id]
+        entries.append(_index_entry(complaint_id, metadata))
+
+        try:
+            bucket.blob(path).upload_from_string(
+                json.dumps({'complaints': entries}),
+                content_type='application/json',
+                if_generation_match=generation
+            )
+            return entries
+        except exceptions.PreconditionFailed:
+            print(f"User index for {username} changed concurrently, retrying ({attempt + 1})")
+    raise RuntimeError(f"Could not update complaint index for {username}")
+
+def scan_user_indexes(bucket, username=None):
+    """Rebuild user indexes by scanning every complaint in the bucket.
+
+    Returns a dict mapping username to its index entries. If ``username``
+    is given, only that user's entries are collected.
+    """
+    indexes = {}
+    for complaint_id, inventory in list_complaint_folders(bucket).items():
+        if BUNDLE_FILE not in inventory and LEGACY_FILES['metadata'] not in inventory:
+            continue
+        try:
+            metadata = load_complaint_record(bucket, complaint_id, ('metadata',), inventory)['metadata']
+        except Exception as e:
+            print(f"Error reading complaint {complaint_id}: {str(e)}")
+            continue
+        owner = metadata.get('user') if metadata else None
+        if not owner or (username is not None and owner != username):
+            continue
+        indexes.setdefault(owner, []).append(_index_entry(complaint_id, metadata))
+    return indexes
+
+def _loader_pool(max_workers):
+    with _loader_pools_lock:
+        pool = _loader_pools.get(max_workers)
+        if pool is None:
+            pool = _loader_pools[max_workers] = ThreadPoolExecutor(max_workers=max_workers,
+                                                                   thread_name_prefix='complaint-loader')
+        return pool
+
+def load_concurrently(items, loader, max_workers=DEFAULT_LOADER_WORKERS):
+    """Call ``loader(item)`` for every item on a shared, bounded thread pool.
+
+    Results come back in the order of ``items``. Items whose loader returns
+    None are dropped, and an exception for one item is printed and skipped
+    without affecting the others. ``max_workers=1`` loads serially.
+    """
+    items = list(items)
+    if not items:
+        return []
+
+    def run(item):
+        try:
+            return loader(item)
+        except Exception as e:
+            print(f"Error processing complaint {item}: {str(e)}")
+            return None
+
+    if max_workers <= 1 or len(items) == 1:
+        results = [run(item) for item in items]
+    else:
+        results = list(_loader_pool(max_workers).map(run, items))
+    return [result for result in results if result is not None]
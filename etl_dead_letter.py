@@ -0,0 +1,177 @@
+import argparse
+import json
+import logging
+from datetime import datetime, timedelta
+from google.cloud import storage
+from google.api_core import exceptions
+import requests
+import complaint_store
+from submission_queue import LATE_UPLOAD_SECONDS
+
+# Complaint folders the ETL could not load. Each has a record under
+# DEAD_LETTER_PREFIX with the failure reason and how many runs have failed
+# on it; process_complaints.py retries them on every run (even once they
+# are older than its listing window) until they succeed or use up their
+# retry budget. The record then moves to QUARANTINE_PREFIX, which the ETL
+# never reads, and the folder gets QUARANTINE_MARKER so the listing skips
+# it without downloading anything.
+DEAD_LETTER_PREFIX = 'etl_state/dead_letter/'
+QUARANTINE_PREFIX = 'etl_state/quarantine/'
+QUARANTINE_MARKER = 'etl_quarantined.txt'
+
+# Worth retrying within a run, with backoff
+TRANSIENT_ERRORS = (
+    exceptions.TooManyRequests,
+    exceptions.InternalServerError,
+    exceptions.BadGateway,
+    exceptions.ServiceUnavailable,
+    exceptions.GatewayTimeout,
+    exceptions.RetryError,
+    requests.exceptions.ConnectionError,
+    requests.exceptions.Timeout,
+    ConnectionError,
+    TimeoutError
+)
+# A folder missing data is retried on later runs only while its files could
+# still be arriving, i.e. while it is younger than the submission queue's
+# late-upload window; after that it is quarantined like broken data
+INCOMPLETE_GRACE = timedelta(seconds=LATE_UPLOAD_SECONDS)
+
+
+class IncompleteComplaint(Exception):
+    """A complaint folder is missing data the row needs; its files may still be arriving."""
+
+
+class InvalidComplaint(Exception):
+    """A complaint folder's data is present but unusable (wrong shape or type)."""
+
+
+# Data known to be broken: retrying will not help, so the folder is
+# quarantined straight away. Other exceptions (a KeyError from a bug in the
+# transform, say) get the normal retry budget, so fixing the code lets the
+# folders load instead of leaving them quarantined.
+PERMANENT_ERRORS = (json.JSONDecodeError, UnicodeDecodeError, InvalidComplaint)
+
+def classify_error(error, folder_name=None):
+    """Classify an exception raised while processing a folder.
+
+    'transient': retry now, with backoff; 'deferred': record it and retry
+    on the next run; 'permanent': quarantine the folder. Missing data is
+    only 'deferred' for a ``folder_name`` within INCOMPLETE_GRACE of now.
+    """
+    if isinstance(error, TRANSIENT_ERRORS):
+        return 'transient'
+    if isinstance(error, IncompleteComplaint):
+        submitted_at = complaint_store.folder_time(folder_name) if folder_name else None
+        if submitted_at is not None and datetime.now() - submitted_at < INCOMPLETE_GRACE:
+            return 'deferred'
+        return 'permanent'
+    if isinstance(error, exceptions.NotFound):
+        return 'deferred'
+    if isinstance(error, PERMANENT_ERRORS):
+        return 'permanent'
+    # Unknown errors get the normal retry budget
+    return 'deferred'
+
+def record_path(folder_name, quarantined=False):
+    return f"{QUARANTINE_PREFIX if quarantined else DEAD_LETTER_PREFIX}{folder_name}.json"
+
+def _delete(bucket, blob_name):
+    try:
+        bucket.blob(blob_name).delete()
+    except exceptions.NotFound:
+        pass
+
+def load_dead_letters(bucket, quarantined=False):
+    """Return {folder_name: record} for every complaint still being retried (or every quarantined one)."""
+    records = {}
+    for blob in bucket.list_blobs(prefix=QUARANTINE_PREFIX if quarantined else DEAD_LETTER_PREFIX):
+        try:
+            record = json.loads(blob.download_as_string())
+        except (exceptions.NotFound, ValueError):
+            continue
+        records[record['folder']] = record
+    return records
+
+def record_failure(bucket, folder_name, reason, error, previous=None, max_attempts=5, quarantine=False):
+    """Write (or update) a folder's dead-letter record; returns the record.
+
+    The folder is quarantined once ``max_attempts`` runs have failed on it,
+    or straight away with ``quarantine``.
+    """
+    now = datetime.now().isoformat()
+    record = {
+        'folder': folder_name,
+        'reason': reason,
+        'error': str(error),
+        'attempts': (previous or {}).get('attempts', 0) + 1,
+        'first_failed_at': (previous or {}).get('first_failed_at', now),
+        'last_failed_at': now
+    }
+    record['quarantined'] = quarantine or record['attempts'] >= max_attempts
+    bucket.blob(record_path(folder_name, record['quarantined'])).upload_from_string(
+        json.dumps(record), content_type='application/json'
+    )
+    if record['quarantined']:
+        bucket.blob(f"{folder_name}/{QUARANTINE_MARKER}").upload_from_string(now)
+        if previous is not None:
+            _delete(bucket, record_path(folder_name))
+    return record
+
+def clear(bucket, folder_name):
+    """Drop a folder's dead-letter record once it has loaded."""
+    _delete(bucket, record_path(folder_name))
+
+def requeue(bucket, folder_name, record):
+    """Give a quarantined folder a fresh retry budget; the next ETL run retries it."""
+    record = dict(record, attempts=0, quarantined=False, requeued_at=datetime.now().isoformat())
+    bucket.blob(record_path(folder_name)).upload_from_string(json.dumps(record), content_type='application/json')
+    _delete(bucket, f"{folder_name}/{QUARANTINE_MARKER}")
+    _delete(bucket, record_path(folder_name, quarantined=True))
+    return record
+
+# Constants for the command line tool
+BUCKET_NAME = 'dataingestion_master'
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="List and requeue complaints the ETL could not load")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    list_parser = subparsers.add_parser('list', help="Show dead-lettered complaints")
+    list_parser.add_argument('--quarantined', action='store_true', help="Only show quarantined complaints")
+    list_parser.add_argument('--json', action='store_true', help="Print the records as JSON")
+    requeue_parser = subparsers.add_parser('requeue', help="Retry quarantined complaints on the next ETL run")
+    requeue_parser.add_argument('folders', nargs='*', help="Complaint folders to requeue")
+    requeue_parser.add_argument('--all', action='store_true', help="Requeue every quarantined complaint")
+    args = parser.parse_args()
+
+    storage_client = storage.Client.from_service_account_json('optical-net-452113-n9-064952459436.json')
+    bucket = storage_client.bucket(BUCKET_NAME)
+    quarantined = load_dead_letters(bucket, quarantined=True)
+
+    if args.command == 'list':
+        records = dict(quarantined) if args.quarantined else dict(load_dead_letters(bucket), **quarantined)
+        shown = [record for _, record in sorted(records.items())]
+        if args.json:
+            print(json.dumps(shown, indent=2))
+            return
+        for record in shown:
+            state = 'quarantined' if record['quarantined'] else 'retrying'
+            print(f"{record['folder']}  {state:<11}  attempts={record['attempts']}  "
+                  f"last={record['last_failed_at']}  {record['reason']}: {record['error']}")
+        logging.info(f"{len(shown)} dead-lettered complaints")
+        return
+
+    folders = sorted(quarantined) if args.all else args.folders
+    requeued = 0
+    for folder_name in folders:
+        if folder_name not in quarantined:
+            logging.warning(f"{folder_name} is not quarantined")
+            continue
+        requeue(bucket, folder_name, quarantined[folder_name])
+        requeued += 1
+        logging.info(f"Requeued {folder_name}")
+    logging.info(f"Requeued {requeued} complaints; the next process_complaints.py run retries them")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+import bisect
+import json
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+
+# Upper bounds (seconds) of the latency histogram buckets, Prometheus style
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+class Histogram:
+    """Fixed-bucket latency histogram; cheap enough to update on every call."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # the last one is +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-quantile (the max for the +Inf bucket)."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return round(min(bound, self.max), 6)
+        return round(self.max, 6)
+
+    def summary(self):
+        return {
+            'count': self.count,
+            'sum_seconds': round(self.sum, 6),
+            'mean_seconds': round(self.sum / self.count, 6) if self.count else 0.0,
+            'p50_seconds': self.quantile(0.5),
+            'p95_seconds': self.quantile(0.95),
+            'p99_seconds': self.quantile(0.99),
+            'max_seconds': round(self.max, 6)
+        }
+
+class RunMetrics:
+    """Per-stage latency histograms and counters for one ETL run.
+
+    ``time(stage)`` (a context manager) or ``observe(stage, seconds)``
+    record a stage's latency; ``count(name, n)`` adds to a counter. Safe to
+    update from every pipeline thread.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.started_at = datetime.now()
+            self._started = time.monotonic()
+            self.stages = {}
+            self.counters = Counter()
+
+    def observe(self, stage, seconds):
+        with self._lock:
+            histogram = self.stages.get(stage)
+            if histogram is None:
+                histogram = self.stages[stage] = Histogram()
+            histogram.observe(seconds)
+
+    @contextmanager
+    def time(self, stage):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - started)
+
+    def count(self, name, n=1):
+        with self._lock:
+            self.counters[name] += n
+
+    def report(self):
+        """The run's metrics as a JSON-serialisable dict."""
+        with self._lock:
+            duration = time.monotonic() - self._started
+            counters = dict(self.counters)
+            stages = {stage: histogram.summary() for stage, histogram in sorted(self.stages.items())}
+        storage_calls = sum(summary['count'] for stage, summary in stages.items() if stage.startswith('storage_'))
+        folders = counters.get('folders_fetched', 0)
+        return {
+            'started_at': self.started_at.isoformat(),
+            'duration_seconds': round(duration, 3),
+            'rows_per_second': round(counters.get('rows_loaded', 0) / duration, 2) if duration else 0.0,
+            'storage_calls': storage_calls,
+            'storage_calls_per_folder': round(storage_calls / folders, 2) if folders else 0.0,
+            'counters': counters,
+            'stages': stages
+        }
+
+    def write_json(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.report(), f, indent=2)
+
+    def to_prometheus(self, prefix='complaint_etl'):
+        """The run's metrics in the Prometheus text exposition format."""
+        report = self.report()
+        lines = [
+            f"# TYPE {prefix}_stage_seconds histogram"
+        ]
+        with self._lock:
+            stages = sorted(self.stages.items())
+            for stage, histogram in stages:
+                cumulative = 0
+                for bound, count in zip(histogram.buckets + ('+Inf',), histogram.counts):
+                    cumulative += count
+                    lines.append(f'{prefix}_stage_seconds_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+                lines.append(f'{prefix}_stage_seconds_sum{{stage="{stage}"}} {histogram.sum}')
+                lines.append(f'{prefix}_stage_seconds_count{{stage="{stage}"}} {histogram.count}')
+        for name, value in sorted(report['counters'].items()):
+            lines.append(f"# TYPE {prefix}_{name}_total counter")
+            lines.append(f"{prefix}_{name}_total {value}")
+        for name in ('duration_seconds', 'rows_per_second', 'storage_calls_per_folder'):
+            lines.append(f"# TYPE {prefix}_{name} gauge")
+            lines.append(f"{prefix}_{name} {report[name]}")
+        return '\n'.join(lines) + '\n'
+
+    def write_prometheus(self, path):
+        with open(path, 'w') as f:
+            f.write(self.to_prometheus())
+
+class InstrumentedBlob:
+    """Blob wrapper that times each storage call and counts bytes downloaded."""
+
+    def __init__(self, blob, metrics):
+        self._blob = blob
+        self._metrics = metrics
+
+    def __getattr__(self, name):
+        return getattr(self._blob, name)
+
+    def download_as_bytes(self, **kwargs):
+        with self._metrics.time('storage_download'):
+            data = self._blob.download_as_bytes(**kwargs)
+        self._metrics.count('bytes_downloaded', len(data))
+        return data
+
+    download_as_string = download_as_bytes
+
+    def download_as_text(self, **kwargs):
+        return self.download_as_bytes(**kwargs).decode('utf-8')
+
+    def exists(self, *args, **kwargs):
+        with self._metrics.time('storage_exists'):
+            return self._blob.exists(*args, **kwargs)
+
+    def upload_from_string(self, *args, **kwargs):
+        with self._metrics.time('storage_upload'):
+            return self._blob.upload_from_string(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        with self._metrics.time('storage_delete'):
+            return self._blob.delete(*args, **kwargs)
+
+class InstrumentedBucket:
+    """Bucket wrapper whose blobs report to ``metrics``; everything else passes through."""
+
+    def __init__(self, bucket, metrics):
+        self._bucket = bucket
+        self._metrics = metrics
+
+    def __getattr__(self, name):
+        return getattr(self._bucket, name)
+
+    def blob(self, *args, **kwargs):
+        return InstrumentedBlob(self._bucket.blob(*args, **kwargs), self._metrics)
+
+    def get_blob(self, *args, **kwargs):
+        with self._metrics.time('storage_get_blob'):
+            blob = self._bucket.get_blob(*args, **kwargs)
+        return None if blob is None else InstrumentedBlob(blob, self._metrics)
@@ -0,0 +1,164 @@
+import math
+
+# Cells are CELL_PIXELS square on screen at the zoom they are requested
+# for, using the same Web Mercator tiling as Google Maps (256px tiles), so
+# the number of cells returned depends on the viewport size, not on how
+# many complaints fall inside it.
+TILE_PIXELS = 256
+CELL_PIXELS = 32
+CELLS_PER_TILE = TILE_PIXELS // CELL_PIXELS
+# Zoom levels up to this one are fully pre-aggregated; deeper zooms are
+# aggregated on the fly from the raw points kept in the finest cells
+MAX_GRID_ZOOM = 14
+MAX_ZOOM = 21
+# Upper bound on cells per response; larger requests are answered at a
+# coarser zoom
+MAX_CELLS = 4096
+MAX_LATITUDE = 85.05112878
+
+STATUS_WEIGHTS = {
+    'pending': 1.0,
+    'in-progress': 0.6,
+    'resolved': 0.2
+}
+PRIORITY_WEIGHTS = {
+    'High': 3.0,
+    'Medium': 2.0,
+    'Normal': 1.0
+}
+
+def project(latitude, longitude):
+    """Project a coordinate to Web Mercator world space, both axes in [0, 1)."""
+    latitude = max(-MAX_LATITUDE, min(MAX_LATITUDE, latitude))
+    x = (longitude + 180.0) / 360.0
+    sin_lat = math.sin(math.radians(latitude))
+    y = 0.5 - math.log((1 + sin_lat) / (1 - sin_lat)) / (4 * math.pi)
+    return min(max(x, 0.0), 1 - 1e-12), min(max(y, 0.0), 1 - 1e-12)
+
+def cells_across(zoom):
+    return (1 << zoom) * CELLS_PER_TILE
+
+def parse_bbox(value):
+    """Parse ``south,west,north,east`` (LatLngBounds.toUrlValue order)."""
+    south, west, north, east = (float(part) for part in value.split(','))
+    if not all(math.isfinite(part) for part in (south, west, north, east)):
+        raise ValueError("bbox coordinates must be finite numbers")
+    if south > north:
+        raise ValueError("bbox south must not be greater than north")
+    return south, west, north, east
+
+class GeoGrid:
+    """Pyramid of per-cell complaint aggregates over Web Mercator grid cells.
+
+    Each cell stores ``[count, status_weight, priority_weight, sum_lat, sum_lng]``
+    so a query only touches the cells inside the viewport.
+    """
+
+    def __init__(self, points):
+        self.levels = [{} for _ in range(MAX_GRID_ZOOM + 1)]
+        self.finest_points = {}
+        self.total = 0
+        for point in points:
+            if point.get('status') == 'withdrawn':
+                continue
+            location = point.get('location') or {}
+            try:
+                latitude = float(location['latitude'])
+                longitude = float(location['longitude'])
+            except (KeyError, TypeError, ValueError):
+                continue
+            self._add(point, latitude, longitude)
+
+    def _add(self, point, latitude, longitude):
+        x, y = project(latitude, longitude)
+        status_weight = STATUS_WEIGHTS.get(point.get('status'), 1.0)
+        priority_weight = PRIORITY_WEIGHTS.get(point.get('priority'), 1.0)
+        entry = (x, y, latitude, longitude, status_weight, priority_weight)
+        for zoom, cells in enumerate(self.levels):
+            n = cells_across(zoom)
+            key = (int(x * n), int(y * n))
+            cell = cells.get(key)
+            if cell is None:
+                cells[key] = [1, status_weight, priority_weight, latitude, longitude]
+            else:
+                cell[0] += 1
+                cell[1] += status_weight
+                cell[2] += priority_weight
+                cell[3] += latitude
+                cell[4] += longitude
+        self.finest_points.setdefault(key, []).append(entry)
+        self.total += 1
+
+    @staticmethod
+    def _cell_ranges(zoom, south, west, north, east):
+        n = cells_across(zoom)
+        x0, y1 = project(south, west)
+        x1, y0 = project(north, east)
+        ys = range(int(y0 * n), int(y1 * n) + 1)
+        if west <= east:
+            xs = [range(int(x0 * n), int(x1 * n) + 1)]
+        else:
+            # Viewport crosses the antimeridian
+            xs = [range(int(x0 * n), n), range(0, int(x1 * n) + 1)]
+        return xs, ys
+
+    def query(self, bbox, zoom, weight='status'):
+        """Return aggregated cells for the viewport ``bbox`` at map zoom ``zoom``."""
+        south, west, north, east = bbox
+        weight_index = 2 if weight == 'priority' else 1
+        zoom = max(0, min(MAX_ZOOM, int(zoom)))
+
+        # Fall back to coarser cells if the viewport would need too many
+        while True:
+            xs, ys = self._cell_ranges(zoom, south, west, north, east)
+            if zoom == 0 or sum(len(r) for r in xs) * len(ys) <= MAX_CELLS:
+                break
+            zoom -= 1
+
+        if zoom <= MAX_GRID_ZOOM:
+            cells = self.levels[zoom]
+            found = [cells[(ix, iy)] for xr in xs for ix in xr for iy in ys if (ix, iy) in cells]
+        else:
+            found = self._aggregate_fine(zoom, south, west, north, east)
+
+        return {
+            'zoom': zoom,
+            'cell_pixels': CELL_PIXELS,
+            'weight': 'priority' if weight_index == 2 else 'status',
+            'cells': [
+                {
+                    'lat': cell[3] / cell[0],
+                    'lng': cell[4] / cell[0],
+                    'count': cell[0],
+                    'weight': round(cell[weight_index], 3)
+                }
+                for cell in found
+            ]
+        }
+
+    def _aggregate_fine(self, zoom, south, west, north, east):
+        """Aggregate raw points for zooms deeper than the pre-computed pyramid."""
+        xs, ys = self._cell_ranges(MAX_GRID_ZOOM, south, west, north, east)
+        n = cells_across(zoom)
+        cells = {}
+        for xr in xs:
+            for ix in xr:
+                for iy in ys:
+                    for x, y, latitude, longitude, status_weight, priority_weight in self.finest_points.get((ix, iy), ()):
+                        if not (south <= latitude <= north):
+                            continue
+                        if west <= east and not (west <= longitude <= east):
+                            continue
+                        if west > east and east < longitude < west:
+                            continue
+                        key = (int(x * n), int(y * n))
+                        cell = cells.get(key)
+                        if cell is None:
+                            cells[key] = [1, status_weight, priority_weight, latitude, longitude]
+                        else:
+                            cell[0] += 1
+                            cell[1] += status_weight
+                            cell[2] += priority_weight
+                            cell[3] += latitude
+                            cell[4] += longitude
+        return list(cells.values())
@@ -2,11 +2,10 @@ import os
 from flask import Flask, request, render_template, flash, redirect, url_for, session, send_from_directory
 from werkzeug.utils import secure_filename
 import json
-import hashlib
 from datetime import datetime, timedelta
-import base64
 import uuid
 from functools import wraps
+from password_hashing import PasswordHasher
 
 app = Flask(__name__)
 app.secret_key = os.environ.get('SECRET_KEY', os.urandom(24))
@@ -23,6 +22,11 @@ USERS_FILE = os.path.join(DATA_FOLDER, 'users.json')
 COMPLAINTS_FOLDER = os.path.join(DATA_FOLDER, 'complaints')
 UPLOADS_FOLDER = os.path.join(DATA_FOLDER, 'uploads')
 
+# Maximum photo size; larger requests are refused before they are read
+MAX_PHOTO_BYTES = 5 * 1024 * 1024
+app.config['MAX_CONTENT_LENGTH'] = MAX_PHOTO_BYTES + 1024 * 1024
+ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
+
 # Create necessary folders
 for folder in [DATA_FOLDER, COMPLAINTS_FOLDER, UPLOADS_FOLDER]:
     if not os.path.exists(folder):
@@ -34,8 +38,13 @@ if not os.path.exists(USERS_FILE):
         json.dump({}, f)
 
 # User Authentication functions
+password_hasher = PasswordHasher(
+    os.getenv('PASSWORD_HASH_SCHEME', 'pbkdf2_sha256'),
+    int(os.getenv('PASSWORD_HASH_COST', 0)) or None
+)
+
 def hash_password(password):
-    return hashlib.sha256(password.encode()).hexdigest()
+    return password_hasher.hash(password)
 
 def get_users():
     try:
@@ -77,9 +86,13 @@ def login_user(username, password):
     if username not in users:
         return False, "User not found"
     
-    hashed_password = hash_password(password)
-    if users[username]['password'] != hashed_password:
+    matches, needs_rehash = password_hasher.verify(password, users[username]['password'])
+    if not matches:
         return False, "Invalid password"
+    if needs_rehash:
+        # Replace the legacy unsalted hash now that we know the password
+        users[username]['password'] = hash_password(password)
+        save_users(users)
     
     return True, "Login successful"
 
@@ -97,7 +110,10 @@ def generate_unique_folder_name():
     unique_id = str(uuid.uuid4())[:8]
     return f"complaint_{timestamp}_{unique_id}"
 
-def save_complaint(username, text=None, photo_data=None, location_data=None):
+def allowed_file(filename):
+    return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
+
+def save_complaint(username, text=None, photo_file=None, location_data=None):
     folder_name = generate_unique_folder_name()
     complaint_folder = os.path.join(COMPLAINTS_FOLDER, folder_name)
     os.makedirs(complaint_folder)
@@ -114,13 +130,10 @@ def save_complaint(username, text=None, photo_data=None, location_data=None):
             f.write(text)
         complaint_data['has_text'] = True
     
-    # Save photo
-    if photo_data:
+    # Save photo, copied in chunks from the uploaded file
+    if photo_file:
         try:
-            photo_data = photo_data.split(',')[1]
-            photo_bytes = base64.b64decode(photo_data)
-            with open(os.path.join(complaint_folder, 'photo.jpg'), 'wb') as f:
-                f.write(photo_bytes)
+            photo_file.save(os.path.join(complaint_folder, 'photo.jpg'))
             complaint_data['has_photo'] = True
         except Exception as e:
             print(f"Error saving photo: {str(e)}")
@@ -265,13 +278,20 @@ def submit_complaint():
     if request.method == 'POST':
         try:
             text = request.form.get('text')
-            photo = request.form.get('photo')
+            photo = request.files.get('photo')
             location = request.form.get('location')
             
+            if photo is not None and not photo.filename:
+                photo = None
+            
             if not text and not photo:
                 flash('Please provide complaint details')
                 return redirect(request.url)
             
+            if photo and not allowed_file(photo.filename):
+                flash('Photo must be a PNG, JPEG or GIF image')
+                return redirect(request.url)
+            
             save_complaint(session['username'], text, photo, location)
             flash('Complaint submitted successfully')
             return redirect(url_for('dashboard'))
@@ -281,6 +301,11 @@ def submit_complaint():
     
     return render_template('submit_complaint.html')
 
+@app.errorhandler(413)
+def request_too_large(e):
+    flash('Upload too large. Photos must be at most 5MB')
+    return redirect(url_for('submit_complaint'))
+
 # Route to serve photos
 @app.route('/complaints/<folder>/<filename>')
 @login_required
@@ -27,14 +27,18 @@ def process_complaint(event, context):
         file_name = event['name']
         folder_prefix = file_name.rsplit('/', 1)[0] + '/'
         
-        # Read metadata
-        metadata = read_json_from_gcs(BUCKET_NAME, folder_prefix + "metadata.json")
+        # Read the consolidated record first, then fall back to the legacy blobs
+        record = read_json_from_gcs(BUCKET_NAME, folder_prefix + "complaint.json")
+        if record:
+            metadata = record.get('metadata')
+            location = record.get('location')
+        else:
+            metadata = read_json_from_gcs(BUCKET_NAME, folder_prefix + "metadata.json")
+            location = read_json_from_gcs(BUCKET_NAME, folder_prefix + "location.json")
+        
         if not metadata:
             print(f"No metadata found for {folder_prefix}")
             return
-            
-        # Read location data if available
-        location = read_json_from_gcs(BUCKET_NAME, folder_prefix + "location.json")
         
         # Read label data if available
         label = read_json_from_gcs(BUCKET_NAME, folder_prefix + "label.json")
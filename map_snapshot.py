@@ -0,0 +1,134 @@
+import gzip
+import hashlib
+import json
+import threading
+import time
+
+# How long a worker keeps telling delta clients about a point that is gone
+TOMBSTONE_RETENTION_SECONDS = 24 * 60 * 60
+
+class MapSnapshot:
+    """Periodically refreshed, pre-serialised view of every complaint map point.
+
+    ``load_points`` returns the full list of points, including withdrawn
+    ones, each with ``id``, ``status``, ``timestamp``, ``changed_at`` and
+    ``version``, the storage generation of the newest file the point was
+    read from. All requests share the latest snapshot: the first one
+    builds it, and once it is older than ``refresh_interval`` seconds a
+    single background thread rebuilds it while requests keep being served
+    the previous one.
+
+    ``cursor`` is the highest version in the snapshot and ``delta(cursor)``
+    returns the points with a higher one. Versions come from the bucket,
+    so every worker hands out the same cursor for the same data and a
+    cursor from one is understood by the others. Points that disappear
+    (folder deleted, location removed) are sent as ``{'id', 'status':
+    'removed'}`` tombstones for TOMBSTONE_RETENTION_SECONDS by the workers
+    that had them.
+    """
+
+    def __init__(self, load_points, refresh_interval=60):
+        self.load_points = load_points
+        self.refresh_interval = refresh_interval
+        self.body = None
+        self.gzip_body = None
+        self.etag = None
+        self.cursor = ''
+        self.built_at = 0
+        self._points = []
+        # point id -> version, and removed point id -> (cursor when noticed, monotonic time)
+        self._versions = {}
+        self._tombstones = {}
+        self._lock = threading.Lock()
+        self._refreshing = False
+
+    def _build(self):
+        points = self.load_points()
+        active = [point for point in points if point.get('status') != 'withdrawn']
+        body = json.dumps([self._public(point) for point in active]).encode('utf-8')
+
+        with self._lock:
+            versions = {point['id']: point.get('version') or 0 for point in points}
+            newest = max(versions.values(), default=0)
+            now = time.monotonic()
+            tombstones = {
+                point_id: removed for point_id, removed in self._tombstones.items()
+                if point_id not in versions and now - removed[1] < TOMBSTONE_RETENTION_SECONDS
+            }
+            # A deletion leaves no generation behind, so the removal is
+            # stamped with the cursor (never lower than before, in case the
+            # newest point is the one removed); delta() sends it to clients
+            # already at that cursor too
+            removed_at = max(newest, int(self.cursor or 0))
+            for point_id in self._versions.keys() - versions.keys():
+                tombstones.setdefault(point_id, (removed_at, now))
+            newest = max([newest] + [version for version, _ in tombstones.values()])
+            self._versions = versions
+            self._tombstones = tombstones
+            self._points = sorted(points, key=lambda point: (versions[point['id']], point['id']))
+            self.body = body
+            self.gzip_body = gzip.compress(body)
+            self.etag = hashlib.sha1(body).hexdigest()
+            self.cursor = str(newest)
+            self.built_at = now
+
+    def _refresh_in_background(self):
+        try:
+            self._build()
+        except Exception as e:
+            print(f"Error refreshing map snapshot: {str(e)}")
+        finally:
+            with self._lock:
+                self._refreshing = False
+
+    def current(self):
+        """Make sure a snapshot exists and schedule a refresh if it has gone stale."""
+        if self.body is None:
+            with self._lock:
+                building = self._refreshing
+                self._refreshing = True
+            if not building:
+                self._refresh_in_background()
+            while self.body is None and self._refreshing:
+                time.sleep(0.05)
+            return self
+
+        if time.monotonic() - self.built_at >= self.refresh_interval:
+            with self._lock:
+                start = not self._refreshing
+                self._refreshing = True
+            if start:
+                threading.Thread(target=self._refresh_in_background, daemon=True).start()
+        return self
+
+    def points(self):
+        """Return ``(etag, points)`` of the current snapshot, withdrawn points included."""
+        with self._lock:
+            return self.etag, self._points
+
+    def mark_stale(self):
+        """Force the next request to trigger a refresh (e.g. after a submission)."""
+        self.built_at = 0
+
+    def delta(self, since):
+        """Return the points changed after cursor ``since``, withdrawn and removed ones included.
+
+        An unreadable cursor gets every point.
+        """
+        since_version = int(since) if since.isdigit() else 0
+        with self._lock:
+            points = self._points
+            versions = self._versions
+            tombstones = self._tombstones
+        changed = [self._public(point, include_changed=True) for point in points
+                   if versions[point['id']] > since_version]
+        changed.extend({'id': point_id, 'status': 'removed'}
+                       for point_id, (version, _) in sorted(tombstones.items()) if version >= since_version)
+        return json.dumps(changed).encode('utf-8')
+
+    @staticmethod
+    def _public(point, include_changed=False):
+        public = {key: value for key, value in point.items() if key not in ('changed_at', 'version')}
+        if include_changed:
+            public['changed_at'] = point['changed_at']
+        return public
@@ -0,0 +1,58 @@
+import os
+import argparse
+from google.cloud import storage
+from google.api_core import exceptions
+import logging
+import complaint_store
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Set up Google Cloud clients
+storage_client = storage.Client.from_service_account_json('optical-net-452113-n9-064952459436.json')
+
+# Constants
+BUCKET_NAME = os.getenv('BUCKET_NAME', 'dataingestion_master')
+
+def migrate_folder(bucket, folder_name, inventory, dry_run=False):
+    """Convert one legacy complaint folder into a consolidated complaint.json."""
+    record = complaint_store.load_legacy_record(bucket, folder_name, inventory=inventory)
+    if record['metadata'] is None:
+        logging.warning(f"Skipping {folder_name}: no metadata.json")
+        return False
+    if dry_run:
+        logging.info(f"Would migrate {folder_name}")
+        return True
+    try:
+        # Only create the bundle if nobody wrote one in the meantime
+        complaint_store.save_complaint_record(bucket, folder_name, record, if_generation_match=0)
+    except exceptions.PreconditionFailed:
+        logging.info(f"{folder_name} already has a bundle, skipping")
+        return False
+    logging.info(f"Migrated {folder_name}")
+    return True
+
+def migrate_complaint_bundles(dry_run=False):
+    """Write complaint.json for every complaint folder that still uses the legacy layout."""
+    bucket = storage_client.bucket(BUCKET_NAME)
+    folders = complaint_store.list_complaint_folders(bucket)
+    logging.info(f"Found {len(folders)} complaint folders")
+
+    migrated_count = 0
+    for folder_name, inventory in sorted(folders.items()):
+        if complaint_store.BUNDLE_FILE in inventory:
+            continue
+        try:
+            if migrate_folder(bucket, folder_name, inventory, dry_run):
+                migrated_count += 1
+        except Exception as e:
+            logging.error(f"Error migrating {folder_name}: {str(e)}")
+
+    logging.info(f"Migrated {migrated_count} complaint folders")
+    return migrated_count
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert legacy complaint folders to complaint.json bundles")
+    parser.add_argument('--dry-run', action='store_true', help="Only report which folders would be migrated")
+    args = parser.parse_args()
+    migrate_complaint_bundles(args.dry_run)
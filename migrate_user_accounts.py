@@ -0,0 +1,31 @@
+import os
+from google.cloud import storage
+import logging
+from user_auth import UserAuth
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Set up Google Cloud clients
+storage_client = storage.Client.from_service_account_json('optical-net-452113-n9-064952459436.json')
+
+# Constants (accounts live in the web app's bucket)
+BUCKET_NAME = os.getenv('BUCKET_NAME', 'mastertest_1')
+
+def migrate_user_accounts():
+    """Split users/users.json into one account record per user.
+
+    The web app runs the same migration in the background at startup and
+    reads users.json for accounts it has not copied yet, so this can run
+    while the app is serving.
+    """
+    user_auth = UserAuth(storage_client, BUCKET_NAME)
+    if not user_auth.users_blob.exists():
+        logging.info("No users.json found, nothing to migrate")
+        return 0
+    migrated_count = user_auth.migrate_legacy_users()
+    logging.info(f"Migrated {migrated_count} user accounts")
+    return migrated_count
+
+if __name__ == "__main__":
+    migrate_user_accounts()
@@ -0,0 +1,87 @@
+import base64
+import hashlib
+import hmac
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+# Stored hashes look like "<scheme>$<cost>$<salt>$<hash>" (salt and hash
+# base64). Records written before salted hashing are a bare unsalted
+# SHA-256 hex digest; they still verify and are flagged for rehashing.
+SALT_BYTES = 16
+DEFAULT_SCHEME = 'pbkdf2_sha256'
+DEFAULT_COSTS = {
+    'pbkdf2_sha256': 600000,  # iterations
+    'scrypt': 15  # log2 of the scrypt N parameter
+}
+SCRYPT_R = 8
+SCRYPT_P = 1
+
+def _b64encode(data):
+    return base64.b64encode(data).decode('ascii').rstrip('=')
+
+def _b64decode(text):
+    return base64.b64decode(text + '=' * (-len(text) % 4))
+
+def derive(scheme, cost, password, salt):
+    """Run the KDF; module level so it can run in a worker process."""
+    password = password.encode('utf-8')
+    if scheme == 'pbkdf2_sha256':
+        return hashlib.pbkdf2_hmac('sha256', password, salt, cost)
+    if scheme == 'scrypt':
+        n = 1 << cost
+        return hashlib.scrypt(password, salt=salt, n=n, r=SCRYPT_R, p=SCRYPT_P,
+                              maxmem=256 * n * SCRYPT_R, dklen=32)
+    raise ValueError(f"Unknown password hash scheme: {scheme}")
+
+def is_legacy_hash(stored):
+    return '$' not in stored
+
+class PasswordHasher:
+    """Salted slow password hashing run on a bounded pool.
+
+    ``workers`` caps how many hashes are computed at once, so a login burst
+    queues on the pool instead of piling CPU-bound work onto every request
+    thread. The hashlib KDFs release the GIL, so threads run them in
+    parallel; ``use_processes`` moves them to worker processes instead.
+    """
+
+    def __init__(self, scheme=DEFAULT_SCHEME, cost=None, workers=4, use_processes=False):
+        if scheme not in DEFAULT_COSTS:
+            raise ValueError(f"Unknown password hash scheme: {scheme}")
+        self.scheme = scheme
+        self.cost = cost or DEFAULT_COSTS[scheme]
+        if use_processes:
+            self._executor = ProcessPoolExecutor(max_workers=workers)
+        else:
+            self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='password-hash')
+
+    def _derive(self, scheme, cost, password, salt):
+        return self._executor.submit(derive, scheme, cost, password, salt).result()
+
+    def hash(self, password):
+        """Return a new salted hash of ``password`` with the configured scheme and cost."""
+        salt = os.urandom(SALT_BYTES)
+        digest = self._derive(self.scheme, self.cost, password, salt)
+        return f"{self.scheme}${self.cost}${_b64encode(salt)}${_b64encode(digest)}"
+
+    def verify(self, password, stored):
+        """Check ``password`` against a stored hash.
+
+        Returns ``(matches, needs_rehash)``; ``needs_rehash`` is True when the
+        hash is a legacy SHA-256 digest or uses another scheme or cost.
+        """
+        if is_legacy_hash(stored):
+            legacy = hashlib.sha256(password.encode('utf-8')).hexdigest()
+            return hmac.compare_digest(legacy, stored), True
+        try:
+            scheme, cost, salt, digest = stored.split('$')
+            cost = int(cost)
+            salt = _b64decode(salt)
+            digest = _b64decode(digest)
+        except ValueError:
+            return False, False
+        matches = hmac.compare_digest(self._derive(scheme, cost, password, salt), digest)
+        return matches, (scheme, cost) != (self.scheme, self.cost)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
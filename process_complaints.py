@@ -1,36 +1,118 @@
 import os
 import json
+import argparse
 import datetime
+import itertools
+import queue
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from google.cloud import storage, bigquery
+from google.api_core import exceptions
 import logging
+import complaint_store
+import etl_dead_letter
+import etl_metrics
+# Shared with the table/ Cloud Function, which is deployed from that directory
+from table import sinks
+from table.bulk_load import MAX_FILE_BYTES, BigQueryLoadJobLoader, BulkLoadSink, SinkLoader
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
-# Set up Google Cloud clients
-storage_client = storage.Client.from_service_account_json('optical-net-452113-n9-064952459436.json')
-bigquery_client = bigquery.Client.from_service_account_json('optical-net-452113-n9-064952459436.json')
+# Google Cloud clients are created on first use, so the script can be
+# imported (and run against a local sink) without credentials
+SERVICE_ACCOUNT_FILE = 'optical-net-452113-n9-064952459436.json'
+storage_client = None
+bigquery_client = None
+
+# Stage latencies and counters of the current run (see etl_metrics); every
+# storage call made through get_bucket is timed
+metrics = etl_metrics.RunMetrics()
+
+# Worker threads each create their own clients once and reuse them for every
+# folder they process; the main thread uses the module-level clients
+_worker_clients = threading.local()
+
+def get_storage_client():
+    global storage_client
+    if threading.current_thread() is threading.main_thread():
+        if storage_client is None:
+            storage_client = storage.Client.from_service_account_json(SERVICE_ACCOUNT_FILE)
+        return storage_client
+    if not hasattr(_worker_clients, 'storage'):
+        _worker_clients.storage = storage.Client.from_service_account_json(SERVICE_ACCOUNT_FILE)
+    return _worker_clients.storage
+
+def get_bigquery_client():
+    global bigquery_client
+    if threading.current_thread() is threading.main_thread():
+        if bigquery_client is None:
+            bigquery_client = bigquery.Client.from_service_account_json(SERVICE_ACCOUNT_FILE)
+        return bigquery_client
+    if not hasattr(_worker_clients, 'bigquery'):
+        _worker_clients.bigquery = bigquery.Client.from_service_account_json(SERVICE_ACCOUNT_FILE)
+    return _worker_clients.bigquery
+
+def get_bucket(bucket_name=None):
+    """The bucket, wrapped so its storage calls are recorded in ``metrics``."""
+    return etl_metrics.InstrumentedBucket(get_storage_client().bucket(bucket_name or BUCKET_NAME), metrics)
 
 # Constants
 BUCKET_NAME = 'dataingestion_master'
 BIGQUERY_TABLE_ID = 'optical-net-452113-n9.Grievance.extract'
 PROCESSED_MARKER = 'processed_for_bigquery.txt'
+# Rows are streamed to BigQuery in batches of up to BATCH_SIZE, or once the
+# oldest queued row has waited BATCH_MAX_AGE seconds
+BATCH_SIZE = 500
+BATCH_MAX_AGE = 10.0
+# Items waiting between two pipeline stages; a full queue makes the stage
+# before it wait, so memory stays flat however many folders are listed
+STAGE_QUEUE_SIZE = 1000
+# Transient storage errors are retried RETRY_ATTEMPTS times within a run,
+# with exponential backoff. A folder that still fails gets a dead-letter
+# record and is retried on later runs, until DEAD_LETTER_MAX_ATTEMPTS runs
+# have failed on it; it is then quarantined and skipped (see etl_dead_letter)
+RETRY_ATTEMPTS = 3
+RETRY_BASE_DELAY = 0.5
+RETRY_MAX_DELAY = 8.0
+DEAD_LETTER_MAX_ATTEMPTS = 5
+# Where rows are written: 'bigquery' (the default), or a local 'sqlite' or
+# 'ndjson' file at COMPLAINT_SINK_PATH for running and profiling offline
+SINK_CONFIG = {
+    'SINK_TYPE': os.getenv('COMPLAINT_SINK', 'bigquery'),
+    'SINK_PATH': os.getenv('COMPLAINT_SINK_PATH'),
+    'TABLE_ID': BIGQUERY_TABLE_ID
+}
+# Bulk mode stages rows in gzipped newline-delimited JSON files here and
+# loads each file with one load job instead of streaming inserts
+BULK_LOAD_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'bulk_load')
+# Checkpoint of the newest complaint folder seen by a run. The next run lists
+# from LOOKBACK_MINUTES before it, so folders whose files arrive late (or
+# whose processing failed) are picked up again while inside the window.
+# The window is by the time in the folder name: folders uploaded later than
+# that (the submission queue flags anything over 15 minutes late, see
+# complaint_store.LATE_ARRIVAL_PREFIX) are read from the late-arrival list,
+# and failed ones are retried from their dead-letter records.
+STATE_BLOB = 'etl_state/process_complaints.json'
+LOOKBACK_MINUTES = 60
 
 def blob_exists(bucket_name, source_blob_name):
     """Check if a blob exists in the bucket."""
-    bucket = storage_client.bucket(bucket_name)
+    bucket = get_bucket(bucket_name)
     blob = bucket.blob(source_blob_name)
     return blob.exists()
 
 def download_blob(bucket_name, source_blob_name):
     """Download a blob's content as text."""
-    bucket = storage_client.bucket(bucket_name)
+    bucket = get_bucket(bucket_name)
     blob = bucket.blob(source_blob_name)
     return blob.download_as_text()
 
 def upload_blob(bucket_name, source_string, destination_blob_name):
     """Upload a string to a blob."""
-    bucket = storage_client.bucket(bucket_name)
+    bucket = get_bucket(bucket_name)
     blob = bucket.blob(destination_blob_name)
     blob.upload_from_string(source_string)
 
@@ -94,218 +176,520 @@ def extract_label_prediction(label_data):
         logging.warning(f"Error extracting label prediction: {str(e)}")
         return {'class': 'Error', 'confidence': 0}
 
-def get_table_schema(table_id):
-    """Get the schema of an existing BigQuery table."""
+def mark_processed(folder_name):
+    """Write the processed marker once a complaint's row is in BigQuery."""
     try:
-        table = bigquery_client.get_table(table_id)
-        return [field.name for field in table.schema]
+        upload_blob(BUCKET_NAME, datetime.datetime.now().isoformat(), f"{folder_name}/{PROCESSED_MARKER}")
     except Exception as e:
-        logging.error(f"Error getting table schema: {str(e)}")
-        # Return a minimal set of fields that should exist
-        return ["complaint_id", "user_id", "description", "status"]
+        logging.error(f"Error writing processed marker for {folder_name}: {str(e)}")
+        return False
+    logging.info(f"Successfully processed complaint {folder_name}")
+    return True
+
+def log_insert_failure(folder_name, errors):
+    logging.error(f"Failed to insert complaint {folder_name} into BigQuery: {errors}")
 
-def insert_into_bigquery(row, table_id):
-    """Insert a row into BigQuery, filtering out fields that don't exist in the schema."""
+def create_sink(batch_size=BATCH_SIZE, batch_max_age=BATCH_MAX_AGE, on_success=mark_processed,
+                on_failure=log_insert_failure, on_batch=None):
+    """Batched sink (chosen by SINK_CONFIG) that marks each complaint processed once its row is stored."""
+    return sinks.create_sink(
+        SINK_CONFIG,
+        get_bigquery_client,
+        max_rows=batch_size,
+        max_age=batch_max_age,
+        on_success=on_success,
+        on_failure=on_failure,
+        on_batch=on_batch
+    )
+
+def create_bulk_sink(loader=None, directory=None, max_file_bytes=MAX_FILE_BYTES,
+                     on_success=mark_processed, on_failure=log_insert_failure, on_batch=None):
+    """File-staged sink for backfills.
+
+    ``loader`` defaults to a BigQuery load job per file, or for a local
+    SINK_CONFIG sink to writing each file's rows into that sink.
+    """
+    if loader is None:
+        if (SINK_CONFIG.get('SINK_TYPE') or 'bigquery') == 'bigquery':
+            loader = BigQueryLoadJobLoader(get_bigquery_client(), BIGQUERY_TABLE_ID)
+        else:
+            loader = SinkLoader(sinks.create_sink(SINK_CONFIG, get_bigquery_client, max_rows=BATCH_SIZE))
+    return BulkLoadSink(loader, directory or BULK_LOAD_DIR, max_file_bytes, on_success=on_success,
+                        on_failure=on_failure, on_batch=on_batch)
+
+def with_retries(func, *args):
+    """Call ``func``, retrying transient errors with exponential backoff and jitter."""
+    for attempt in range(RETRY_ATTEMPTS):
+        try:
+            return func(*args)
+        except Exception as e:
+            if attempt == RETRY_ATTEMPTS - 1 or etl_dead_letter.classify_error(e) != 'transient':
+                raise
+            delay = min(RETRY_BASE_DELAY * 2 ** attempt, RETRY_MAX_DELAY) * random.uniform(0.5, 1)
+            logging.warning(f"Transient error ({str(e)}), retrying in {delay:.1f}s")
+            metrics.count('transient_retries')
+            time.sleep(delay)
+
+def has_file(folder_name, file_name, inventory=None):
+    """Check for a file in a complaint folder, using the folder's listing when we have it."""
+    if inventory is not None:
+        return file_name in inventory
+    return blob_exists(BUCKET_NAME, f"{folder_name}/{file_name}")
+
+def fetch_complaint(folder_name, inventory=None):
+    """Download what a complaint's BigQuery row is built from.
+
+    ``inventory`` is the folder's file listing; with it no existence checks
+    are made, only the files present are downloaded. Returns None if the
+    complaint is already processed; raises IncompleteComplaint if its
+    required data is missing and InvalidComplaint if it is malformed.
+    """
+    # Check if this complaint has already been processed
+    if has_file(folder_name, PROCESSED_MARKER, inventory):
+        logging.info(f"Complaint {folder_name} already processed, skipping")
+        return None
+    
+    # Define file paths
+    extract_path = f"{folder_name}/complaint_extract.json"
+    label_path = f"{folder_name}/label.json"
+    
+    # Load the complaint record (one GET for complaint.json, or the legacy blobs)
+    record = complaint_store.load_complaint_record(get_bucket(), folder_name,
+                                                   inventory=inventory)
+    
+    # Check if required data exists
+    for field, name in (('metadata', 'metadata'), ('location', 'location'), ('text', 'complaint text')):
+        if record[field] is None:
+            raise etl_dead_letter.IncompleteComplaint(f"Required data not found: {folder_name} {name}")
+    for field in ('metadata', 'location'):
+        if not isinstance(record[field], dict):
+            raise etl_dead_letter.InvalidComplaint(f"Invalid {field} in {folder_name}: {record[field]!r}")
+    
+    # Load text analysis results
+    extract = {}
     try:
-        # Get the existing table schema
-        schema_fields = get_table_schema(table_id)
-        
-        # Filter the row to only include fields that exist in the schema
-        filtered_row = {k: v for k, v in row.items() if k in schema_fields}
-        
-        # Log what fields were removed
-        removed_fields = set(row.keys()) - set(filtered_row.keys())
-        if removed_fields:
-            logging.warning(f"Removed fields not in schema: {removed_fields}")
-        
-        errors = bigquery_client.insert_rows_json(table_id, [filtered_row])
-        if errors:
-            logging.error(f"BigQuery insert errors: {errors}")
-            raise RuntimeError(f"BigQuery insert errors: {errors}")
-        logging.info(f"Successfully inserted data into BigQuery table {table_id}")
-        return True
+        if has_file(folder_name, 'complaint_extract.json', inventory):
+            content = download_blob(BUCKET_NAME, extract_path)
+            with metrics.time('json_parse'):
+                extract = json.loads(content)
+            logging.info(f"Text analysis results loaded for {folder_name}")
+        else:
+            logging.warning(f"Text analysis file not found: {extract_path}")
     except Exception as e:
-        logging.error(f"Error inserting into BigQuery: {str(e)}")
-        return False
+        if etl_dead_letter.classify_error(e) == 'transient':
+            raise
+        logging.warning(f"Could not load text analysis results: {str(e)}")
+    
+    # Load image analysis results
+    label_data = None
+    try:
+        if has_file(folder_name, 'label.json', inventory):
+            content = download_blob(BUCKET_NAME, label_path)
+            with metrics.time('json_parse'):
+                label_data = json.loads(content)
+            if isinstance(label_data, list):
+                label_data = label_data[0] if label_data else {}
+            logging.info(f"Image analysis results loaded for {folder_name}")
+        else:
+            logging.warning(f"Image analysis file not found: {label_path}")
+    except Exception as e:
+        if etl_dead_letter.classify_error(e) == 'transient':
+            raise
+        logging.warning(f"Could not load image analysis results: {str(e)}")
+    
+    return {'record': record, 'extract': extract, 'label_data': label_data}
 
-def process_complaint(folder_name):
-    """Process a complaint folder and insert data into BigQuery."""
+def build_row(folder_name, fetched):
+    """Build a complaint's BigQuery row from the data fetch_complaint downloaded."""
+    record = fetched['record']
+    extract = fetched['extract']
+    label_data = fetched['label_data']
+    metadata = record['metadata']
+    location = record['location']
+    complaint_text = record['text']
+    photo_path = f"{folder_name}/photo.jpg"
+    
+    # Get timestamp from metadata if meta.json doesn't exist
+    timestamp = datetime.datetime.now().isoformat()
+    if record['meta']:
+        timestamp = record['meta'].get("timestamp", timestamp)
+    else:
+        # Use timestamp from metadata.json if available
+        timestamp = metadata.get("timestamp", timestamp)
+    
+    # Extract label prediction
+    label_prediction = {'class': 'No label', 'confidence': 0}
+    if label_data is not None:
+        with metrics.time('label_prediction'):
+            label_prediction = extract_label_prediction(label_data)
+        logging.info(f"Extracted label prediction: {label_prediction}")
+    else:
+        label_data = {}
+    
+    # Extract issue type from text analysis
+    issue_types = extract.get("Issue Type", [])
+    issue_type = issue_types[0] if issue_types else "Unknown"
+    
+    # Determine department based on issue type
+    department = determine_department(issue_type)
+    
+    # Determine priority based on urgency keywords
+    urgency_keywords = extract.get("Urgency", [])
+    priority = determine_priority(urgency_keywords)
+    
+    # Extract location details
+    extracted_locations = extract.get("Location", [])
+    location_text = ", ".join(extracted_locations) if extracted_locations else "Unknown"
+    
+    # Extract dates mentioned
+    dates_mentioned = extract.get("Date", [])
+    date_text = ", ".join(dates_mentioned) if dates_mentioned else ""
+    
+    # Get image detection results if available
+    image_detections = []
+    if 'predictions' in label_data and 'predictions' in label_data['predictions']:
+        predictions = label_data['predictions']['predictions']
+        for prediction in predictions:
+            if 'class' in prediction and 'confidence' in prediction:
+                image_detections.append({
+                    'class': prediction['class'],
+                    'confidence': prediction['confidence']
+                })
+    
+    # Build row for BigQuery - include all possible fields
+    # The BigQuery sink will filter out fields that don't exist in the schema
+    row = {
+        "complaint_id": folder_name,
+        "user_id": metadata.get("user", metadata.get("username", "anonymous")),
+        "description": complaint_text.strip(),
+        "image_url": get_public_url(BUCKET_NAME, photo_path),
+        "image": get_public_url(BUCKET_NAME, photo_path),  # For backward compatibility
+        "latitude": float(location.get("latitude", 0)),
+        "longitude": float(location.get("longitude", 0)),
+        "location": json.dumps(location),  # For backward compatibility
+        "location_text": location_text,
+        "status": metadata.get("status", "pending"),
+        "submitted_at": timestamp,
+        "issue_type": issue_type,
+        "extract": issue_type,  # For backward compatibility
+        "department": department,
+        "priority": priority,
+        "dates_mentioned": date_text,
+        "image_detections": json.dumps(image_detections),
+        "text_analysis": json.dumps(extract),
+        "processed_at": datetime.datetime.now().isoformat(),
+        "label": label_prediction.get("class", "Unknown")  # Add the label prediction class
+    }
+    return row
+
+def load_watermark():
+    """Return ``(watermark folder name or None, state object generation)``."""
+    blob = get_bucket().get_blob(STATE_BLOB)
+    if blob is None:
+        return None, 0
+    return json.loads(blob.download_as_string()).get('watermark'), blob.generation
+
+def save_watermark(watermark, generation):
+    """Advance the checkpoint, never moving it backwards if another run saved a newer one."""
+    bucket = get_bucket()
+    for _ in range(5):
+        try:
+            bucket.blob(STATE_BLOB).upload_from_string(
+                json.dumps({'watermark': watermark, 'updated_at': datetime.datetime.now().isoformat()}),
+                content_type='application/json',
+                if_generation_match=generation
+            )
+            logging.info(f"Watermark advanced to {watermark}")
+            return
+        except exceptions.PreconditionFailed:
+            current, generation = load_watermark()
+            if current and current >= watermark:
+                return
+    logging.warning("Could not save the watermark, the next run will list from the previous one")
+
+def listing_offset(watermark, lookback_minutes=LOOKBACK_MINUTES):
+    """start_offset for a run: the watermark minus the lookback window."""
+    watermark_time = complaint_store.folder_time(watermark) if watermark else None
+    if watermark_time is None:
+        return None
+    return complaint_store.folder_offset(watermark_time - datetime.timedelta(minutes=lookback_minutes))
+
+def find_unprocessed_complaints(folders):
+    """Filter a stream of ``(folder_name, inventory)`` to the folders not processed yet.
+
+    Quarantined folders are skipped too. The inventory (the folder's file
+    listing) is what fetch_complaint needs to skip its existence checks.
+    """
+    for folder_name, inventory in folders:
+        if PROCESSED_MARKER not in inventory and etl_dead_letter.QUARANTINE_MARKER not in inventory:
+            yield folder_name, inventory
+
+# Marks the end of a pipeline stage's input
+_END = object()
+
+def _feed(items, outbox, errors):
+    """Put every item of ``items`` on ``outbox``, then the end marker."""
     try:
-        # Check if this complaint has already been processed
-        marker_path = f"{folder_name}/{PROCESSED_MARKER}"
-        if blob_exists(BUCKET_NAME, marker_path):
-            logging.info(f"Complaint {folder_name} already processed, skipping")
-            return False
-        
-        # Define file paths
-        metadata_path = f"{folder_name}/metadata.json"
-        location_path = f"{folder_name}/location.json"
-        meta_path = f"{folder_name}/meta.json"
-        complaint_text_path = f"{folder_name}/complaint.txt"
-        extract_path = f"{folder_name}/complaint_extract.json"
-        photo_path = f"{folder_name}/photo.jpg"
-        label_path = f"{folder_name}/label.json"
-        
-        # Check if required files exist
-        if not blob_exists(BUCKET_NAME, metadata_path):
-            logging.warning(f"Required file not found: {metadata_path}")
-            return False
-        
-        if not blob_exists(BUCKET_NAME, location_path):
-            logging.warning(f"Required file not found: {location_path}")
-            return False
-        
-        if not blob_exists(BUCKET_NAME, complaint_text_path):
-            logging.warning(f"Required file not found: {complaint_text_path}")
-            return False
-        
-        # Load data
-        metadata = json.loads(download_blob(BUCKET_NAME, metadata_path))
-        location = json.loads(download_blob(BUCKET_NAME, location_path))
-        complaint_text = download_blob(BUCKET_NAME, complaint_text_path)
-        
-        # Get timestamp from metadata if meta.json doesn't exist
-        timestamp = datetime.datetime.now().isoformat()
-        if blob_exists(BUCKET_NAME, meta_path):
-            meta = json.loads(download_blob(BUCKET_NAME, meta_path))
-            timestamp = meta.get("timestamp", timestamp)
+        for item in items:
+            outbox.put(item)
+    except Exception as e:
+        logging.error(f"Error listing complaints: {str(e)}")
+        errors.append(e)
+    finally:
+        outbox.put(_END)
+
+def _start_stage(name, work, inbox, outbox, threads=1):
+    """Start ``threads`` threads passing each item of ``inbox`` through ``work`` to ``outbox``.
+
+    ``work`` returns the item for the next stage, or None to drop it; an
+    item whose ``work`` raises is logged and dropped. The end marker is
+    passed on once every thread of the stage has seen it.
+    """
+    remaining = [threads]
+    lock = threading.Lock()
+
+    def run():
+        while True:
+            item = inbox.get()
+            if item is _END:
+                inbox.put(_END)  # for the stage's other threads
+                with lock:
+                    remaining[0] -= 1
+                    last = remaining[0] == 0
+                if last:
+                    outbox.put(_END)
+                return
+            try:
+                result = work(item)
+            except Exception as e:
+                # Keep reading, so the end marker still reaches the next stage
+                logging.error(f"Error in the {name} stage: {str(e)}")
+                metrics.count(f'{name}_errors')
+                continue
+            if result is not None:
+                outbox.put(result)
+
+    for i in range(threads):
+        threading.Thread(target=run, name=f"{name}-{i}", daemon=True).start()
+
+def main(workers=1, batch_size=BATCH_SIZE, batch_max_age=BATCH_MAX_AGE, full=False,
+         lookback_minutes=LOOKBACK_MINUTES, bulk=False, loader=None, max_file_bytes=MAX_FILE_BYTES,
+         metrics_file=None, prometheus_file=None):
+    """Main function to process all unprocessed complaints.
+
+    Runs as a streaming pipeline: the bucket listing is read a page at a
+    time, ``workers`` threads download each unprocessed folder's files, one
+    thread builds the rows and the main thread queues them on the batched
+    BigQuery sink. The stages run at the same time and are joined by
+    bounded queues, so rows start loading straight away and memory does not
+    grow with the number of folders.
+
+    Only folders from the saved watermark (minus the lookback window) onward
+    are listed, unless ``full`` is set; dead-lettered and late-arriving
+    folders before that are read as well, and quarantined ones are
+    skipped. With ``bulk`` the rows are written to local files of up to
+    ``max_file_bytes`` and each file is passed to ``loader`` (a BigQuery
+    load job by default) instead of being streamed.
+
+    Every stage is timed into ``metrics``; the report is logged as JSON at
+    the end and also written to ``metrics_file`` (JSON) and
+    ``prometheus_file`` (Prometheus text format) when given.
+    """
+    logging.info(f"Starting complaint processing script with {workers} workers")
+    metrics.reset()
+    
+    # Stream the folders newer than the checkpoint
+    watermark, state_generation = load_watermark()
+    start_offset = None if full else listing_offset(watermark, lookback_minutes)
+    logging.info(f"Listing complaints from {start_offset or 'the beginning'}")
+    listing = {'folders': 0, 'newest': None}
+    listing_errors = []
+    dead_letters = etl_dead_letter.load_dead_letters(get_bucket())
+    # Folders inside the listed range are retried through the listing
+    late_arrivals = set(complaint_store.list_late_arrivals(get_bucket()))
+    retries = sorted(folder_name for folder_name in set(dead_letters) | late_arrivals
+                     if start_offset and folder_name < start_offset)
+    if dead_letters or late_arrivals:
+        logging.info(f"{len(dead_letters)} dead-lettered and {len(late_arrivals)} late complaints, "
+                     f"retrying {len(retries)} outside the listing")
+    
+    def list_folders():
+        folders = complaint_store.iter_complaint_folders(get_bucket(), start_offset)
+        while True:
+            # Mostly near zero, with a spike whenever a new page is fetched
+            with metrics.time('list'):
+                folder_name, inventory = next(folders, (None, None))
+            if folder_name is None:
+                return
+            metrics.count('folders_listed')
+            # The listing is in name order, so the last folder seen is the newest
+            listing['folders'] += 1
+            listing['newest'] = folder_name
+            if PROCESSED_MARKER in inventory:
+                # Loaded already (e.g. by a run that listed it first): records are stale
+                clear_records(folder_name)
+            yield folder_name, inventory
+    
+    failed = []
+    
+    def dead_letter(folder_name, reason, error, quarantine=False):
+        failed.append(folder_name)
+        try:
+            record = etl_dead_letter.record_failure(get_bucket(), folder_name, reason, error,
+                                                    dead_letters.get(folder_name), DEAD_LETTER_MAX_ATTEMPTS,
+                                                    quarantine)
+        except Exception as e:
+            logging.error(f"Error recording the failure of {folder_name}: {str(e)}")
+            return
+        # The dead-letter record now brings the folder back
+        clear_records(folder_name, dead_letter=False)
+        if record['quarantined']:
+            logging.warning(f"Quarantined {folder_name} after {record['attempts']} failed runs: {str(error)}")
+            metrics.count('folders_quarantined')
         else:
-            # Use timestamp from metadata.json if available
-            timestamp = metadata.get("timestamp", timestamp)
-        
-        # Load text analysis results
-        extract = {}
+            metrics.count('folders_dead_lettered')
+    
+    def clear_records(folder_name, dead_letter=True):
+        # Drop the folder's dead-letter and late-arrival records once they are
+        # settled. A stale record only costs a wasted retry later, so errors
+        # are just logged
+        clears = [(complaint_store.clear_late_arrival, late_arrivals, 'late-arrival')]
+        if dead_letter:
+            clears.append((etl_dead_letter.clear, dead_letters, 'dead-letter'))
+        for clear, records, kind in clears:
+            if folder_name not in records:
+                continue
+            try:
+                with_retries(clear, get_bucket(), folder_name)
+            except Exception as e:
+                logging.error(f"Error clearing the {kind} record of {folder_name}: {str(e)}")
+    
+    def fetch(item):
+        folder_name, inventory = item
+        metrics.count('folders_fetched')
         try:
-            if blob_exists(BUCKET_NAME, extract_path):
-                extract = json.loads(download_blob(BUCKET_NAME, extract_path))
-                logging.info(f"Text analysis results loaded for {folder_name}")
-            else:
-                logging.warning(f"Text analysis file not found: {extract_path}")
+            with metrics.time('fetch'):
+                fetched = with_retries(fetch_complaint, folder_name, inventory)
         except Exception as e:
-            logging.warning(f"Could not load text analysis results: {str(e)}")
-        
-        # Load image analysis results and extract label prediction
-        label_prediction = {'class': 'No label', 'confidence': 0}
+            logging.error(f"Error processing complaint {folder_name}: {str(e)}")
+            dead_letter(folder_name, 'fetch', e, etl_dead_letter.classify_error(e, folder_name) == 'permanent')
+            return None
+        if fetched is None:
+            # Already processed: a dead-letter record left from before is stale
+            clear_records(folder_name)
+            return None
+        return folder_name, fetched
+    
+    def transform(item):
+        folder_name, fetched = item
         try:
-            if blob_exists(BUCKET_NAME, label_path):
-                label_data = json.loads(download_blob(BUCKET_NAME, label_path))
-                logging.info(f"Image analysis results loaded for {folder_name}")
-                label_prediction = extract_label_prediction(label_data)
-                logging.info(f"Extracted label prediction: {label_prediction}")
-            else:
-                logging.warning(f"Image analysis file not found: {label_path}")
+            with metrics.time('transform'):
+                return folder_name, build_row(folder_name, fetched)
         except Exception as e:
-            logging.warning(f"Could not load image analysis results: {str(e)}")
-        
-        # Extract issue type from text analysis
-        issue_types = extract.get("Issue Type", [])
-        issue_type = issue_types[0] if issue_types else "Unknown"
-        
-        # Determine department based on issue type
-        department = determine_department(issue_type)
-        
-        # Determine priority based on urgency keywords
-        urgency_keywords = extract.get("Urgency", [])
-        priority = determine_priority(urgency_keywords)
-        
-        # Extract location details
-        extracted_locations = extract.get("Location", [])
-        location_text = ", ".join(extracted_locations) if extracted_locations else "Unknown"
-        
-        # Extract dates mentioned
-        dates_mentioned = extract.get("Date", [])
-        date_text = ", ".join(dates_mentioned) if dates_mentioned else ""
-        
-        # Get image detection results if available
-        image_detections = []
-        if 'predictions' in label_data and 'predictions' in label_data['predictions']:
-            predictions = label_data['predictions']['predictions']
-            for prediction in predictions:
-                if 'class' in prediction and 'confidence' in prediction:
-                    image_detections.append({
-                        'class': prediction['class'],
-                        'confidence': prediction['confidence']
-                    })
-        
-        # Build row for BigQuery - include all possible fields
-        # The insert_into_bigquery function will filter out fields that don't exist in the schema
-        row = {
-            "complaint_id": folder_name,
-            "user_id": metadata.get("user", metadata.get("username", "anonymous")),
-            "description": complaint_text.strip(),
-            "image_url": get_public_url(BUCKET_NAME, photo_path),
-            "image": get_public_url(BUCKET_NAME, photo_path),  # For backward compatibility
-            "latitude": float(location.get("latitude", 0)),
-            "longitude": float(location.get("longitude", 0)),
-            "location": json.dumps(location),  # For backward compatibility
-            "location_text": location_text,
-            "status": metadata.get("status", "pending"),
-            "submitted_at": timestamp,
-            "issue_type": issue_type,
-            "extract": issue_type,  # For backward compatibility
-            "department": department,
-            "priority": priority,
-            "dates_mentioned": date_text,
-            "image_detections": json.dumps(image_detections),
-            "text_analysis": json.dumps(extract),
-            "processed_at": datetime.datetime.now().isoformat(),
-            "label": label_prediction.get("class", "Unknown")  # Add the label prediction class
-        }
-        
-        # Insert into BigQuery
-        success = insert_into_bigquery(row, BIGQUERY_TABLE_ID)
-        
-        if success:
-            # Mark this complaint as processed
-            upload_blob(BUCKET_NAME, datetime.datetime.now().isoformat(), marker_path)
-            logging.info(f"Successfully processed complaint {folder_name}")
-            return True
+            logging.error(f"Error processing complaint {folder_name}: {str(e)}")
+            dead_letter(folder_name, 'transform', e, etl_dead_letter.classify_error(e, folder_name) == 'permanent')
+            return None
+    
+    to_fetch = queue.Queue(STAGE_QUEUE_SIZE)
+    to_transform = queue.Queue(STAGE_QUEUE_SIZE)
+    to_load = queue.Queue(STAGE_QUEUE_SIZE)
+    folders = itertools.chain(((folder_name, None) for folder_name in retries),
+                              find_unprocessed_complaints(list_folders()))
+    threading.Thread(target=_feed, name="list", daemon=True, args=(folders, to_fetch, listing_errors)).start()
+    _start_stage("fetch", fetch, to_fetch, to_transform, max(1, workers))
+    _start_stage("transform", transform, to_transform, to_load)
+    
+    # Markers of a stored batch are written on their own pool; at most
+    # STAGE_QUEUE_SIZE are outstanding at a time
+    marker_slots = threading.BoundedSemaphore(STAGE_QUEUE_SIZE)
+    counts = {'processed': 0}
+    counts_lock = threading.Lock()
+    
+    def marker_done(folder_name, future):
+        if future.result():
+            with counts_lock:
+                counts['processed'] += 1
+            clear_records(folder_name)
         else:
-            logging.error(f"Failed to insert complaint {folder_name} into BigQuery")
-            return False
-            
-    except Exception as e:
-        logging.error(f"Error processing complaint {folder_name}: {str(e)}")
-        return False
-
-def find_unprocessed_complaints():
-    """Find all complaint folders that haven't been processed yet."""
-    bucket = storage_client.bucket(BUCKET_NAME)
-    blobs = list(bucket.list_blobs(prefix='complaint_'))
-    
-    # Extract unique folder names
-    folders = set()
-    for blob in blobs:
-        if '/' in blob.name:
-            folder_name = blob.name.split('/')[0]
-            if folder_name.startswith('complaint_'):
-                folders.add(folder_name)
-    
-    # Filter for unprocessed complaints
-    unprocessed = []
-    for folder in folders:
-        marker_path = f"{folder}/{PROCESSED_MARKER}"
-        if not blob_exists(BUCKET_NAME, marker_path):
-            unprocessed.append(folder)
-    
-    return unprocessed
-
-def main():
-    """Main function to process all unprocessed complaints."""
-    logging.info("Starting complaint processing script")
-    
-    # Find unprocessed complaints
-    unprocessed = find_unprocessed_complaints()
-    logging.info(f"Found {len(unprocessed)} unprocessed complaints")
-    
-    # Process each complaint
-    processed_count = 0
-    for folder in unprocessed:
-        logging.info(f"Processing complaint folder: {folder}")
-        if process_complaint(folder):
-            processed_count += 1
-    
-    logging.info(f"Processing complete. Processed {processed_count} complaints.")
+            failed.append(folder_name)
+        marker_slots.release()
+    
+    def on_success(folder_name):
+        marker_slots.acquire()
+        future = markers.submit(mark_processed, folder_name)
+        future.add_done_callback(lambda future: marker_done(folder_name, future))
+    
+    def on_failure(folder_name, errors):
+        log_insert_failure(folder_name, errors)
+        dead_letter(folder_name, 'insert', json.dumps(errors))
+    
+    def on_batch(rows, failed_rows, seconds):
+        metrics.observe('insert', seconds)
+        metrics.count('insert_batches')
+        metrics.count('rows_loaded', rows - failed_rows)
+        metrics.count('rows_failed', failed_rows)
+    
+    queued = 0
+    with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="marker") as markers:
+        if bulk:
+            sink = create_bulk_sink(loader, max_file_bytes=max_file_bytes, on_success=on_success,
+                                    on_failure=on_failure, on_batch=on_batch)
+        else:
+            sink = create_sink(batch_size, batch_max_age, on_success=on_success, on_failure=on_failure,
+                               on_batch=on_batch)
+        while True:
+            item = to_load.get()
+            if item is _END:
+                break
+            folder_name, row = item
+            sink.add(folder_name, row)
+            queued += 1
+            logging.info(f"[{queued}] {folder_name}: queued")
+        sink.close()
+    
+    processed_count = counts['processed']
+    failed.sort()
+    logging.info(f"Listed {listing['folders']} complaint folders")
+    newest = listing['newest']
+    if listing_errors:
+        logging.warning("The listing did not complete, keeping the previous watermark")
+    elif newest and (watermark is None or newest > watermark):
+        save_watermark(newest, state_generation)
+    logging.info(f"Processing complete. Processed {processed_count} complaints, {len(failed)} failed.")
+    if failed:
+        logging.info(f"Failed complaints: {', '.join(failed)}")
+    
+    metrics.count('folders_processed', processed_count)
+    metrics.count('folders_failed', len(failed))
+    logging.info(f"Run metrics: {json.dumps(metrics.report())}")
+    if metrics_file:
+        metrics.write_json(metrics_file)
+    if prometheus_file:
+        metrics.write_prometheus(prometheus_file)
+    return processed_count, failed
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Load unprocessed complaints into BigQuery")
+    parser.add_argument('--workers', type=int, default=1, help="Number of folders processed in parallel")
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help="Rows per BigQuery insert")
+    parser.add_argument('--batch-max-age', type=float, default=BATCH_MAX_AGE,
+                        help="Seconds a row may wait before its batch is sent")
+    parser.add_argument('--full', action='store_true', help="Ignore the watermark and list the whole bucket")
+    parser.add_argument('--lookback-minutes', type=int, default=LOOKBACK_MINUTES,
+                        help="How far before the watermark to list again for late files")
+    parser.add_argument('--sink', choices=['bigquery', 'sqlite', 'ndjson'], default=SINK_CONFIG['SINK_TYPE'],
+                        help="Where rows are written (default from COMPLAINT_SINK)")
+    parser.add_argument('--sink-path', default=SINK_CONFIG['SINK_PATH'],
+                        help="File for the sqlite and ndjson sinks (default from COMPLAINT_SINK_PATH)")
+    parser.add_argument('--bulk', action='store_true',
+                        help="Stage rows in local files and load them with load jobs (for backfills)")
+    parser.add_argument('--file-size-mb', type=int, default=MAX_FILE_BYTES // (1024 * 1024),
+                        help="Uncompressed size at which a bulk file is closed and loaded")
+    parser.add_argument('--metrics-file', help="Write the run's stage timings and counters to this JSON file")
+    parser.add_argument('--prometheus-file',
+                        help="Also write them in Prometheus text format (e.g. for the node_exporter textfile collector)")
+    args = parser.parse_args()
+    SINK_CONFIG.update(SINK_TYPE=args.sink, SINK_PATH=args.sink_path)
+    main(args.workers, args.batch_size, args.batch_max_age, args.full, args.lookback_minutes,
+         bulk=args.bulk, max_file_bytes=args.file_size_mb * 1024 * 1024,
+         metrics_file=args.metrics_file, prometheus_file=args.prometheus_file)
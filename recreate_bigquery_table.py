@@ -2,22 +2,38 @@ import os
 import json
 from google.cloud import bigquery
 import logging
+from table import sinks
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
-# Set up BigQuery client
-bigquery_client = bigquery.Client.from_service_account_json('optical-net-452113-n9-064952459436.json')
-
 # Constants
 PROJECT_ID = 'optical-net-452113-n9'
 DATASET_ID = 'Grievance'
 TABLE_ID = 'extract'
 FULL_TABLE_ID = f"{PROJECT_ID}.{DATASET_ID}.{TABLE_ID}"
+# COMPLAINT_SINK=sqlite|ndjson recreates the local table used by process_complaints.py instead
+SINK_TYPE = os.getenv('COMPLAINT_SINK', 'bigquery')
+SINK_PATH = os.getenv('COMPLAINT_SINK_PATH') or sinks.DEFAULT_PATHS.get(SINK_TYPE)
+
+# Set up BigQuery client on first use
+bigquery_client = None
+
+def get_bigquery_client():
+    global bigquery_client
+    if bigquery_client is None:
+        bigquery_client = bigquery.Client.from_service_account_json('optical-net-452113-n9-064952459436.json')
+    return bigquery_client
 
 def delete_table():
     """Delete the existing BigQuery table."""
+    if SINK_TYPE != 'bigquery':
+        if os.path.exists(SINK_PATH):
+            os.remove(SINK_PATH)
+        logging.info(f"Local {SINK_TYPE} table {SINK_PATH} deleted")
+        return True
     try:
+        bigquery_client = get_bigquery_client()
         bigquery_client.delete_table(FULL_TABLE_ID, not_found_ok=True)
         logging.info(f"Table {FULL_TABLE_ID} deleted successfully")
         return True
@@ -27,19 +43,19 @@ def delete_table():
 
 def create_table_with_schema():
     """Create a new BigQuery table with the updated schema."""
+    if SINK_TYPE == 'sqlite':
+        sinks.SQLiteSink(SINK_PATH, TABLE_ID).close()
+        logging.info(f"Local sqlite table {TABLE_ID} created in {SINK_PATH}")
+        return True
+    if SINK_TYPE != 'bigquery':
+        # The ndjson file is created by the first write
+        return True
     try:
-        # Define the schema
+        bigquery_client = get_bigquery_client()
+        # Define the schema (shared with the local sinks)
         schema = [
-            bigquery.SchemaField("complaint_id", "STRING", mode="REQUIRED", description="Unique identifier for the complaint"),
-            bigquery.SchemaField("user_id", "STRING", mode="NULLABLE", description="User who submitted the complaint"),
-            bigquery.SchemaField("description", "STRING", mode="NULLABLE", description="Text description of the complaint"),
-            bigquery.SchemaField("image", "STRING", mode="NULLABLE", description="URL to the complaint image"),
-            bigquery.SchemaField("location", "STRING", mode="NULLABLE", description="Location data as JSON string"),
-            bigquery.SchemaField("status", "STRING", mode="NULLABLE", description="Current status of the complaint"),
-            bigquery.SchemaField("submitted_at", "TIMESTAMP", mode="NULLABLE", description="Timestamp when the complaint was submitted"),
-            bigquery.SchemaField("extract", "STRING", mode="NULLABLE", description="Issue type extracted from text analysis"),
-            bigquery.SchemaField("department", "STRING", mode="NULLABLE", description="Department assigned to handle the complaint"),
-            bigquery.SchemaField("label", "STRING", mode="NULLABLE", description="Prediction label from image analysis")
+            bigquery.SchemaField(name, field_type, mode=mode, description=description)
+            for name, field_type, mode, description in sinks.TABLE_SCHEMA
         ]
         
         # Create table reference
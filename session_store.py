@@ -0,0 +1,226 @@
+import json
+import os
+import random
+import re
+import secrets
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from flask.sessions import SessionInterface, SessionMixin
+from itsdangerous import BadSignature, Signer
+from werkzeug.datastructures import CallbackDict
+
+SESSION_ID_PATTERN = re.compile(r'^[A-Za-z0-9_-]{32,64}$')
+# A session that is used but not changed has its stored expiry pushed back
+# once less than this share of its lifetime is left, so active users stay
+# logged in without a backend write on every request
+REFRESH_THRESHOLD = 0.5
+# Share of filesystem session writes that also sweep out expired session files
+CLEANUP_PROBABILITY = 0.01
+
+class ServerSideSession(CallbackDict, SessionMixin):
+    def __init__(self, initial=None, sid=None, new=False, expires=None):
+        def on_update(session):
+            session.modified = True
+        super().__init__(initial, on_update)
+        self.sid = sid
+        self.new = new
+        self.modified = False
+        self.expires = expires
+        self.previous_sid = None
+
+    def regenerate(self):
+        """Move the session to a fresh id (e.g. on login); the old id is deleted when the session is saved."""
+        if not self.new and self.previous_sid is None:
+            self.previous_sid = self.sid
+        self.sid = secrets.token_urlsafe(32)
+        self.modified = True
+
+class MemorySessionBackend:
+    """In-process LRU session store; sessions are lost on restart and not shared between workers."""
+
+    def __init__(self, max_size=10000):
+        self.max_size = max_size
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, sid):
+        """Return ``(data, expiry time)``, or None for a missing or expired session."""
+        with self._lock:
+            stored = self._sessions.get(sid)
+            if stored is None:
+                return None
+            if stored[0] <= time.time():
+                del self._sessions[sid]
+                return None
+            self._sessions.move_to_end(sid)
+            return json.loads(stored[1]), stored[0]
+
+    def set(self, sid, data, lifetime):
+        # Stored serialised so a session never shares mutable state between requests
+        with self._lock:
+            self._sessions[sid] = (time.time() + lifetime, json.dumps(data))
+            self._sessions.move_to_end(sid)
+            while len(self._sessions) > self.max_size:
+                self._sessions.popitem(last=False)
+
+    def delete(self, sid):
+        with self._lock:
+            self._sessions.pop(sid, None)
+
+class FilesystemSessionBackend:
+    """One JSON file per session under ``directory``, shared by every worker on the host."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, sid):
+        return os.path.join(self.directory, sid)
+
+    def get(self, sid):
+        """Return ``(data, expiry time)``, or None for a missing or expired session."""
+        try:
+            with open(self._path(sid), 'r') as f:
+                stored = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if stored['expires'] <= time.time():
+            self.delete(sid)
+            return None
+        return stored['data'], stored['expires']
+
+    def set(self, sid, data, lifetime):
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix='.tmp-')
+        with os.fdopen(fd, 'w') as f:
+            json.dump({'expires': time.time() + lifetime, 'data': data}, f)
+        os.replace(tmp_path, self._path(sid))
+        # Abandoned sessions (e.g. the anonymous ones made by a login
+        # redirect's flash message) are never read again, so sweep now and then
+        if random.random() < CLEANUP_PROBABILITY:
+            self.cleanup()
+
+    def cleanup(self, now=None):
+        """Delete expired session files and leftover temporary files; returns how many were removed."""
+        now = now or time.time()
+        removed = 0
+        for entry in os.scandir(self.directory):
+            try:
+                if entry.name.startswith('.tmp-'):
+                    expired = entry.stat().st_mtime < now - 3600
+                else:
+                    with open(entry.path, 'r') as f:
+                        expired = json.load(f)['expires'] <= now
+            except (OSError, ValueError, KeyError, TypeError):
+                # Unreadable: half-written by another worker, or not a session
+                continue
+            if expired:
+                try:
+                    os.remove(entry.path)
+                    removed += 1
+                except OSError:
+                    pass
+        return removed
+
+    def delete(self, sid):
+        try:
+            os.remove(self._path(sid))
+        except OSError:
+            pass
+
+class ServerSideSessionInterface(SessionInterface):
+    """Keep session data in ``backend``; the cookie only carries a random, signed session id.
+
+    A session expires in the backend after PERMANENT_SESSION_LIFETIME
+    without use, whether or not it is permanent.
+    """
+
+    def __init__(self, backend, use_signer=True):
+        self.backend = backend
+        self.use_signer = use_signer
+
+    def _signer(self, app):
+        return Signer(app.secret_key, salt='server-side-session')
+
+    def open_session(self, app, request):
+        cookie = request.cookies.get(self.get_cookie_name(app))
+        if cookie:
+            sid = cookie
+            if self.use_signer:
+                try:
+                    sid = self._signer(app).unsign(cookie).decode('ascii')
+                except BadSignature:
+                    sid = None
+            if sid and SESSION_ID_PATTERN.match(sid):
+                stored = self.backend.get(sid)
+                if stored is not None:
+                    return ServerSideSession(stored[0], sid=sid, expires=stored[1])
+        return ServerSideSession(sid=secrets.token_urlsafe(32), new=True)
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        if session.previous_sid:
+            self.backend.delete(session.previous_sid)
+        if not session:
+            if session.modified and not session.new:
+                self.backend.delete(session.sid)
+                response.delete_cookie(name, domain=domain, path=path)
+            return
+
+        # The stored expiry slides with use, like the cookie of a permanent
+        # session; the session ends after PERMANENT_SESSION_LIFETIME idle
+        lifetime = app.permanent_session_lifetime.total_seconds()
+        stale = session.expires is not None and session.expires - time.time() < lifetime * REFRESH_THRESHOLD
+        if session.modified or session.new or stale:
+            self.backend.set(session.sid, dict(session), lifetime)
+        elif not self.should_set_cookie(app, session):
+            return
+        value = session.sid
+        if self.use_signer:
+            value = self._signer(app).sign(value.encode('ascii')).decode('ascii')
+        response.set_cookie(
+            name, value,
+            expires=self.get_expiration_time(app, session),
+            httponly=self.get_cookie_httponly(app),
+            domain=domain,
+            path=path,
+            secure=self.get_cookie_secure(app),
+            samesite=self.get_cookie_samesite(app)
+        )
+
+def load_secret_key(path):
+    """Return the secret key stored at ``path``, creating it on first use.
+
+    Every worker started from the same directory signs session ids with
+    the same key, so a cookie issued by one is accepted by the others.
+    """
+    try:
+        with open(path, 'rb') as f:
+            return f.read()
+    except FileNotFoundError:
+        pass
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    key = secrets.token_bytes(32)
+    try:
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    except FileExistsError:
+        # Another worker created it first
+        with open(path, 'rb') as f:
+            return f.read()
+    with os.fdopen(fd, 'wb') as f:
+        f.write(key)
+    return key
+
+def create_session_interface(config):
+    """Build the session interface selected by SESSION_TYPE ('filesystem' or 'memory')."""
+    session_type = config.get('SESSION_TYPE', 'filesystem')
+    if session_type == 'filesystem':
+        backend = FilesystemSessionBackend(config['SESSION_FILE_DIR'])
+    elif session_type == 'memory':
+        backend = MemorySessionBackend(config.get('SESSION_MEMORY_SIZE', 10000))
+    else:
+        raise ValueError(f"Unsupported SESSION_TYPE: {session_type}")
+    return ServerSideSessionInterface(backend, config.get('SESSION_USE_SIGNER', True))
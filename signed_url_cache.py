@@ -0,0 +1,52 @@
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+class SignedUrlCache:
+    """Size-bounded LRU cache of signed GET URLs keyed by blob name.
+
+    URLs are signed for ``expiry`` but only handed out for ``ttl``, which
+    must be shorter, so a cached URL always has at least ``expiry - ttl``
+    of validity left when the browser receives it.
+    """
+
+    def __init__(self, bucket, max_size=1024, ttl=timedelta(minutes=50), expiry=timedelta(hours=1)):
+        if ttl >= expiry:
+            raise ValueError("Signed URL cache TTL must be shorter than the URL expiry")
+        self.bucket = bucket
+        self.max_size = max_size
+        self.ttl = ttl.total_seconds()
+        self.expiry = expiry
+        self._urls = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, blob_name):
+        """Return a signed URL for ``blob_name``, signing a new one only on a miss or expiry."""
+        now = time.monotonic()
+        with self._lock:
+            cached = self._urls.get(blob_name)
+            if cached is not None and cached[1] > now:
+                self._urls.move_to_end(blob_name)
+                return cached[0]
+
+        url = self.bucket.blob(blob_name).generate_signed_url(
+            version="v4",
+            expiration=datetime.now() + self.expiry,
+            method="GET"
+        )
+
+        with self._lock:
+            self._urls[blob_name] = (url, now + self.ttl)
+            self._urls.move_to_end(blob_name)
+            while len(self._urls) > self.max_size:
+                self._urls.popitem(last=False)
+        return url
+
+    def invalidate(self, blob_name):
+        with self._lock:
+            self._urls.pop(blob_name, None)
+
+    def clear(self):
+        with self._lock:
+            self._urls.clear()
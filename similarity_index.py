@@ -0,0 +1,264 @@
+import argparse
+import json
+import math
+import os
+import re
+import tempfile
+import threading
+from collections import Counter
+from datetime import timedelta
+import numpy as np
+import complaint_store
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+STOP_WORDS = frozenset("""
+a an and are as at be been but by for from has have i in is it its my of on or
+our so that the there this to was we were with please very
+""".split())
+SNIPPET_LENGTH = 160
+# How far before the newest indexed complaint a sync re-lists, to catch
+# folders whose record landed after a later folder was already indexed
+SYNC_LOOKBACK = timedelta(minutes=10)
+
+def tokenize(text):
+    return [token for token in TOKEN_PATTERN.findall(text.lower()) if token not in STOP_WORDS and len(token) > 1]
+
+class SimilarityIndex:
+    """Incremental TF-IDF index over complaint texts with NumPy top-k cosine scoring.
+
+    Documents are stored as L2-normalised log term frequencies in an
+    inverted index (one posting list per term). IDF is applied to the query
+    side only, so adding a document never requires reweighting the others.
+    Scoring a query touches only the posting lists of its terms.
+    """
+
+    def __init__(self):
+        self.ids = []
+        self.snippets = []
+        self.owners = []
+        self.vocabulary = {}
+        self.doc_freq = []
+        self._doc_of = {}
+        # term id -> [doc ids array, weights array, pending doc ids, pending weights]
+        self._postings = []
+        self._lock = threading.RLock()
+        self.dirty = False
+        # Newest folder seen by a bucket listing; complaints added directly
+        # with add() do not move it, so a sync never skips older folders
+        self.watermark = None
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, complaint_id):
+        return complaint_id in self._doc_of
+
+    def add(self, complaint_id, text, owner=None):
+        """Add one complaint; returns False if it is already indexed or has no usable text."""
+        terms = Counter(tokenize(text or ''))
+        with self._lock:
+            if complaint_id in self._doc_of or not terms:
+                return False
+            doc = len(self.ids)
+            weights = {term: 1.0 + math.log(count) for term, count in terms.items()}
+            norm = math.sqrt(sum(weight * weight for weight in weights.values()))
+            for term, weight in weights.items():
+                term_id = self.vocabulary.get(term)
+                if term_id is None:
+                    term_id = len(self.doc_freq)
+                    self.vocabulary[term] = term_id
+                    self.doc_freq.append(0)
+                    self._postings.append([np.empty(0, np.int32), np.empty(0, np.float32), [], []])
+                self.doc_freq[term_id] += 1
+                posting = self._postings[term_id]
+                posting[2].append(doc)
+                posting[3].append(weight / norm)
+            self.ids.append(complaint_id)
+            self.snippets.append(text.strip()[:SNIPPET_LENGTH])
+            self.owners.append(owner)
+            self._doc_of[complaint_id] = doc
+            self.dirty = True
+            return True
+
+    def _posting(self, term_id):
+        posting = self._postings[term_id]
+        if posting[2]:
+            posting[0] = np.concatenate([posting[0], np.asarray(posting[2], np.int32)])
+            posting[1] = np.concatenate([posting[1], np.asarray(posting[3], np.float32)])
+            posting[2] = []
+            posting[3] = []
+        return posting[0], posting[1]
+
+    def query(self, text, k=5, exclude_id=None, viewer=None):
+        """Return up to ``k`` (complaint_id, similarity in [0, 1], snippet) tuples, best first.
+
+        With ``viewer``, the snippet of any complaint owned by someone else is None.
+        """
+        terms = Counter(tokenize(text or ''))
+        with self._lock:
+            n_docs = len(self.ids)
+            if not n_docs or not terms:
+                return []
+            doc_ids = []
+            doc_weights = []
+            query_norm = 0.0
+            for term, count in terms.items():
+                term_id = self.vocabulary.get(term)
+                if term_id is None:
+                    continue
+                idf = math.log((1 + n_docs) / (1 + self.doc_freq[term_id])) + 1.0
+                weight = (1.0 + math.log(count)) * idf
+                query_norm += weight * weight
+                ids, weights = self._posting(term_id)
+                doc_ids.append(ids)
+                doc_weights.append(weights * np.float32(weight))
+            if not doc_ids:
+                return []
+            scores = np.bincount(np.concatenate(doc_ids), weights=np.concatenate(doc_weights), minlength=n_docs)
+            scores /= math.sqrt(query_norm)
+            if exclude_id in self._doc_of:
+                scores[self._doc_of[exclude_id]] = 0.0
+            take = min(k, n_docs)
+            top = np.argpartition(-scores, take - 1)[:take]
+            top = top[np.argsort(-scores[top], kind='stable')]
+            return [
+                (self.ids[doc], float(min(scores[doc], 1.0)),
+                 self.snippets[doc] if viewer is None or self.owners[doc] == viewer else None)
+                for doc in top if scores[doc] > 0
+            ]
+
+    def sync(self, bucket, load_text):
+        """Index complaints filed since the last sync.
+
+        Uses a start_offset listing (folder names sort by submission time) so
+        the cost is proportional to the number of new complaints; the first
+        sync of an empty index lists everything.
+        ``load_text(folder_name)`` returns ``(text, owner)`` or None.
+        """
+        start_offset = 'complaint_'
+        watermark = self.watermark
+        if watermark and complaint_store.folder_time(watermark):
+            start_offset = complaint_store.folder_offset(complaint_store.folder_time(watermark) - SYNC_LOOKBACK)
+        folders = []
+        newest = watermark
+        for blob in bucket.list_blobs(prefix='complaint_', start_offset=start_offset):
+            folder_name = blob.name.split('/', 1)[0]
+            if newest is None or folder_name > newest:
+                newest = folder_name
+            if folder_name not in self and (not folders or folders[-1] != folder_name):
+                folders.append(folder_name)
+        added = 0
+        for folder_name in folders:
+            try:
+                loaded = load_text(folder_name)
+            except Exception as e:
+                print(f"Error indexing complaint {folder_name}: {str(e)}")
+                continue
+            if loaded and self.add(folder_name, loaded[0], loaded[1]):
+                added += 1
+        if newest != self.watermark:
+            self.watermark = newest
+            self.dirty = True
+        return added
+
+    def save(self, path):
+        """Persist the index atomically to ``path`` + '.npz'.
+
+        The arrays and the JSON metadata go into the one file, so a reader
+        can never pair new postings with old ids.
+        """
+        with self._lock:
+            pointers = [0]
+            all_ids = []
+            all_weights = []
+            for term_id in range(len(self._postings)):
+                ids, weights = self._posting(term_id)
+                all_ids.append(ids)
+                all_weights.append(weights)
+                pointers.append(pointers[-1] + len(ids))
+            arrays = {
+                'pointers': np.asarray(pointers, np.int64),
+                'doc_ids': np.concatenate(all_ids) if all_ids else np.empty(0, np.int32),
+                'weights': np.concatenate(all_weights) if all_weights else np.empty(0, np.float32),
+                'doc_freq': np.asarray(self.doc_freq, np.int32)
+            }
+            meta = {
+                'ids': list(self.ids),
+                'snippets': list(self.snippets),
+                'owners': list(self.owners),
+                'watermark': self.watermark,
+                'vocabulary': sorted(self.vocabulary, key=self.vocabulary.get)
+            }
+            arrays['meta'] = np.frombuffer(json.dumps(meta).encode('utf-8'), np.uint8)
+            self.dirty = False
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.npz')
+        with os.fdopen(fd, 'wb') as f:
+            np.savez(f, **arrays)
+        os.replace(tmp_path, path + '.npz')
+
+    @classmethod
+    def load(cls, path):
+        """Load an index saved with :meth:`save`.
+
+        Returns an empty index (rebuilt by the next sync) if none exists or
+        its parts do not fit together.
+        """
+        index = cls()
+        if not os.path.exists(path + '.npz'):
+            return index
+        with np.load(path + '.npz') as arrays:
+            pointers = arrays['pointers']
+            doc_ids = arrays['doc_ids']
+            weights = arrays['weights']
+            doc_freq = arrays['doc_freq'].tolist()
+            meta = json.loads(arrays['meta'].tobytes())
+        n_docs = len(meta['ids'])
+        consistent = (
+            len(meta['snippets']) == n_docs and len(meta['owners']) == n_docs
+            and len(pointers) == len(meta['vocabulary']) + 1 == len(doc_freq) + 1
+            and (len(doc_ids) == 0 or int(doc_ids.max()) < n_docs)
+        )
+        if not consistent:
+            print(f"Similarity index at {path} is inconsistent, starting an empty one")
+            return index
+        index.doc_freq = doc_freq
+        index.ids = meta['ids']
+        index.snippets = meta['snippets']
+        index.owners = meta['owners']
+        index.watermark = meta.get('watermark')
+        index.vocabulary = {term: term_id for term_id, term in enumerate(meta['vocabulary'])}
+        index._doc_of = {complaint_id: doc for doc, complaint_id in enumerate(index.ids)}
+        index._postings = [
+            [doc_ids[pointers[i]:pointers[i + 1]], weights[pointers[i]:pointers[i + 1]], [], []]
+            for i in range(len(pointers) - 1)
+        ]
+        return index
+
+def main():
+    """Build or update the on-disk index from the bucket so app workers don't rebuild it at startup."""
+    from google.cloud import storage
+
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument('--path', default=os.getenv('SIMILARITY_INDEX_PATH', 'data/similarity_index'))
+    parser.add_argument('--bucket', default=os.getenv('BUCKET_NAME', 'dataingestion_master'))
+    args = parser.parse_args()
+
+    storage_client = storage.Client.from_service_account_json('optical-net-452113-n9-064952459436.json')
+    bucket = storage_client.bucket(args.bucket)
+    index = SimilarityIndex.load(args.path)
+
+    def load_text(folder_name):
+        record = complaint_store.load_complaint_record(bucket, folder_name, ('metadata', 'text'))
+        if not record['text']:
+            return None
+        return record['text'], (record['metadata'] or {}).get('user')
+
+    added = index.sync(bucket, load_text)
+    index.save(args.path)
+    print(f"Indexed {added} new complaints, {len(index)} total")
+
+if __name__ == '__main__':
+    main()
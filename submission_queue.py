@@ -0,0 +1,264 @@
+import json
+import os
+import queue
+import shutil
+import threading
+import time
+import complaint_store
+
+ENTRY_FILE = 'entry.json'
+PHOTO_FILE = 'photo.jpg'
+TMP_PREFIX = '.tmp-'
+# Each process uploads only the entries it has claimed by renaming them
+# into its own INFLIGHT_PREFIX<pid> directory; entries that used up their
+# attempts are moved to FAILED_DIR for someone to look at
+INFLIGHT_PREFIX = 'inflight-'
+FAILED_DIR = 'failed'
+MAX_ATTEMPTS = 20
+# Entries uploaded this long after they were queued are flagged for the
+# ETL, whose listing window (60 minutes back from its newest folder) they
+# may already have left
+LATE_UPLOAD_SECONDS = 15 * 60
+
+def _process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+def _fsync_directory(path):
+    """Persist a directory's entries (renames) where the platform allows it."""
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+class SubmissionQueue:
+    """Durable local write-ahead queue of complaint submissions awaiting upload.
+
+    ``submit`` writes the complaint record (and photo) to a directory under
+    ``directory`` and returns as soon as it is on disk; a pool of ``workers``
+    background threads uploads each entry to the bucket, retrying failures
+    with exponential backoff, then calls ``on_uploaded(entry)`` and deletes
+    the local copy. An entry that fails ``max_attempts`` times is moved to
+    the ``failed`` directory instead.
+
+    Several processes (e.g. the workers of one host) can share
+    ``directory``: each uploads only the entries it has claimed with an
+    atomic rename into its own in-flight directory. ``start`` claims the
+    entries left behind by processes that are no longer running. Uploads
+    overwrite, so replaying an entry after a crash is safe.
+    """
+
+    def __init__(self, bucket, directory, workers=4, on_uploaded=None, retry_delay=1.0, max_retry_delay=300.0,
+                 max_attempts=MAX_ATTEMPTS):
+        self.bucket = bucket
+        self.directory = directory
+        self.workers = workers
+        self.on_uploaded = on_uploaded
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self.max_attempts = max_attempts
+        self.inflight_directory = os.path.join(directory, f"{INFLIGHT_PREFIX}{os.getpid()}")
+        self.failed_directory = os.path.join(directory, FAILED_DIR)
+        self._queue = queue.Queue()
+        # folder name -> entry for everything written but not yet uploaded
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        self._threads = []
+
+    def max_delay(self):
+        """Longest time an entry can wait between submission and its last upload attempt."""
+        return sum(min(self.retry_delay * (2 ** attempt), self.max_retry_delay)
+                   for attempt in range(self.max_attempts - 1))
+
+    def _release_orphans(self):
+        """Hand back the entries claimed by processes that are no longer running."""
+        for name in os.listdir(self.directory):
+            if not name.startswith(INFLIGHT_PREFIX):
+                continue
+            inflight = os.path.join(self.directory, name)
+            pid = name[len(INFLIGHT_PREFIX):]
+            # Our own pid can only be left over from an earlier process that had it
+            if pid.isdigit() and int(pid) != os.getpid() and _process_alive(int(pid)):
+                continue
+            for entry_name in os.listdir(inflight):
+                path = os.path.join(inflight, entry_name)
+                if entry_name.startswith(TMP_PREFIX):
+                    # Interrupted before the submission was acknowledged
+                    shutil.rmtree(path, ignore_errors=True)
+                    continue
+                try:
+                    os.rename(path, self._path(entry_name))
+                except OSError as e:
+                    print(f"Could not recover queued submission {entry_name}: {str(e)}")
+            try:
+                os.rmdir(inflight)
+            except OSError:
+                pass
+
+    def start(self):
+        """Claim the entries waiting on disk and start the uploader threads."""
+        os.makedirs(self.directory, exist_ok=True)
+        self._release_orphans()
+        os.makedirs(self.inflight_directory, exist_ok=True)
+        for name in sorted(os.listdir(self.directory)):
+            if name.startswith((TMP_PREFIX, INFLIGHT_PREFIX)) or name == FAILED_DIR:
+                continue
+            try:
+                # Only one process can win the rename; the others skip the entry
+                os.rename(self._path(name), self._inflight_path(name))
+            except OSError:
+                continue
+            try:
+                with open(os.path.join(self._inflight_path(name), ENTRY_FILE), 'r') as f:
+                    entry = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"Skipping unreadable queued submission {name}: {str(e)}")
+                self._move_to_failed(name)
+                continue
+            self._enqueue(entry)
+        if self._pending:
+            print(f"Recovered {len(self._pending)} queued submissions")
+        while len(self._threads) < self.workers:
+            thread = threading.Thread(target=self._work, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def submit(self, folder_name, username, record, photo_stream=None, photo_content_type='image/jpeg'):
+        """Durably queue a complaint for upload; returns once it is safely on disk."""
+        tmp_path = os.path.join(self.inflight_directory, TMP_PREFIX + folder_name)
+        os.makedirs(tmp_path)
+        entry = {
+            'folder': folder_name,
+            'user': username,
+            'record': record,
+            'photo_content_type': photo_content_type if photo_stream is not None else None,
+            'queued_at': time.time()
+        }
+        if photo_stream is not None:
+            with open(os.path.join(tmp_path, PHOTO_FILE), 'wb') as f:
+                shutil.copyfileobj(photo_stream, f, complaint_store.UPLOAD_CHUNK_SIZE)
+                f.flush()
+                os.fsync(f.fileno())
+        with open(os.path.join(tmp_path, ENTRY_FILE), 'w') as f:
+            json.dump(entry, f)
+            f.flush()
+            os.fsync(f.fileno())
+        # The rename is the commit point: a crash before it leaves only a
+        # .tmp- directory, which start() discards. The entry is claimed by
+        # this process from the start.
+        os.rename(tmp_path, self._inflight_path(folder_name))
+        _fsync_directory(self.inflight_directory)
+        self._enqueue(entry)
+        return folder_name
+
+    def pending(self, username=None):
+        """Return queued entries not yet uploaded, optionally only one user's."""
+        with self._lock:
+            return [entry for entry in self._pending.values() if username is None or entry['user'] == username]
+
+    def get_record(self, folder_name):
+        """Return the complaint record of a queued submission, or None once it is uploaded.
+
+        Entries queued by other processes sharing the directory are found on disk.
+        """
+        with self._lock:
+            entry = self._pending.get(folder_name)
+        if entry:
+            return entry['record']
+        for directory in [self.directory] + [
+            os.path.join(self.directory, name) for name in os.listdir(self.directory) if name.startswith(INFLIGHT_PREFIX)
+        ]:
+            try:
+                with open(os.path.join(directory, folder_name, ENTRY_FILE), 'r') as f:
+                    return json.load(f)['record']
+            except (OSError, ValueError, KeyError):
+                continue
+        return None
+
+    def wait_idle(self, timeout=None):
+        """Block until every queued submission has been uploaded; returns False on timeout."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._idle:
+            while self._pending:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._idle.wait(remaining)
+        return True
+
+    def _path(self, folder_name):
+        return os.path.join(self.directory, folder_name)
+
+    def _inflight_path(self, folder_name):
+        return os.path.join(self.inflight_directory, folder_name)
+
+    def _move_to_failed(self, folder_name):
+        os.makedirs(self.failed_directory, exist_ok=True)
+        target = os.path.join(self.failed_directory, folder_name)
+        shutil.rmtree(target, ignore_errors=True)
+        try:
+            os.rename(self._inflight_path(folder_name), target)
+        except OSError as e:
+            print(f"Could not move queued submission {folder_name} to {self.failed_directory}: {str(e)}")
+
+    def _enqueue(self, entry, attempt=0):
+        with self._lock:
+            self._pending[entry['folder']] = entry
+        self._queue.put((entry, attempt))
+
+    def _upload(self, entry):
+        folder_name = entry['folder']
+        record = entry['record']
+        # The record goes first so the folder is never seen without its metadata;
+        # complaint.txt and photo.jpg trigger the analysis Cloud Functions
+        complaint_store.save_complaint_record(self.bucket, folder_name, record)
+        if record.get('text'):
+            self.bucket.blob(f'{folder_name}/complaint.txt').upload_from_string(record['text'])
+        if entry.get('photo_content_type'):
+            with open(os.path.join(self._inflight_path(folder_name), PHOTO_FILE), 'rb') as f:
+                complaint_store.upload_stream(self.bucket, f'{folder_name}/{PHOTO_FILE}', f,
+                                              entry['photo_content_type'])
+        if time.time() - entry.get('queued_at', time.time()) > LATE_UPLOAD_SECONDS:
+            complaint_store.record_late_arrival(self.bucket, folder_name)
+        if self.on_uploaded:
+            self.on_uploaded(entry)
+
+    def _work(self):
+        while True:
+            entry, attempt = self._queue.get()
+            try:
+                self._upload(entry)
+            except Exception as e:
+                if attempt + 1 >= self.max_attempts:
+                    print(f"Giving up on queued complaint {entry['folder']} after {attempt + 1} attempts, "
+                          f"moved to {self.failed_directory}: {str(e)}")
+                    self._move_to_failed(entry['folder'])
+                    self._done(entry)
+                    continue
+                delay = min(self.retry_delay * (2 ** attempt), self.max_retry_delay)
+                print(f"Error uploading queued complaint {entry['folder']} (attempt {attempt + 1}), "
+                      f"retrying in {delay:.1f}s: {str(e)}")
+                timer = threading.Timer(delay, self._queue.put, args=((entry, attempt + 1),))
+                timer.daemon = True
+                timer.start()
+                continue
+            shutil.rmtree(self._inflight_path(entry['folder']), ignore_errors=True)
+            self._done(entry)
+
+    def _done(self, entry):
+        with self._idle:
+            self._pending.pop(entry['folder'], None)
+            self._idle.notify_all()
@@ -0,0 +1,173 @@
+import os
+import json
+import argparse
+import datetime
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from google.cloud import storage, bigquery
+from google.api_core import exceptions
+import complaint_store
+from table import sinks
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Google Cloud clients are created on first use, so a local sink needs no
+# BigQuery credentials
+SERVICE_ACCOUNT_FILE = 'optical-net-452113-n9-064952459436.json'
+storage_client = None
+bigquery_client = None
+
+def get_storage_client():
+    global storage_client
+    if storage_client is None:
+        storage_client = storage.Client.from_service_account_json(SERVICE_ACCOUNT_FILE)
+    return storage_client
+
+def get_bigquery_client():
+    global bigquery_client
+    if bigquery_client is None:
+        bigquery_client = bigquery.Client.from_service_account_json(SERVICE_ACCOUNT_FILE)
+    return bigquery_client
+
+# Constants
+BUCKET_NAME = 'dataingestion_master'
+BIGQUERY_TABLE_ID = 'optical-net-452113-n9.Grievance.extract'
+# Same sink selection as process_complaints.py
+SINK_CONFIG = {
+    'SINK_TYPE': os.getenv('COMPLAINT_SINK', 'bigquery'),
+    'SINK_PATH': os.getenv('COMPLAINT_SINK_PATH'),
+    'TABLE_ID': BIGQUERY_TABLE_ID
+}
+# Checkpoint of the newest status change applied. The next run lists the
+# change log from LOOKBACK_MINUTES before it, so changes written slightly
+# out of order are still picked up; applying a change twice is harmless.
+# A change whose complaint has no row yet holds the checkpoint back, so it
+# is applied again once the ETL has loaded the row (possibly with the old
+# status), unless the change is older than MISSING_ROW_MAX_AGE_HOURS.
+STATE_BLOB = 'etl_state/sync_status_changes.json'
+LOOKBACK_MINUTES = 10
+MISSING_ROW_MAX_AGE_HOURS = 7 * 24
+DOWNLOAD_WORKERS = 8
+
+def change_time(blob_name):
+    """Parse the time out of status_changes/YYYYmmddTHHMMSSffffff_<complaint>.json, or None."""
+    try:
+        stamp = blob_name[len(complaint_store.STATUS_CHANGE_PREFIX):].split('_', 1)[0]
+        return datetime.datetime.strptime(stamp, '%Y%m%dT%H%M%S%f')
+    except ValueError:
+        return None
+
+def change_complaint_id(blob_name):
+    """The complaint a change log object belongs to."""
+    return blob_name[len(complaint_store.STATUS_CHANGE_PREFIX):-len('.json')].split('_', 1)[1]
+
+def next_checkpoint(names, missing, checkpoint, max_age_hours=MISSING_ROW_MAX_AGE_HOURS):
+    """The newest change such that it and every change before it reached a stored row.
+
+    Changes to complaints in ``missing`` older than ``max_age_hours`` are
+    given up on (logged) so one complaint that never loads cannot hold the
+    checkpoint back for ever.
+    """
+    oldest_kept = datetime.datetime.now() - datetime.timedelta(hours=max_age_hours)
+    newest = checkpoint
+    for name in names:
+        if change_complaint_id(name) in missing:
+            changed_at = change_time(name)
+            if changed_at is None or changed_at >= oldest_kept:
+                logging.info(f"{change_complaint_id(name)} has no row yet, holding the checkpoint before {name}")
+                break
+            logging.warning(f"Giving up on {name}: its complaint still has no row")
+        newest = name
+    return newest
+
+def load_checkpoint(bucket):
+    """Return ``(name of the last change applied or None, state object generation)``."""
+    blob = bucket.get_blob(STATE_BLOB)
+    if blob is None:
+        return None, 0
+    return json.loads(blob.download_as_string()).get('checkpoint'), blob.generation
+
+def save_checkpoint(bucket, checkpoint, generation):
+    """Advance the checkpoint, never moving it backwards if another run saved a newer one."""
+    for _ in range(5):
+        try:
+            bucket.blob(STATE_BLOB).upload_from_string(
+                json.dumps({'checkpoint': checkpoint, 'updated_at': datetime.datetime.now().isoformat()}),
+                content_type='application/json',
+                if_generation_match=generation
+            )
+            logging.info(f"Checkpoint advanced to {checkpoint}")
+            return
+        except exceptions.PreconditionFailed:
+            current, generation = load_checkpoint(bucket)
+            if current and current >= checkpoint:
+                return
+    logging.warning("Could not save the checkpoint, the next run will apply these changes again")
+
+def list_changes(bucket, checkpoint, lookback_minutes=LOOKBACK_MINUTES):
+    """Names of the change log objects written since the checkpoint (less the lookback), oldest first."""
+    start_offset = None
+    checkpoint_time = change_time(checkpoint) if checkpoint else None
+    if checkpoint_time is not None:
+        start_offset = complaint_store.status_change_offset(
+            checkpoint_time - datetime.timedelta(minutes=lookback_minutes)
+        )
+    return sorted(
+        blob.name for blob in bucket.list_blobs(prefix=complaint_store.STATUS_CHANGE_PREFIX,
+                                                start_offset=start_offset)
+        if blob.name.endswith('.json')
+    )
+
+def latest_statuses(bucket, names, workers=DOWNLOAD_WORKERS):
+    """Download the changes and keep the newest status of each complaint.
+
+    Raises if a change cannot be read, so the checkpoint is not moved past it.
+    """
+    def download(name):
+        return json.loads(bucket.blob(name).download_as_string())
+
+    statuses = {}
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        # map keeps the name order, so a later change overwrites an earlier one
+        for change in executor.map(download, names):
+            statuses[change['complaint_id']] = change['status']
+    return statuses
+
+def main(full=False, lookback_minutes=LOOKBACK_MINUTES):
+    """Apply the status changes logged since the last run to the warehouse table."""
+    bucket = get_storage_client().bucket(BUCKET_NAME)
+    checkpoint, generation = load_checkpoint(bucket)
+    names = list_changes(bucket, None if full else checkpoint, lookback_minutes)
+    if not names:
+        logging.info("No status changes to apply")
+        return 0
+
+    statuses = latest_statuses(bucket, names)
+    sink = sinks.create_sink(SINK_CONFIG, get_bigquery_client)
+    try:
+        updated, missing = sink.update_status(statuses)
+    except Exception as e:
+        logging.error(f"Error applying {len(statuses)} status changes, checkpoint not advanced: {str(e)}")
+        raise
+    finally:
+        sink.close()
+    logging.info(f"Read {len(names)} status changes for {len(statuses)} complaints, {updated} rows updated, "
+                 f"{len(missing)} not loaded yet")
+    newest = next_checkpoint(names, missing, checkpoint)
+    if newest and newest != checkpoint and (checkpoint is None or newest > checkpoint):
+        save_checkpoint(bucket, newest, generation)
+    return updated
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Apply logged complaint status changes to the warehouse table")
+    parser.add_argument('--full', action='store_true', help="Ignore the checkpoint and apply the whole change log")
+    parser.add_argument('--lookback-minutes', type=int, default=LOOKBACK_MINUTES,
+                        help="How far before the checkpoint to read the change log again")
+    parser.add_argument('--sink', choices=['bigquery', 'sqlite', 'ndjson'], default=SINK_CONFIG['SINK_TYPE'],
+                        help="Where the rows are stored (default from COMPLAINT_SINK)")
+    parser.add_argument('--sink-path', default=SINK_CONFIG['SINK_PATH'],
+                        help="File for the sqlite and ndjson sinks (default from COMPLAINT_SINK_PATH)")
+    args = parser.parse_args()
+    SINK_CONFIG.update(SINK_TYPE=args.sink, SINK_PATH=args.sink_path)
+    main(args.full, args.lookback_minutes)
@@ -0,0 +1,158 @@
+import gzip
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Files are closed and loaded once this many (uncompressed) bytes of rows are in them
+MAX_FILE_BYTES = 256 * 1024 * 1024
+
+class BigQueryLoadJobLoader:
+    """Load a gzipped newline-delimited JSON file into a table with one load job."""
+
+    def __init__(self, client, table_id):
+        self.client = client
+        self.table_id = table_id
+
+    def __call__(self, path):
+        from google.cloud import bigquery
+        job_config = bigquery.LoadJobConfig(
+            source_format=bigquery.SourceFormat.NEWLINE_DELIMITED_JSON,
+            write_disposition=bigquery.WriteDisposition.WRITE_APPEND,
+            # Rows carry legacy fields the table may not have
+            ignore_unknown_values=True
+        )
+        with open(path, 'rb') as f:
+            job = self.client.load_table_from_file(f, self.table_id, job_config=job_config)
+        job.result()
+        logging.info(f"Load job {job.job_id} loaded {job.output_rows} rows into {self.table_id}")
+
+class LocalDirectoryLoader:
+    """Stand-in loader that moves each file into ``directory`` instead of loading it."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def __call__(self, path):
+        shutil.move(path, os.path.join(self.directory, os.path.basename(path)))
+
+class SinkLoader:
+    """Loader that writes each file's rows through one of the batched sinks in sinks.py.
+
+    Lets bulk mode run offline against the SQLite and NDJSON sinks. Unlike
+    a load job this is not all or nothing: if some rows are rejected the
+    load fails, but the rows already written stay.
+    """
+
+    def __init__(self, sink):
+        self.sink = sink
+        # One file at a time, so a flush only returns this file's failures
+        self._lock = threading.Lock()
+
+    def __call__(self, path):
+        with self._lock:
+            with gzip.open(path, 'rt', encoding='utf-8') as f:
+                for index, line in enumerate(f):
+                    self.sink.add(index, json.loads(line))
+            failed = self.sink.flush()
+        if failed:
+            raise ValueError(f"{len(failed)} rows from {path} were not stored: {next(iter(failed.values()))}")
+
+    def close(self):
+        self.sink.close()
+
+class BulkLoadSink:
+    """Stage rows in compressed newline-delimited JSON files and load each file in one go.
+
+    Has the same ``add``/``flush``/``close`` interface and callbacks as the
+    sinks in sinks.py. Rows are appended to a gzip file under
+    ``directory``; once ``max_file_bytes`` of rows are in it the file is
+    closed and passed to ``loader(path)`` on a background thread (at most
+    ``load_workers`` at a time) while the next file is written. A loader raises if the load
+    failed; every row of the file is then reported to ``on_failure`` and
+    the file is kept for inspection. Loaded files are deleted.
+    ``on_batch(rows, failed, seconds)`` is called after each file's load.
+    """
+
+    def __init__(self, loader, directory=None, max_file_bytes=MAX_FILE_BYTES, load_workers=2,
+                 on_success=None, on_failure=None, on_batch=None):
+        self.loader = loader
+        self.directory = directory or tempfile.gettempdir()
+        self.max_file_bytes = max_file_bytes
+        self.on_success = on_success
+        self.on_failure = on_failure
+        self.on_batch = on_batch
+        os.makedirs(self.directory, exist_ok=True)
+        self._executor = ThreadPoolExecutor(max_workers=load_workers, thread_name_prefix='bulk-load')
+        self._loads = []
+        self._file = None
+        self._lock = threading.Lock()
+
+    def _open(self):
+        fd, path = tempfile.mkstemp(dir=self.directory, prefix='complaints-', suffix='.json.gz')
+        self._file = {'path': path, 'stream': gzip.open(os.fdopen(fd, 'wb'), 'wt', encoding='utf-8'),
+                      'row_ids': [], 'bytes': 0}
+
+    def add(self, row_id, row):
+        """Append one row to the current file; hands the file to the loader once it is full."""
+        line = json.dumps(row) + '\n'
+        with self._lock:
+            if self._file is None:
+                self._open()
+            self._file['stream'].write(line)
+            self._file['row_ids'].append(row_id)
+            self._file['bytes'] += len(line)
+            if self._file['bytes'] >= self.max_file_bytes:
+                self._submit()
+
+    def _submit(self):
+        staged = self._file
+        self._file = None
+        staged['stream'].close()
+        self._loads.append(self._executor.submit(self._load, staged['path'], staged['row_ids']))
+
+    def _load(self, path, row_ids):
+        started = time.perf_counter()
+        try:
+            self.loader(path)
+        except Exception as e:
+            logging.error(f"Error loading {len(row_ids)} rows from {path}, file kept: {str(e)}")
+            if self.on_batch:
+                self.on_batch(len(row_ids), len(row_ids), time.perf_counter() - started)
+            errors = [{'message': str(e)}]
+            if self.on_failure:
+                for row_id in row_ids:
+                    self.on_failure(row_id, errors)
+            return {row_id: errors for row_id in row_ids}
+        if self.on_batch:
+            self.on_batch(len(row_ids), 0, time.perf_counter() - started)
+        if os.path.exists(path):
+            os.remove(path)
+        if self.on_success:
+            for row_id in row_ids:
+                self.on_success(row_id)
+        return {}
+
+    def flush(self):
+        """Load the current file and wait for every load; returns {row_id: errors} for the rows that failed."""
+        with self._lock:
+            if self._file is not None:
+                self._submit()
+            loads = self._loads
+            self._loads = []
+        failed = {}
+        for load in loads:
+            failed.update(load.result())
+        return failed
+
+    def close(self):
+        failed = self.flush()
+        self._executor.shutdown()
+        if hasattr(self.loader, 'close'):
+            self.loader.close()
+        return failed
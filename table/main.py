@@ -1,8 +1,39 @@
 import base64
 import datetime
 import json
+import os
 from google.cloud import storage, bigquery
+from google.api_core import exceptions
 import logging
+import sinks
+
+# Consolidated complaint record written by the web app; older folders keep
+# one blob per field and are read through LEGACY_FILES instead
+BUNDLE_FILE = 'complaint.json'
+LEGACY_FILES = {
+    'metadata': 'metadata.json',
+    'meta': 'meta.json',
+    'text': 'complaint.txt',
+    'location': 'location.json'
+}
+
+TABLE_ID = "optical-net-452113-n9.Grievance.extract"
+
+# BigQuery unless COMPLAINT_SINK selects a local sink (see sinks.create_sink)
+SINK_CONFIG = {
+    'SINK_TYPE': os.getenv('COMPLAINT_SINK', 'bigquery'),
+    'SINK_PATH': os.getenv('COMPLAINT_SINK_PATH'),
+    'TABLE_ID': TABLE_ID
+}
+
+# Kept across warm invocations so the table schema is read once per instance
+_sink = None
+
+def get_sink():
+    global _sink
+    if _sink is None:
+        _sink = sinks.create_sink(SINK_CONFIG, bigquery.Client)
+    return _sink
 
 def download_blob(bucket_name, source_blob_name):
     client = storage.Client()
@@ -16,6 +47,25 @@ def blob_exists(bucket_name, source_blob_name):
     blob = bucket.blob(source_blob_name)
     return blob.exists()
 
+def load_complaint_record(bucket_name, folder_name):
+    """Load a complaint's record with one GET, falling back to the legacy blobs."""
+    client = storage.Client()
+    bucket = client.bucket(bucket_name)
+    try:
+        return json.loads(bucket.blob(f"{folder_name}/{BUNDLE_FILE}").download_as_text())
+    except exceptions.NotFound:
+        pass
+    
+    record = {}
+    for field, file_name in LEGACY_FILES.items():
+        try:
+            content = bucket.blob(f"{folder_name}/{file_name}").download_as_text()
+        except exceptions.NotFound:
+            record[field] = None
+            continue
+        record[field] = content if field == 'text' else json.loads(content)
+    return record
+
 def get_public_url(bucket_name, file_name):
     return f"https://storage.googleapis.com/{bucket_name}/{file_name}"
 
@@ -43,39 +93,16 @@ def determine_priority(urgency_keywords):
     
     return "Medium"
 
-def get_table_schema(table_id):
-    """Get the schema of an existing BigQuery table."""
-    try:
-        client = bigquery.Client()
-        table = client.get_table(table_id)
-        return [field.name for field in table.schema]
-    except Exception as e:
-        logging.error(f"Error getting table schema: {str(e)}")
-        # Return a minimal set of fields that should exist
-        return ["complaint_id", "user_id", "description", "status"]
+def insert_into_bigquery(folder_name, row):
+    """Insert one complaint's row straight away, raising if BigQuery rejects it.
 
-def insert_into_bigquery(row, table_id):
-    try:
-        # Get the existing table schema
-        schema_fields = get_table_schema(table_id)
-        
-        # Filter the row to only include fields that exist in the schema
-        filtered_row = {k: v for k, v in row.items() if k in schema_fields}
-        
-        # Log what fields were removed
-        removed_fields = set(row.keys()) - set(filtered_row.keys())
-        if removed_fields:
-            logging.warning(f"Removed fields not in schema: {removed_fields}")
-        
-        client = bigquery.Client()
-        errors = client.insert_rows_json(table_id, [filtered_row])
-        if errors:
-            logging.error(f"BigQuery insert errors: {errors}")
-            raise RuntimeError(f"BigQuery insert errors: {errors}")
-        logging.info(f"Successfully inserted data into BigQuery table {table_id}")
-    except Exception as e:
-        logging.error(f"Error inserting into BigQuery: {str(e)}")
-        raise
+    The row goes in a batch of its own rather than through the sink's
+    buffer, so concurrent invocations never send (or fail) each other's rows.
+    """
+    failed = get_sink().insert([(folder_name, row)])
+    if folder_name in failed:
+        raise RuntimeError(f"BigQuery insert errors: {failed[folder_name]}")
+    logging.info(f"Successfully inserted data into BigQuery table {TABLE_ID}")
 
 def process_complaint1(event, context):
     """
@@ -97,34 +124,30 @@ def process_complaint1(event, context):
         folder_name = data['file'].split("/")[0]
         
         # Define file paths
-        metadata_path = f"{folder_name}/metadata.json"
-        location_path = f"{folder_name}/location.json"
-        meta_path = f"{folder_name}/meta.json"
-        complaint_text_path = f"{folder_name}/complaint.txt"
         extract_path = f"{folder_name}/complaint_extract.json"
         photo_path = f"{folder_name}/photo.jpg"
         label_path = f"{folder_name}/label.json"
         
-        # Check if required files exist
-        if not blob_exists(bucket_name, metadata_path):
-            raise FileNotFoundError(f"Required file not found: {metadata_path}")
+        # Load the complaint record (complaint.json, or the legacy blobs)
+        record = load_complaint_record(bucket_name, folder_name)
+        metadata = record.get('metadata')
+        location = record.get('location')
+        complaint_text = record.get('text')
         
-        if not blob_exists(bucket_name, location_path):
-            raise FileNotFoundError(f"Required file not found: {location_path}")
+        # Check if required data exists
+        if metadata is None:
+            raise FileNotFoundError(f"Required data not found: {folder_name} metadata")
         
-        if not blob_exists(bucket_name, complaint_text_path):
-            raise FileNotFoundError(f"Required file not found: {complaint_text_path}")
+        if location is None:
+            raise FileNotFoundError(f"Required data not found: {folder_name} location")
         
-        # Load data
-        metadata = json.loads(download_blob(bucket_name, metadata_path))
-        location = json.loads(download_blob(bucket_name, location_path))
-        complaint_text = download_blob(bucket_name, complaint_text_path)
+        if complaint_text is None:
+            raise FileNotFoundError(f"Required data not found: {folder_name} complaint text")
         
         # Get timestamp from metadata if meta.json doesn't exist
         timestamp = datetime.datetime.now().isoformat()
-        if blob_exists(bucket_name, meta_path):
-            meta = json.loads(download_blob(bucket_name, meta_path))
-            timestamp = meta.get("timestamp", timestamp)
+        if record.get('meta'):
+            timestamp = record['meta'].get("timestamp", timestamp)
         else:
             # Use timestamp from metadata.json if available
             timestamp = metadata.get("timestamp", timestamp)
@@ -181,7 +204,7 @@ def process_complaint1(event, context):
                     })
         
         # Build row for BigQuery - include all possible fields
-        # The insert_into_bigquery function will filter out fields that don't exist in the schema
+        # The BigQuery sink will filter out fields that don't exist in the schema
         row = {
             "complaint_id": folder_name,
             "user_id": metadata.get("user", metadata.get("username", "anonymous")),
@@ -205,8 +228,7 @@ def process_complaint1(event, context):
         }
         
         # Insert into BigQuery
-        table_id = "optical-net-452113-n9.Grievance.extract"
-        insert_into_bigquery(row, table_id)
+        insert_into_bigquery(folder_name, row)
         
         logging.info(f"Successfully processed complaint {folder_name}")
         
@@ -0,0 +1,409 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+# Columns of the complaints table (name, type, mode, description), as
+# created by recreate_bigquery_table.py; the local sinks store the same ones
+TABLE_SCHEMA = [
+    ("complaint_id", "STRING", "REQUIRED", "Unique identifier for the complaint"),
+    ("user_id", "STRING", "NULLABLE", "User who submitted the complaint"),
+    ("description", "STRING", "NULLABLE", "Text description of the complaint"),
+    ("image", "STRING", "NULLABLE", "URL to the complaint image"),
+    ("location", "STRING", "NULLABLE", "Location data as JSON string"),
+    ("status", "STRING", "NULLABLE", "Current status of the complaint"),
+    ("submitted_at", "TIMESTAMP", "NULLABLE", "Timestamp when the complaint was submitted"),
+    ("extract", "STRING", "NULLABLE", "Issue type extracted from text analysis"),
+    ("department", "STRING", "NULLABLE", "Department assigned to handle the complaint"),
+    ("label", "STRING", "NULLABLE", "Prediction label from image analysis")
+]
+
+# Fields assumed to exist if the table schema cannot be read
+FALLBACK_SCHEMA = ["complaint_id", "user_id", "description", "status"]
+
+SQLITE_TYPES = {'STRING': 'TEXT', 'TIMESTAMP': 'TEXT', 'FLOAT': 'REAL', 'INTEGER': 'INTEGER'}
+DEFAULT_PATHS = {'sqlite': 'data/extract.sqlite', 'ndjson': 'data/extract.ndjson'}
+# Status changes are staged in this table (next to the main one) before being merged in
+STATUS_STAGING_SUFFIX = '_status_changes'
+
+class BatchingSink:
+    """Buffer complaint rows and write them in batches.
+
+    Rows are added with the complaint ID they belong to and written one
+    batch at a time, when ``max_rows`` rows are waiting or the oldest has
+    waited ``max_age`` seconds (a timer thread sends it if no more rows
+    arrive), and on ``flush``/``close``. Fields the
+    destination's schema does not have are dropped; the schema is read
+    once and reused. ``on_success(row_id)`` is called for every row that
+    was stored and ``on_failure(row_id, errors)`` for every row that was
+    not; ``on_batch(rows, failed, seconds)`` after each batch is written.
+    Subclasses implement ``_read_schema`` and ``_insert``, and
+    ``update_status`` to change the status of rows already stored.
+
+    Safe to share between threads.
+    """
+
+    def __init__(self, max_rows=500, max_age=10.0, on_success=None, on_failure=None, on_batch=None):
+        self.max_rows = max_rows
+        self.max_age = max_age
+        self.on_success = on_success
+        self.on_failure = on_failure
+        self.on_batch = on_batch
+        self._schema = None
+        self._rows = []
+        self._oldest = None
+        self._timer = None
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+
+    def _read_schema(self):
+        raise NotImplementedError
+
+    def schema(self, refresh=False):
+        """Return the destination's field names, read once per sink."""
+        if self._schema is None or refresh:
+            try:
+                self._schema = self._read_schema()
+            except Exception as e:
+                logging.error(f"Error getting table schema: {str(e)}")
+                return FALLBACK_SCHEMA
+        return self._schema
+
+    def add(self, row_id, row):
+        """Queue one row; sends the batch if it is full or old enough."""
+        with self._lock:
+            self._rows.append((row_id, row))
+            if self._oldest is None:
+                self._oldest = time.monotonic()
+            due = len(self._rows) >= self.max_rows or time.monotonic() - self._oldest >= self.max_age
+            if not due and self._timer is None:
+                self._start_timer(self.max_age)
+        if due:
+            self.flush()
+
+    def _start_timer(self, delay):
+        # Called with self._lock held
+        self._timer = threading.Timer(delay, self._flush_if_due)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _flush_if_due(self):
+        """Timer callback: send the batch if its oldest row has waited ``max_age``, else wait for it."""
+        with self._lock:
+            self._timer = None
+            if self._oldest is None:
+                return
+            remaining = self.max_age - (time.monotonic() - self._oldest)
+            if remaining > 0:
+                self._start_timer(remaining)
+                return
+        self.flush()
+
+    def flush(self):
+        """Send every queued row; returns {row_id: errors} for the rows that failed."""
+        with self._flush_lock:
+            with self._lock:
+                rows = self._rows
+                self._rows = []
+                self._oldest = None
+            if not rows:
+                return {}
+            started = time.perf_counter()
+            failed = self._insert(rows)
+            if self.on_batch:
+                self.on_batch(len(rows), len(failed), time.perf_counter() - started)
+        for row_id, _ in rows:
+            if row_id in failed:
+                if self.on_failure:
+                    self.on_failure(row_id, failed[row_id])
+            elif self.on_success:
+                self.on_success(row_id)
+        return failed
+
+    def insert(self, rows):
+        """Write ``[(row_id, row)]`` now, as a batch of their own.
+
+        Rows queued with ``add`` are left alone and no timer is started, so
+        callers that need their own rows stored before returning can share
+        one sink (and its schema). Returns {row_id: errors} like ``flush``.
+        """
+        rows = list(rows)
+        if not rows:
+            return {}
+        with self._flush_lock:
+            return self._insert(rows)
+
+    def close(self):
+        with self._lock:
+            timer = self._timer
+            self._timer = None
+        if timer is not None:
+            timer.cancel()
+            if timer is not threading.current_thread():
+                # Let a flush the timer already started finish its callbacks
+                timer.join()
+        return self.flush()
+
+    def _filter(self, row, schema):
+        filtered_row = {k: v for k, v in row.items() if k in schema}
+        removed_fields = set(row) - set(filtered_row)
+        if removed_fields:
+            logging.debug(f"Removed fields not in schema: {removed_fields}")
+        return filtered_row
+
+    def _insert(self, rows):
+        """Write ``rows`` as one batch; returns {row_id: errors} for rows not stored."""
+        raise NotImplementedError
+
+    def update_status(self, changes):
+        """Set the status of stored rows from {complaint_id: status}.
+
+        Returns ``(rows changed, set of complaint IDs with no row)``; a
+        complaint can change status before its row is loaded. Rows already
+        carrying the new status are left alone, so applying the same
+        changes twice is harmless. Raises if the update failed.
+        """
+        raise NotImplementedError
+
+class BigQuerySink(BatchingSink):
+    """Stream batches to BigQuery with one ``insert_rows_json`` call each.
+
+    The schema is read again when an insert reports an error on a named
+    field, and per-row insert errors are mapped back to complaint IDs.
+    """
+
+    def __init__(self, client, table_id, max_rows=500, max_age=10.0, on_success=None, on_failure=None,
+                 on_batch=None):
+        super().__init__(max_rows, max_age, on_success, on_failure, on_batch)
+        self.client = client
+        self.table_id = table_id
+
+    def _read_schema(self):
+        table = self.client.get_table(self.table_id)
+        return [field.name for field in table.schema]
+
+    def _insert(self, rows, retry_schema=True):
+        schema = self.schema()
+        try:
+            errors = self.client.insert_rows_json(self.table_id, [self._filter(row, schema) for _, row in rows])
+        except Exception as e:
+            logging.error(f"Error inserting {len(rows)} rows into BigQuery: {str(e)}")
+            return {row_id: [{'message': str(e)}] for row_id, _ in rows}
+        if not errors:
+            logging.info(f"Inserted {len(rows)} rows into BigQuery table {self.table_id}")
+            return {}
+
+        # Rows only 'stopped' because another row in the request was bad are
+        # sent again without the bad ones
+        bad = {}
+        stopped = []
+        for error in errors:
+            row_id, row = rows[error['index']]
+            reasons = {detail.get('reason') for detail in error.get('errors', [])}
+            if reasons <= {'stopped'}:
+                stopped.append((row_id, row))
+            else:
+                bad[row_id] = error.get('errors', [])
+        logging.error(f"BigQuery rejected {len(bad)} of {len(rows)} rows: {bad}")
+
+        # An error on a named field means the cached schema may be out of date
+        schema_error = any(
+            detail.get('reason') == 'invalid' and detail.get('location')
+            for details in bad.values() for detail in details
+        )
+        if schema_error and retry_schema:
+            # Re-read the schema and retry the rejected rows along with the stopped ones
+            self.schema(refresh=True)
+            return self._insert(stopped + [(row_id, row) for row_id, row in rows if row_id in bad], retry_schema=False)
+        if stopped:
+            bad.update(self._insert(stopped, retry_schema))
+        return bad
+
+    def update_status(self, changes):
+        # Load the changes into a staging table and apply them with one MERGE,
+        # so the cost follows the number of changes rather than one DML
+        # statement per complaint. Rows still in the streaming buffer cannot
+        # be updated yet; the MERGE then fails and the caller retries later.
+        from google.cloud import bigquery
+        staging_id = f"{self.table_id}{STATUS_STAGING_SUFFIX}"
+        job_config = bigquery.LoadJobConfig(
+            schema=[bigquery.SchemaField('complaint_id', 'STRING', mode='REQUIRED'),
+                    bigquery.SchemaField('status', 'STRING')],
+            write_disposition=bigquery.WriteDisposition.WRITE_TRUNCATE
+        )
+        rows = [{'complaint_id': complaint_id, 'status': status} for complaint_id, status in changes.items()]
+        self.client.load_table_from_json(rows, staging_id, job_config=job_config).result()
+        job = self.client.query(
+            f"MERGE `{self.table_id}` T USING `{staging_id}` S ON T.complaint_id = S.complaint_id "
+            f"WHEN MATCHED AND T.status IS DISTINCT FROM S.status THEN UPDATE SET status = S.status"
+        )
+        job.result()
+        missing = {
+            row['complaint_id'] for row in self.client.query(
+                f"SELECT S.complaint_id FROM `{staging_id}` S WHERE NOT EXISTS "
+                f"(SELECT 1 FROM `{self.table_id}` T WHERE T.complaint_id = S.complaint_id)"
+            ).result()
+        }
+        logging.info(f"Applied {len(rows)} status changes to {self.table_id}, {job.num_dml_affected_rows} rows updated, "
+                     f"{len(missing)} complaints not loaded yet")
+        return job.num_dml_affected_rows or 0, missing
+
+class SQLiteSink(BatchingSink):
+    """Write batches to a table in a local SQLite database, one transaction per batch.
+
+    The table is created with TABLE_SCHEMA's columns if it does not exist;
+    an existing table's own columns decide which fields are kept.
+    """
+
+    def __init__(self, path, table_name, max_rows=500, max_age=10.0, on_success=None, on_failure=None,
+                 on_batch=None):
+        super().__init__(max_rows, max_age, on_success, on_failure, on_batch)
+        self.path = path
+        self.table_name = table_name
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Batches are written under the flush lock, one thread at a time
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        columns = ', '.join(
+            f'"{name}" {SQLITE_TYPES.get(field_type, "TEXT")}{" NOT NULL" if mode == "REQUIRED" else ""}'
+            for name, field_type, mode, _ in TABLE_SCHEMA
+        )
+        with self._connection:
+            self._connection.execute(f'CREATE TABLE IF NOT EXISTS "{table_name}" ({columns})')
+            # Status updates look rows up by complaint ID
+            self._connection.execute(
+                f'CREATE INDEX IF NOT EXISTS "{table_name}_complaint_id" ON "{table_name}" (complaint_id)'
+            )
+
+    def _read_schema(self):
+        return [column[1] for column in self._connection.execute(f'PRAGMA table_info("{self.table_name}")')]
+
+    def _write(self, rows):
+        # One executemany per set of columns (normally the whole batch)
+        by_columns = {}
+        for row in rows:
+            by_columns.setdefault(tuple(row), []).append(tuple(row.values()))
+        for columns, values in by_columns.items():
+            names = ', '.join(f'"{name}"' for name in columns)
+            placeholders = ', '.join('?' for _ in columns)
+            self._connection.executemany(f'INSERT INTO "{self.table_name}" ({names}) VALUES ({placeholders})', values)
+
+    def _insert(self, rows):
+        schema = self.schema()
+        filtered = [(row_id, self._filter(row, schema)) for row_id, row in rows]
+        try:
+            with self._connection:
+                self._write([row for _, row in filtered])
+            logging.info(f"Inserted {len(rows)} rows into SQLite table {self.table_name}")
+            return {}
+        except sqlite3.Error as e:
+            logging.error(f"Error inserting {len(rows)} rows into SQLite, retrying row by row: {str(e)}")
+
+        # The batch was rolled back: find the bad rows by inserting each on its own
+        failed = {}
+        for row_id, row in filtered:
+            try:
+                with self._connection:
+                    self._write([row])
+            except sqlite3.Error as e:
+                failed[row_id] = [{'message': str(e)}]
+        return failed
+
+    def update_status(self, changes):
+        with self._flush_lock:
+            before = self._connection.total_changes
+            with self._connection:
+                self._connection.executemany(
+                    f'UPDATE "{self.table_name}" SET status = ? WHERE complaint_id = ? AND status IS NOT ?',
+                    [(status, complaint_id, status) for complaint_id, status in changes.items()]
+                )
+            updated = self._connection.total_changes - before
+            missing = set(changes)
+            complaint_ids = list(changes)
+            # Within SQLite's limit on query parameters
+            for start in range(0, len(complaint_ids), 500):
+                chunk = complaint_ids[start:start + 500]
+                missing.difference_update(row[0] for row in self._connection.execute(
+                    f'SELECT complaint_id FROM "{self.table_name}" WHERE complaint_id IN ({", ".join("?" for _ in chunk)})',
+                    chunk
+                ))
+        logging.info(f"Applied {len(changes)} status changes to SQLite table {self.table_name}, {updated} rows updated, "
+                     f"{len(missing)} complaints not loaded yet")
+        return updated, missing
+
+    def close(self):
+        failed = super().close()
+        self._connection.close()
+        return failed
+
+class NdjsonSink(BatchingSink):
+    """Append batches to a local newline-delimited JSON file with TABLE_SCHEMA's fields."""
+
+    def __init__(self, path, max_rows=500, max_age=10.0, on_success=None, on_failure=None,
+                 on_batch=None):
+        super().__init__(max_rows, max_age, on_success, on_failure, on_batch)
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def _read_schema(self):
+        return [name for name, _, _, _ in TABLE_SCHEMA]
+
+    def _insert(self, rows):
+        schema = self.schema()
+        try:
+            lines = ''.join(json.dumps(self._filter(row, schema)) + '\n' for _, row in rows)
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(lines)
+        except (OSError, TypeError, ValueError) as e:
+            logging.error(f"Error writing {len(rows)} rows to {self.path}: {str(e)}")
+            return {row_id: [{'message': str(e)}] for row_id, _ in rows}
+        logging.info(f"Wrote {len(rows)} rows to {self.path}")
+        return {}
+
+    def update_status(self, changes):
+        # A flat file has no way to update in place: it is rewritten (through
+        # a temporary file, so a failure leaves the old one intact), which
+        # reads every row however few changed
+        if not os.path.exists(self.path):
+            return 0, set(changes)
+        updated = 0
+        missing = set(changes)
+        with self._flush_lock:
+            temp_path = f"{self.path}.tmp"
+            with open(self.path, encoding='utf-8') as source, open(temp_path, 'w', encoding='utf-8') as target:
+                for line in source:
+                    row = json.loads(line)
+                    missing.discard(row.get('complaint_id'))
+                    status = changes.get(row.get('complaint_id'), row.get('status'))
+                    if status != row.get('status'):
+                        row['status'] = status
+                        line = json.dumps(row) + '\n'
+                        updated += 1
+                    target.write(line)
+            os.replace(temp_path, self.path)
+        logging.info(f"Applied {len(changes)} status changes to {self.path}, {updated} rows updated, "
+                     f"{len(missing)} complaints not loaded yet")
+        return updated, missing
+
+def create_sink(config, get_bigquery_client, **options):
+    """Build the sink selected by config['SINK_TYPE'] ('bigquery', 'sqlite' or 'ndjson').
+
+    ``get_bigquery_client`` is only called for the BigQuery sink, so the
+    local sinks run without cloud credentials. ``options`` are passed on
+    (max_rows, max_age, on_success, on_failure, on_batch).
+    """
+    sink_type = config.get('SINK_TYPE') or 'bigquery'
+    table_id = config['TABLE_ID']
+    path = config.get('SINK_PATH') or DEFAULT_PATHS.get(sink_type)
+    if sink_type == 'bigquery':
+        return BigQuerySink(get_bigquery_client(), table_id, **options)
+    if sink_type == 'sqlite':
+        return SQLiteSink(path, table_id.split('.')[-1], **options)
+    if sink_type == 'ndjson':
+        return NdjsonSink(path, **options)
+    raise ValueError(f"Unsupported sink type: {sink_type}")
@@ -1,60 +1,188 @@
 import os
 from google.cloud import storage
+from google.api_core import exceptions
 import json
-import hashlib
+import threading
+import time
+from collections import OrderedDict
 from datetime import datetime
+from urllib.parse import quote
+from password_hashing import PasswordHasher
+
+# Accounts are stored one object per user, so a login or registration only
+# touches that user's record. users.json is the old monolithic file, read
+# only until its accounts have been migrated (see migrate_legacy_users).
+USERS_FILE = 'users/users.json'
+ACCOUNT_PREFIX = 'users/accounts/'
+MIGRATION_MARKER = 'users/accounts_migrated.json'
+
+def account_path(username):
+    """Return the blob name of a user's account record."""
+    return f"{ACCOUNT_PREFIX}{quote(username, safe='')}.json"
 
 class UserAuth:
-    def __init__(self, storage_client, bucket_name):
+    """Account store with an in-process cache of account records.
+
+    A cached record is trusted for ``cache_max_staleness`` seconds; after
+    that it is revalidated with a metadata-only request and downloaded
+    again only if its generation changed. At most ``cache_size`` records
+    are kept (least recently used are dropped first).
+
+    Passwords are hashed with ``password_hasher`` (a salted slow KDF run on
+    its own pool); legacy unsalted SHA-256 hashes are replaced on the
+    user's next successful login.
+    """
+
+    def __init__(self, storage_client, bucket_name, cache_max_staleness=30, cache_size=10000, password_hasher=None):
         self.storage_client = storage_client
         self.bucket = storage_client.bucket(bucket_name)
-        self.users_blob = self.bucket.blob('users/users.json')
-        
-        # Create users.json if it doesn't exist
-        if not self.users_blob.exists():
-            print("Creating new users.json file")
-            self._save_users({})
+        self.users_blob = self.bucket.blob(USERS_FILE)
+        self._legacy_users = None
+        self._legacy_lock = threading.Lock()
+        self.cache_max_staleness = cache_max_staleness
+        self.cache_size = cache_size
+        # username -> (record, generation, monotonic time it was last validated)
+        self._cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self.password_hasher = password_hasher or PasswordHasher()
 
-    def _hash_password(self, password):
-        return hashlib.sha256(password.encode()).hexdigest()
+        # Accounts that only exist in users.json are looked up there until migrated
+        self.legacy_pending = self.users_blob.exists() and not self.bucket.blob(MIGRATION_MARKER).exists()
+        if self.legacy_pending:
+            print("users.json has not been migrated to per-user accounts yet")
 
-    def _get_users(self):
-        try:
-            if self.users_blob.exists():
-                content = self.users_blob.download_as_string()
-                return json.loads(content)
+    def _get_legacy_users(self):
+        """Load users.json once per process while its accounts are being migrated."""
+        with self._legacy_lock:
+            if self._legacy_users is None:
+                try:
+                    self._legacy_users = json.loads(self.users_blob.download_as_string())
+                except exceptions.NotFound:
+                    self._legacy_users = {}
+            return self._legacy_users
+
+    def _get_user(self, username):
+        """Return a user's account record, or None if there is no such user."""
+        record = self._get_account(username)
+        if record is None and self.legacy_pending:
+            return self._get_legacy_users().get(username)
+        return record
+
+    def _get_account(self, username):
+        """Return a per-user account record, from the cache when it is still current."""
+        now = time.monotonic()
+        with self._cache_lock:
+            cached = self._cache.get(username)
+            if cached is not None:
+                self._cache.move_to_end(username)
+                if now - cached[2] < self.cache_max_staleness:
+                    return cached[0]
+
+        if cached is None:
+            # Cold miss: one download, which also reports the object's generation
+            blob = self.bucket.blob(account_path(username))
+            try:
+                record = json.loads(blob.download_as_string())
+            except exceptions.NotFound:
+                return None
+        else:
+            # Metadata-only check; the record is only downloaded again if it changed
+            blob = self.bucket.get_blob(account_path(username))
+            if blob is None:
+                self.invalidate(username)
+                return None
+            if cached[1] == blob.generation:
+                record = cached[0]
             else:
-                print("users.json does not exist, creating it")
-                self._save_users({})
-                return {}
-        except Exception as e:
-            print(f"Error getting users: {str(e)}")
-            return {}
+                record = json.loads(blob.download_as_string())
+
+        with self._cache_lock:
+            self._cache[username] = (record, blob.generation, now)
+            self._cache.move_to_end(username)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return record
+
+    def invalidate(self, username):
+        """Drop a user's cached account record."""
+        with self._cache_lock:
+            self._cache.pop(username, None)
 
-    def _save_users(self, users):
+    def _create_user(self, username, record):
+        """Write a new account record; returns False if the username is already taken.
+
+        The write only succeeds if no object exists yet, so two concurrent
+        registrations of the same name cannot overwrite each other.
+        """
         try:
-            self.users_blob.upload_from_string(
-                json.dumps(users),
-                content_type='application/json'
+            self.bucket.blob(account_path(username)).upload_from_string(
+                json.dumps(record),
+                content_type='application/json',
+                if_generation_match=0
             )
-            print(f"Saved users.json with {len(users)} users")
-        except Exception as e:
-            print(f"Error saving users: {str(e)}")
+            return True
+        except exceptions.PreconditionFailed:
+            return False
+
+    def _rehash_password(self, username, password):
+        """Replace a legacy or outdated password hash after a successful login."""
+        new_hash = self.password_hasher.hash(password)
+        blob = self.bucket.get_blob(account_path(username))
+        if blob is None:
+            # Only in users.json so far: migrate the account with the new hash
+            record = dict(self._get_legacy_users()[username], password=new_hash)
+            self._create_user(username, record)
+        else:
+            record = json.loads(blob.download_as_string())
+            record['password'] = new_hash
+            try:
+                blob.upload_from_string(
+                    json.dumps(record),
+                    content_type='application/json',
+                    if_generation_match=blob.generation
+                )
+            except exceptions.PreconditionFailed:
+                # Changed concurrently; the next login will try again
+                return
+        self.invalidate(username)
+        print(f"Upgraded password hash for: {username}")
+
+    def migrate_legacy_users(self):
+        """Copy every account in users.json to its own record; safe to run while serving.
+
+        Records that already exist are left alone, so the migration can be
+        re-run or run by several processes at once. Returns the number of
+        accounts copied.
+        """
+        users = self._get_legacy_users()
+        migrated = 0
+        for username, record in users.items():
+            if self._create_user(username, record):
+                migrated += 1
+        self.bucket.blob(MIGRATION_MARKER).upload_from_string(
+            json.dumps({'migrated_at': datetime.now().isoformat(), 'users': len(users)}),
+            content_type='application/json'
+        )
+        self.legacy_pending = False
+        with self._legacy_lock:
+            self._legacy_users = None
+        print(f"Migrated {migrated} of {len(users)} users from users.json")
+        return migrated
 
     def register_user(self, username, password, email):
         try:
-            users = self._get_users()
-            
-            if username in users:
+            if self.legacy_pending and username in self._get_legacy_users():
                 return False, "Username already exists"
-            
-            users[username] = {
-                'password': self._hash_password(password),
+
+            created = self._create_user(username, {
+                'password': self.password_hasher.hash(password),
                 'email': email,
                 'created_at': datetime.now().isoformat()
-            }
-            
-            self._save_users(users)
+            })
+            self.invalidate(username)
+            if not created:
+                return False, "Username already exists"
+
             print(f"User registered: {username}")
             return True, "User registered successfully"
         except Exception as e:
@@ -64,21 +192,22 @@ class UserAuth:
     def login_user(self, username, password):
         try:
             print(f"Attempting login for user: {username}")
-            users = self._get_users()
-            
-            if not users:
-                print("No users found in the system")
-                return False, "No users found in the system. Please register first."
-            
-            if username not in users:
+            user = self._get_user(username)
+
+            if user is None:
                 print(f"User not found: {username}")
                 return False, "User not found"
-            
-            hashed_password = self._hash_password(password)
-            if users[username]['password'] != hashed_password:
+
+            matches, needs_rehash = self.password_hasher.verify(password, user['password'])
+            if not matches:
                 print("Invalid password")
                 return False, "Invalid password"
-            
+            if needs_rehash:
+                try:
+                    self._rehash_password(username, password)
+                except Exception as e:
+                    print(f"Error upgrading password hash for {username}: {str(e)}")
+
             print(f"Login successful for: {username}")
             return True, "Login successful"
         except Exception as e:
@@ -87,13 +216,13 @@ class UserAuth:
 
     def get_user_info(self, username):
         try:
-            users = self._get_users()
-            if username in users:
-                user_info = users[username].copy()
+            user = self._get_user(username)
+            if user is not None:
+                user_info = user.copy()
                 user_info.pop('password', None)  # Remove password from returned data
                 return user_info
             print(f"User info not found for: {username}")
             return None
         except Exception as e:
             print(f"Error getting user info: {str(e)}")
-            return None 
\ No newline at end of file
+            return None